@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from src.workflow import prepare_collection, generate_note, agenerate_note, output_path, write_output, print_run_summary
+from src.nodes import set_llm_budget
+from src.utils.config import get_setting
+from src.utils.routing import preload_models
+
+def load_topics(topics_file: str) -> List[str]:
+    """
+    Read topics from a text file, one per line.
+
+    Blank lines and lines starting with '#' are ignored.
+
+    Args:
+        topics_file (str): Path to the topic list.
+
+    Returns:
+        List[str]: Topics in file order, without duplicates.
+    """
+    topics = []
+    with open(topics_file, "r", encoding="utf-8") as f:
+        for line in f:
+            topic = line.strip()
+            if topic and not topic.startswith("#") and topic not in topics:
+                topics.append(topic)
+    return topics
+
+def run_batch(
+    topics: List[str],
+    note_type: str,
+    json_path: str,
+    output_format: str = "markdown",
+    output_dir: Optional[str] = None,
+    max_concurrent_topics: Optional[int] = None,
+    max_llm_requests: Optional[int] = None,
+    force: bool = False,
+    use_async: bool = False
+) -> Dict[str, Any]:
+    """
+    Generate notes for many topics against a corpus indexed once.
+
+    Topics run concurrently and share the collection and caches; a global budget limits
+    LLM requests in flight across all topics. Topics whose output file already exists
+    are skipped, so rerunning a crashed batch resumes where it stopped. A report with
+    per-topic timings and failures is written next to the outputs. With use_async, topics
+    run as tasks on one event loop through the async workflow instead of in threads.
+
+    Args:
+        topics (List[str]): Medical topics to generate notes for.
+        note_type (str): Type of note ('condition', 'complaint' or 'drug').
+        json_path (str): Path to JSON file or directory.
+        output_format (str): Output format ('markdown' or 'org').
+        output_dir (Optional[str]): Directory for outputs (default: batch_settings.output_dir).
+        max_concurrent_topics (Optional[int]): Topics in flight (default: batch_settings.max_concurrent_topics).
+        max_llm_requests (Optional[int]): Global LLM request budget (default: workflow_settings.max_llm_requests).
+        force (bool): Regenerate topics whose output already exists.
+        use_async (bool): Run topics with agenerate_note on an event loop.
+
+    Returns:
+        Dict[str, Any]: Batch report with per-topic status, timings and errors.
+    """
+    output_dir = output_dir or get_setting("batch_settings", "output_dir", "./notes")
+    max_concurrent_topics = max_concurrent_topics or get_setting("batch_settings", "max_concurrent_topics", 2)
+    if max_llm_requests:
+        set_llm_budget(max_llm_requests)
+    os.makedirs(output_dir, exist_ok=True)
+    report_path = os.path.join(output_dir, get_setting("batch_settings", "report_file", "batch_report.json"))
+
+    started = time.perf_counter()
+    results: Dict[str, Dict[str, Any]] = {}
+    pending = []
+    for topic in topics:
+        path = output_path(topic, output_format, output_dir)
+        if not force and os.path.exists(path):
+            results[topic] = {"topic": topic, "status": "skipped", "output": path, "seconds": 0.0}
+        else:
+            pending.append(topic)
+    print(f"DEBUG: Batch of {len(topics)} topics, {len(topics) - len(pending)} already complete")
+
+    if pending:
+        collection = prepare_collection(json_path)
+        if collection is None:
+            raise RuntimeError(f"No documents could be indexed from '{json_path}'")
+        preload_models()
+
+        def topic_result(topic: str, topic_started: float, error: Optional[Exception]) -> Dict[str, Any]:
+            if error is not None:
+                print(f"Error generating notes for topic '{topic}': {str(error)}")
+            result = {
+                "topic": topic,
+                "status": "failed" if error is not None else "done",
+                "output": output_path(topic, output_format, output_dir),
+                "seconds": round(time.perf_counter() - topic_started, 3),
+                "error": str(error) if error is not None else None
+            }
+            print(f"DEBUG: Topic '{topic}' {result['status']} in {result['seconds']}s")
+            return result
+
+        def run_topic(topic: str) -> Dict[str, Any]:
+            topic_started = time.perf_counter()
+            try:
+                generate_note(topic, note_type, collection, output_format, output_dir)
+                return topic_result(topic, topic_started, None)
+            except Exception as e:
+                return topic_result(topic, topic_started, e)
+
+        async def run_topics_async() -> List[Dict[str, Any]]:
+            limit = asyncio.Semaphore(max_concurrent_topics)
+
+            async def run_topic_async(topic: str) -> Dict[str, Any]:
+                async with limit:
+                    topic_started = time.perf_counter()
+                    try:
+                        await agenerate_note(topic, note_type, collection, output_format, output_dir)
+                        return topic_result(topic, topic_started, None)
+                    except Exception as e:
+                        return topic_result(topic, topic_started, e)
+
+            return await asyncio.gather(*(run_topic_async(topic) for topic in pending))
+
+        if use_async:
+            topic_results = asyncio.run(run_topics_async())
+        else:
+            with ThreadPoolExecutor(max_workers=max_concurrent_topics) as executor:
+                topic_results = list(executor.map(run_topic, pending))
+        for result in topic_results:
+            results[result["topic"]] = result
+
+    ordered = [results[topic] for topic in topics]
+    report = {
+        "note_type": note_type,
+        "output_format": output_format,
+        "total_seconds": round(time.perf_counter() - started, 3),
+        "done": sum(r["status"] == "done" for r in ordered),
+        "skipped": sum(r["status"] == "skipped" for r in ordered),
+        "failed": sum(r["status"] == "failed" for r in ordered),
+        "topics": ordered
+    }
+    write_output(report_path, json.dumps(report, indent=2))
+    print(f"Batch report written to {report_path}: {report['done']} done, {report['skipped']} skipped, {report['failed']} failed")
+    print_run_summary()
+    return report
@@ -0,0 +1,294 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from src.utils.config import override_setting, set_config_path
+from src.utils.fake_ollama import FakeOllama, VOCABULARY, patched_ollama
+from src.utils.routing import routed_models
+
+# Section headings and subheadings used to build UpToDate-shaped synthetic articles
+SYNTHETIC_SECTIONS = {
+    "INTRODUCTION": [],
+    "DEFINITIONS": ["Normal blood pressure", "Elevated blood pressure"],
+    "EPIDEMIOLOGY": ["Prevalence", "Risk factors"],
+    "CLINICAL FEATURES": ["Symptoms", "Physical examination"],
+    "DIAGNOSIS": ["Office measurement", "Ambulatory monitoring"],
+    "TREATMENT": ["Lifestyle modification", "Drug selection", "Dosing and titration"],
+    "COMPLICATIONS": ["Cardiovascular disease", "Kidney disease"],
+    "SUMMARY AND RECOMMENDATIONS": []
+}
+
+SYNTHETIC_CONDITIONS = (
+    "hypertension", "heart failure", "asthma", "pneumonia", "diabetes mellitus", "atrial fibrillation",
+    "chronic kidney disease", "migraine", "gout", "hypothyroidism", "anemia", "COPD", "cirrhosis", "sepsis"
+)
+
+def synthetic_article(index: int, target_chars: int, seed: int = 0) -> Dict[str, Any]:
+    """
+    Build one synthetic article in the UpToDate JSON export shape.
+
+    Args:
+        index (int): Article number, also used to pick its condition.
+        target_chars (int): Approximate length of the markdown body.
+        seed (int): Random seed, so corpora are reproducible.
+
+    Returns:
+        Dict[str, Any]: Article with 'metadata' and 'content.markdown'.
+    """
+    rng = random.Random(f"{seed}:{index}")
+    condition = SYNTHETIC_CONDITIONS[index % len(SYNTHETIC_CONDITIONS)]
+    title = f"Overview of {condition} in adults ({index})"
+    paragraph_chars = 400
+    per_section = max(1, target_chars // (paragraph_chars * len(SYNTHETIC_SECTIONS)))
+
+    def paragraph() -> str:
+        words = []
+        while sum(len(w) + 1 for w in words) < paragraph_chars:
+            words.append(rng.choice(VOCABULARY + (condition,)))
+        sentences = [" ".join(words[i:i + 12]).capitalize() + "." for i in range(0, len(words), 12)]
+        return " ".join(sentences)
+
+    parts = [f"## RELATED TOPICS\n\n{title}"]
+    for heading, subheadings in SYNTHETIC_SECTIONS.items():
+        parts.append(f"{heading} — ")
+        for i in range(per_section):
+            if subheadings:
+                parts.append(f"{subheadings[i % len(subheadings)]} — {paragraph()}")
+            else:
+                parts.append(paragraph())
+    return {
+        "metadata": {"title": title, "url": None, "rank": index, "searchPattern": condition},
+        "content": {"markdown": "\n\n".join(parts)}
+    }
+
+def write_corpus(directory: str, files: int, article_chars: int = 20000, seed: int = 0) -> List[str]:
+    """
+    Write a synthetic corpus of JSON files.
+
+    Args:
+        directory (str): Output directory.
+        files (int): Number of articles.
+        article_chars (int): Approximate markdown length per article.
+        seed (int): Random seed.
+
+    Returns:
+        List[str]: Conditions covered by the corpus, usable as topics.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for index in range(files):
+        with open(os.path.join(directory, f"article_{index:05d}.json"), "w", encoding="utf-8") as f:
+            json.dump(synthetic_article(index, article_chars, seed), f)
+    return list(SYNTHETIC_CONDITIONS[:min(files, len(SYNTHETIC_CONDITIONS))])
+
+def run_benchmark(
+    files: int,
+    topics: int = 3,
+    article_chars: int = 20000,
+    concurrent_topics: int = 1,
+    backend: Optional[FakeOllama] = None,
+    work_dir: Optional[str] = None,
+    quiet: bool = True,
+    use_async: bool = False
+) -> Dict[str, Any]:
+    """
+    Ingest a synthetic corpus and generate notes end-to-end against a fake Ollama backend.
+
+    Chroma, the caches, traces and outputs all live in a temporary directory, so every
+    run starts cold and leaves nothing behind.
+
+    Args:
+        files (int): Number of synthetic articles.
+        topics (int): Notes to generate after ingestion.
+        article_chars (int): Approximate markdown length per article.
+        concurrent_topics (int): Notes generated in parallel.
+        backend (Optional[FakeOllama]): Fake backend (default: FakeOllama()).
+        work_dir (Optional[str]): Parent directory for the temporary files.
+        quiet (bool): Silence the pipeline's debug output.
+        use_async (bool): Generate notes with the async workflow on one event loop.
+
+    Returns:
+        Dict[str, Any]: Ingestion rate, per-stage latency, notes/hour and backend call counts.
+    """
+    from src.workflow import prepare_collection, generate_note, agenerate_note
+    from src.utils.instrumentation import reset_tracer
+    from src.utils.cache import reset_caches
+    from src.utils.lexical import reset_lexical_indexes
+    from src.utils.checkpoint import reset_checkpointer
+
+    backend = backend or FakeOllama()
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        override_setting("ingestion_settings", "db_path", os.path.join(tmp, "chroma_db"))
+        override_setting("cache_settings", "llm_cache_path", os.path.join(tmp, "cache", "llm_cache.sqlite"))
+        override_setting("cache_settings", "embedding_cache_path", os.path.join(tmp, "cache", "embedding_cache.sqlite"))
+        override_setting("cache_settings", "plan_cache_path", os.path.join(tmp, "cache", "plan_cache.sqlite"))
+        override_setting("cache_settings", "section_cache_path", os.path.join(tmp, "cache", "section_cache.sqlite"))
+        override_setting("checkpoint_settings", "path", os.path.join(tmp, "checkpoints", "workflow.sqlite"))
+        # Nothing to load on the fake backend; preload requests would only skew the call counts
+        override_setting("models", "preload", False)
+        corpus_dir = os.path.join(tmp, "corpus")
+        override_setting("ingestion_settings", "corpus_root", corpus_dir)
+        note_topics = (write_corpus(corpus_dir, files, article_chars) * topics)[:topics]
+        output_dir = os.path.join(tmp, "notes")
+        tracer = reset_tracer(os.path.join(tmp, "trace.jsonl"))
+        reset_caches()
+        reset_checkpointer()
+
+        output = open(os.devnull, "w") if quiet else sys.stdout
+        try:
+            with patched_ollama(backend), contextlib.redirect_stdout(output):
+                started = time.perf_counter()
+                collection = prepare_collection(corpus_dir)
+                ingest_seconds = time.perf_counter() - started
+                chunks = collection.count() if collection is not None else 0
+                ingest_calls = dict(backend.calls)
+
+                started = time.perf_counter()
+                failures = 0
+                if collection is not None and note_topics:
+                    def run_topic(topic: str) -> bool:
+                        try:
+                            generate_note(topic, "condition", collection, "markdown", output_dir)
+                            return True
+                        except Exception:
+                            return False
+
+                    async def run_topics_async() -> List[bool]:
+                        limit = asyncio.Semaphore(max(1, concurrent_topics))
+
+                        async def run_topic_async(topic: str) -> bool:
+                            async with limit:
+                                try:
+                                    await agenerate_note(topic, "condition", collection, "markdown", output_dir)
+                                    return True
+                                except Exception:
+                                    return False
+                        return await asyncio.gather(*(run_topic_async(topic) for topic in note_topics))
+
+                    if use_async:
+                        failures = sum(not ok for ok in asyncio.run(run_topics_async()))
+                    else:
+                        with ThreadPoolExecutor(max_workers=max(1, concurrent_topics)) as executor:
+                            failures = sum(not ok for ok in executor.map(run_topic, note_topics))
+                generate_seconds = time.perf_counter() - started
+        finally:
+            reset_caches()
+            reset_lexical_indexes()
+            reset_checkpointer()
+            if quiet:
+                output.close()
+
+        stages = {
+            name: {
+                "count": entry["count"],
+                "mean_ms": round(entry["mean_seconds"] * 1000, 2),
+                "max_ms": round(entry["max_seconds"] * 1000, 2),
+                "total_s": round(entry["total_seconds"], 3)
+            }
+            for name, entry in tracer.summary().items()
+        }
+    notes = len(note_topics) - failures
+    return {
+        "files": files,
+        "chunks": chunks,
+        "ingest_seconds": round(ingest_seconds, 3),
+        "files_per_second": round(files / ingest_seconds, 2) if ingest_seconds else 0.0,
+        "chunks_per_second": round(chunks / ingest_seconds, 2) if ingest_seconds else 0.0,
+        "notes": notes,
+        "failed_notes": failures,
+        "generate_seconds": round(generate_seconds, 3),
+        "notes_per_hour": round(notes / generate_seconds * 3600, 1) if generate_seconds else 0.0,
+        "ingest_calls": ingest_calls,
+        "total_calls": dict(backend.calls),
+        "stages": stages
+    }
+
+def print_report(result: Dict[str, Any]) -> None:
+    """
+    Print one benchmark result as a readable table.
+
+    Args:
+        result (Dict[str, Any]): Output of run_benchmark.
+    """
+    print(f"== {result['files']} files, {result['chunks']} chunks ==")
+    print(f"  ingestion: {result['ingest_seconds']}s ({result['files_per_second']} files/s, {result['chunks_per_second']} chunks/s)")
+    print(f"  generation: {result['notes']} notes in {result['generate_seconds']}s ({result['notes_per_hour']} notes/hour, {result['failed_notes']} failed)")
+    print(f"  backend calls: {result['total_calls']}")
+    print(f"  {'stage':<28}{'count':>7}{'mean ms':>10}{'max ms':>10}{'total s':>10}")
+    for name, stage in sorted(result["stages"].items(), key=lambda item: -item[1]["total_s"]):
+        print(f"  {name:<28}{stage['count']:>7}{stage['mean_ms']:>10}{stage['max_ms']:>10}{stage['total_s']:>10}")
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Build the benchmark command-line parser.
+
+    Returns:
+        argparse.ArgumentParser: Parser for corpus sizes, workload and fake backend latency.
+    """
+    parser = argparse.ArgumentParser(prog="python -m src.benchmark", description="Benchmark the pipeline offline against a fake Ollama backend.")
+    parser.add_argument("--config", help="Path to config.yaml")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="Corpus sizes in files (e.g., 10 100 1000 10000)")
+    parser.add_argument("--topics", type=int, default=3, help="Notes generated per corpus size")
+    parser.add_argument("--concurrent-topics", type=int, default=1, help="Notes generated in parallel")
+    parser.add_argument("--article-chars", type=int, default=20000, help="Approximate markdown length per article")
+    parser.add_argument("--chat-latency", type=float, default=0.05, help="Seconds per chat request")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds per generated token")
+    parser.add_argument("--embed-latency", type=float, default=0.005, help="Seconds per embed request")
+    parser.add_argument("--embed-text-latency", type=float, default=0.0005, help="Seconds per embedded text")
+    parser.add_argument("--dimensions", type=int, default=256, help="Embedding vector length")
+    parser.add_argument("--parallel", type=int, default=4, help="Requests the fake server handles at once")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Generate notes with the async workflow")
+    parser.add_argument("--work-dir", help="Directory for temporary files (default: system temp)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's debug output")
+    return parser
+
+def cli(argv: Optional[List[str]] = None) -> int:
+    """
+    Entry point for the benchmark.
+
+    Args:
+        argv (Optional[List[str]]): Arguments (default: sys.argv[1:]).
+
+    Returns:
+        int: Process exit code.
+    """
+    args = build_parser().parse_args(argv)
+    if args.config:
+        set_config_path(args.config)
+    results = []
+    for files in args.sizes:
+        backend = FakeOllama(
+            chat_latency=args.chat_latency,
+            token_latency=args.token_latency,
+            embed_latency=args.embed_latency,
+            embed_text_latency=args.embed_text_latency,
+            dimensions=args.dimensions,
+            parallel=args.parallel
+        )
+        result = run_benchmark(
+            files,
+            topics=args.topics,
+            article_chars=args.article_chars,
+            concurrent_topics=args.concurrent_topics,
+            backend=backend,
+            work_dir=args.work_dir,
+            quiet=not args.verbose,
+            use_async=args.use_async
+        )
+        print_report(result)
+        results.append(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"models": routed_models(), "results": results}, f, indent=2)
+        print(f"Benchmark results written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(cli())
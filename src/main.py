@@ -1,63 +1,13 @@
 import os
+import sys
+import json
+import asyncio
 import argparse
-import chromadb
-from langgraph.graph import StateGraph, START, END
-from src.models import WorkflowState
-from src.utils.json_loader import load_json_files
-from src.utils.embeddings import store_embeddings
-from src.nodes import orchestrator, retrieve_docs, worker_node, generate_output
-
-def create_workflow():
-    """
-    Create and compile the LangGraph workflow.
-
-    Returns:
-        compiled workflow: Configured LangGraph workflow.
-    """
-    workflow = StateGraph(WorkflowState)
-    # Pass collection via config["configurable"]["collection"] to match LangGraph's structure
-    workflow.add_node("orchestrator", lambda state, config: orchestrator(state, config["configurable"]["collection"]))
-    workflow.add_node("retrieve_docs", lambda state, config: retrieve_docs(state, config["configurable"]["collection"]))
-    workflow.add_node("process_sections", lambda state, config: process_sections(state, config["configurable"]["collection"]))
-    workflow.add_node("generate_output", generate_output)
-
-    workflow.add_edge(START, "orchestrator")
-    workflow.add_edge("orchestrator", "retrieve_docs")
-    workflow.add_edge("retrieve_docs", "process_sections")
-    workflow.add_edge("process_sections", "generate_output")
-    workflow.add_edge("generate_output", END)
-
-    return workflow.compile()
-
-def process_sections(state: WorkflowState, collection: chromadb.Collection) -> WorkflowState:
-    """
-    Process sections by invoking worker_node for each section.
+from typing import List, Optional
+from src.utils.config import get_setting, override_setting, set_config_path
 
-    Args:
-        state (WorkflowState): Current workflow state.
-        collection (chromadb.Collection): ChromaDB collection.
-
-    Returns:
-        WorkflowState: Updated state with processed sections.
-    """
-    print(f"DEBUG: Processing sections with {len(state.retrieved_docs)} sections")
-    try:
-        sections = []
-        for section in state.retrieved_docs:
-            print(f"DEBUG: Processing section '{section}'")
-            section_result = worker_node(state, section, collection)
-            sections.append(section_result)
-        return WorkflowState(
-            topic=state.topic,
-            note_type=state.note_type,
-            output_format=state.output_format,
-            retrieved_docs=state.retrieved_docs,
-            sections=sections,
-            section_structures=state.section_structures
-        )
-    except Exception as e:
-        print(f"Error in process_sections: {str(e)}")
-        raise
+# Heavy dependencies (chromadb, langgraph, ollama) are imported inside the commands that
+# need them, so '--help' and 'stats' start without loading them.
 
 def main(topic: str, note_type: str, json_path: str, output_format: str = "markdown") -> str | None:
     """
@@ -65,63 +15,209 @@ def main(topic: str, note_type: str, json_path: str, output_format: str = "markd
 
     Args:
         topic (str): Medical topic (e.g., 'Hypertension').
-        note_type (str): Type of note ('condition' or 'complaint').
+        note_type (str): Type of note ('condition', 'complaint' or 'drug').
         json_path (str): Path to JSON file or directory.
         output_format (str): Output format ('markdown' or 'org').
 
     Returns:
         str | None: Generated output or None if an error occurs.
     """
-    # Normalize path for Windows
-    json_path = os.path.normpath(json_path)
-    print(f"DEBUG: Using json_path: {json_path}")
+    from src.workflow import prepare_collection, generate_note, print_run_summary
 
-    # Verify json_path exists
-    if not os.path.exists(json_path):
-        print(f"Error: Path '{json_path}' does not exist")
+    collection = prepare_collection(json_path)
+    if collection is None:
         return None
+    output = generate_note(topic, note_type, collection, output_format)
+    print_run_summary()
+    return output
 
-    texts, sources = load_json_files(json_path)
-    if not texts:
-        print("Error: No valid JSON data loaded. Exiting.")
-        return None
-    
-    print(f"DEBUG: Loaded {len(texts)} texts from {len(sources)} sources")
-    collection = store_embeddings(texts, sources)
-    print(f"DEBUG: Collection initialized with {collection.count()} documents")
-    if collection.count() == 0:
+def cmd_ingest(args: argparse.Namespace) -> int:
+    """Load, chunk and embed the corpus."""
+    from src.workflow import prepare_collection, print_run_summary
+
+    collection = prepare_collection(args.json_path, db_path=args.db_path, prune=args.prune)
+    if collection is None:
+        return 1
+    print(f"Collection '{collection.name}' holds {collection.count()} chunks")
+    print_run_summary()
+    return 0
+
+def cmd_generate(args: argparse.Namespace) -> int:
+    """Generate notes for a single topic."""
+    from src.utils.embeddings import open_collection, check_embedding_model
+    from src.workflow import prepare_collection, generate_note, agenerate_note, print_run_summary
+    from src.utils.routing import preload_models
+
+    if args.skip_ingest:
+        _, collection = open_collection(args.db_path)
+        try:
+            check_embedding_model(collection)
+        except ValueError as e:
+            print(f"Error: {str(e)}")
+            return 1
+    else:
+        collection = prepare_collection(args.json_path, db_path=args.db_path)
+    if collection is None or collection.count() == 0:
         print("Error: No documents in collection. Exiting.")
-        return None
+        return 1
+    preload_models()
+    note_args = (args.topic, args.note_type, collection, args.output_format, args.output_dir or ".")
+    note_kwargs = {"echo": args.stream, "run_id": args.run_id, "resume": not args.restart}
+    if args.use_async:
+        asyncio.run(agenerate_note(*note_args, **note_kwargs))
+    else:
+        generate_note(*note_args, **note_kwargs)
+    print_run_summary()
+    return 0
 
-    state = WorkflowState(
-        topic=topic,
-        note_type=note_type,
-        output_format=output_format,
-        retrieved_docs={},
-        sections=[],
-        section_structures={}
+def cmd_batch(args: argparse.Namespace) -> int:
+    """Generate notes for a list of topics against a corpus indexed once."""
+    from src.batch import load_topics, run_batch
+
+    topics = list(args.topics) + (load_topics(args.topics_file) if args.topics_file else [])
+    if not topics:
+        print("Error: No topics given. Pass topics or --topics-file.")
+        return 2
+    report = run_batch(
+        topics,
+        note_type=args.note_type,
+        json_path=args.json_path,
+        output_format=args.output_format,
+        output_dir=args.output_dir,
+        max_concurrent_topics=args.max_concurrent_topics,
+        max_llm_requests=args.max_llm_requests,
+        force=args.force,
+        use_async=args.use_async
     )
+    return 1 if report["failed"] else 0
+
+def cmd_query(args: argparse.Namespace) -> int:
+    """Print the chunks retrieved for a free-text query."""
+    from src.utils.embeddings import open_collection, check_embedding_model
+    from src.utils.retrieval import hybrid_query
+
+    _, collection = open_collection(args.db_path)
     try:
-        app = create_workflow()
-        # Pass collection in config["configurable"] to match LangGraph's structure
-        config = {"configurable": {"collection": collection}}
-        print(f"DEBUG: Invoking workflow with config: {config}")
-        result = app.invoke(state, config=config)
-        output = generate_output(result)
-        file_ext = "org" if output_format == "org" else "md"
-        output_file = f"{topic.replace(' ', '_')}_notes.{file_ext}"
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(output)
-        print(f"Output written to {output_file}")
-        return output
-    except Exception as e:
-        print(f"Error in workflow execution: {str(e)}")
-        raise
+        check_embedding_model(collection)
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+        return 1
+    results = hybrid_query(collection, [args.text], args.n_results, mode=args.mode)
+    for rank, (id_, doc, meta) in enumerate(zip(results["ids"][0], results["documents"][0], results["metadatas"][0]), 1):
+        print(f"[{rank}] {meta.get('source', 'Unknown')} | {meta.get('heading_path', '')} | {id_}")
+        print(doc if args.full else doc[:300].replace("\n", " "))
+        print()
+    return 0
+
+def cmd_stats(args: argparse.Namespace) -> int:
+    """Print corpus and cache statistics without loading the pipeline or creating caches."""
+    from src.utils.cache import CACHE_FILES, read_cache_stats
+    from src.utils.manifest import manifest_path, read_manifest
+
+    db_path = args.db_path or get_setting("ingestion_settings", "db_path", "./chroma_db")
+    manifest = read_manifest(manifest_path(db_path))
+    stats = {
+        "corpus": {
+            "db_path": db_path,
+            "collection": manifest.get("collection") if manifest else None,
+            "sources": len(manifest["sources"]) if manifest else 0,
+            "chunks": sum(len(ids) for ids in manifest["sources"].values()) if manifest else 0,
+            "embedding": manifest.get("embedding") if manifest else None
+        }
+    }
+    # Cache files are read in place, so a clean checkout stays clean
+    for name in CACHE_FILES:
+        if get_setting("cache_settings", f"{name}_enabled", True):
+            stats[name] = read_cache_stats(name) or "no cache"
+        else:
+            stats[name] = None
+    print(json.dumps(stats, indent=2))
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Build the command-line parser.
+
+    Returns:
+        argparse.ArgumentParser: Parser with ingest, generate, batch, query and stats subcommands.
+    """
+    parser = argparse.ArgumentParser(prog="python -m src.main", description="Generate medical notes from UpToDate JSON exports.")
+    parser.add_argument("--config", help="Path to config.yaml")
+    parser.add_argument("--model", help="LLM model name (overrides models.llm)")
+    parser.add_argument("--embed-model", help="Embedding model name (overrides models.embedding)")
+    parser.add_argument("--db-path", help="ChromaDB directory (overrides ingestion_settings.db_path)")
+    parser.add_argument("--cache-mode", choices=["use", "refresh", "bypass"], help="How LLM calls use the response cache")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_corpus_args(sub: argparse.ArgumentParser) -> None:
+        sub.add_argument("--json-path", default="json_data/", help="JSON file or directory to ingest")
+
+    def add_note_args(sub: argparse.ArgumentParser) -> None:
+        sub.add_argument("--note-type", default="condition", choices=["condition", "complaint", "drug"])
+        sub.add_argument("--format", dest="output_format", default="markdown", choices=["markdown", "org"])
+        sub.add_argument("--output-dir", help="Directory for generated notes")
+
+    ingest = subparsers.add_parser("ingest", help="Load, chunk and embed the corpus")
+    add_corpus_args(ingest)
+    ingest.add_argument("--prune", action="store_true", help="Delete stored sources that are no longer under --json-path")
+    ingest.set_defaults(func=cmd_ingest)
+
+    generate = subparsers.add_parser("generate", help="Generate notes for one topic")
+    generate.add_argument("topic", help="Medical topic (e.g., 'Hypertension')")
+    add_corpus_args(generate)
+    add_note_args(generate)
+    generate.add_argument("--skip-ingest", action="store_true", help="Use the existing collection without re-ingesting")
+    generate.add_argument("--stream", action="store_true", help="Print sections to stdout as they complete")
+    generate.add_argument("--run-id", help="Checkpoint id of the run (default: derived from topic, note type and format)")
+    generate.add_argument("--restart", action="store_true", help="Discard an unfinished checkpointed run instead of resuming it")
+    generate.add_argument("--async", dest="use_async", action="store_true", help="Run the async workflow with the pooled async client")
+    generate.set_defaults(func=cmd_generate)
+
+    batch = subparsers.add_parser("batch", help="Generate notes for many topics")
+    batch.add_argument("topics", nargs="*", help="Topics to generate notes for")
+    batch.add_argument("--topics-file", help="File with one topic per line")
+    add_corpus_args(batch)
+    add_note_args(batch)
+    batch.add_argument("--max-concurrent-topics", type=int)
+    batch.add_argument("--max-llm-requests", type=int)
+    batch.add_argument("--force", action="store_true", help="Regenerate topics with existing outputs")
+    batch.add_argument("--async", dest="use_async", action="store_true", help="Run topics on one event loop with the async client")
+    batch.set_defaults(func=cmd_batch)
+
+    query = subparsers.add_parser("query", help="Show the chunks retrieved for a query")
+    query.add_argument("text", help="Query text")
+    query.add_argument("-n", "--n-results", type=int, default=5)
+    query.add_argument("--full", action="store_true", help="Print whole chunks")
+    query.add_argument("--mode", choices=["vector", "lexical", "hybrid"], help="Retriever (default: retrieval_settings.mode)")
+    query.set_defaults(func=cmd_query)
+
+    stats = subparsers.add_parser("stats", help="Show corpus and cache statistics")
+    stats.set_defaults(func=cmd_stats)
+    return parser
+
+def cli(argv: Optional[List[str]] = None) -> int:
+    """
+    Entry point for the command-line interface.
+
+    Args:
+        argv (Optional[List[str]]): Arguments (default: sys.argv[1:]).
+
+    Returns:
+        int: Process exit code.
+    """
+    args = build_parser().parse_args(argv)
+    if args.config:
+        set_config_path(args.config)
+    if args.model:
+        override_setting("models", "llm", args.model)
+    if args.embed_model:
+        override_setting("models", "embedding", args.embed_model)
+    if args.db_path:
+        override_setting("ingestion_settings", "db_path", os.path.normpath(args.db_path))
+    if args.cache_mode:
+        from src.utils.cache import set_llm_cache_mode
+        set_llm_cache_mode(args.cache_mode)
+    return args.func(args)
 
 if __name__ == "__main__":
-    main(
-        topic="Hypertension",
-        note_type="condition",
-        json_path="json_data/",
-        output_format="org"
-    )
\ No newline at end of file
+    sys.exit(cli())
@@ -1,4 +1,4 @@
-from typing import Dict, List, Literal, Optional, Union, Any
+from typing import Annotated, Dict, List, Literal, Optional, Union, Any
 from pydantic import BaseModel, Field
 
 class NoteItem(BaseModel):
@@ -34,19 +34,31 @@ class NoteSection(BaseModel):
     )
     source: str = Field(description="Primary source JSON file for the section.")
 
+def merge_section_results(left: Dict[str, NoteSection], right: Dict[str, NoteSection]) -> Dict[str, NoteSection]:
+    """Merge section results written by parallel section workers."""
+    return {**left, **right}
+
 class WorkflowState(BaseModel):
     """State for the LangGraph workflow."""
     topic: str = Field(description="Medical topic (e.g., 'Hypertension').")
-    note_type: Literal["condition", "complaint"] = Field(
-        description="Type: 'condition' for diseases or 'complaint' for symptoms."
+    note_type: Literal["condition", "complaint", "drug"] = Field(
+        description="Type: 'condition' for diseases, 'complaint' for symptoms or 'drug' for medications."
     )
     output_format: Literal["markdown", "org"] = Field(
         default="markdown",
         description="Output format: 'markdown' or 'org'."
     )
-    retrieved_docs: Dict[str, List[Dict[str, str]]] = Field(
+    retrieved_docs: Dict[str, List[str]] = Field(
+        default_factory=dict,
+        description="Section titles mapped to the ids of their retrieved passages, in rank order."
+    )
+    routed_sources: List[str] = Field(
+        default_factory=list,
+        description="Sources of the articles the note was routed to; empty when chunk search covers the whole collection."
+    )
+    passages: Dict[str, Dict[str, str]] = Field(
         default_factory=dict,
-        description="Section titles mapped to lists of retrieved documents (text and source)."
+        description="Retrieved passages (text, source and heading path) keyed by chunk id, shared across sections."
     )
     sections: List[NoteSection] = Field(
         default_factory=list,
@@ -56,3 +68,12 @@ class WorkflowState(BaseModel):
         default_factory=dict,
         description="Section titles mapped to structuring instructions (e.g., 'Nested list by test categories')."
     )
+    section_results: Annotated[Dict[str, NoteSection], merge_section_results] = Field(
+        default_factory=dict,
+        description="Processed sections keyed by section title, collected from parallel section workers."
+    )
+
+class SectionTask(BaseModel):
+    """Input for a single parallel section worker."""
+    state: WorkflowState = Field(description="Workflow state after document retrieval.")
+    section: str = Field(description="Title of the section to process.")
@@ -1,8 +1,28 @@
 import chromadb
-import ollama
 import json
-from typing import Dict, List, Union
+import hashlib
+import time
+import asyncio
+import weakref
+import functools
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
 from src.models import WorkflowState, NoteSection, NoteItem
+from src.utils.config import get_setting, load_config
+from src.utils.cache import SqliteCache, get_llm_cache, get_llm_cache_mode, get_section_cache, llm_cache_key
+from src.utils.embeddings import content_hash, collection_db_path
+from src.utils.manifest import manifest_path, manifest_digest
+from src.utils.retrieval import hybrid_query
+from src.utils.articles import route_articles
+from src.utils.tagging import tagged_query
+from src.utils.context import estimate_tokens, pack_context, pack_documents, prompt_budget
+from src.utils.instrumentation import span, traced, response_metrics
+from src.utils.ollama_client import achat, chat
+from src.utils.routing import stage_route
+from src.utils.steps import Call, Steps, call, blocking, run_steps, arun_steps
+from src.utils.planning import planning_mode, template_sections, template_outline, plan_key, load_plan, save_plan
 from src.prompts import (
     ORCHESTRATOR_PROMPT,
     HIGH_LEVEL_PROMPT,
@@ -11,81 +31,497 @@ from src.prompts import (
     OPTIMIZER_PROMPT
 )
 
-def structured_llm(model: str, schema: dict):
+# Global budget of LLM requests in flight, shared by every topic, section and detail worker
+_llm_budget_limit = get_setting("workflow_settings", "max_llm_requests", 8)
+_llm_budget = threading.BoundedSemaphore(_llm_budget_limit)
+# The async pipeline uses one asyncio semaphore per event loop with the same limit
+_async_llm_budgets: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+ORCHESTRATOR_SCHEMA = {
+    "type": "object",
+    "properties": {"sections": {"type": "array", "items": {
+        "type": "object",
+        "properties": {"title": {"type": "string"}, "structure": {"type": "string"}}
+    }}}
+}
+
+# Sections used when the orchestrator fails or returns invalid output
+DEFAULT_SECTIONS = [
+    {"title": "Definition", "structure": "Simple list"},
+    {"title": "Epidemiology", "structure": "Simple list"},
+    {"title": "Treatment", "structure": "Detailed hierarchy"}
+]
+
+GAP_SCHEMA = {"type": "object", "properties": {
+    "gaps": {"type": "array", "items": {
+        "type": "object",
+        "properties": {
+            "missing": {"type": "string"},
+            "query": {"type": "string"},
+            "reasoning": {"type": "string"}
+        }
+    }}
+}}
+
+def set_llm_budget(limit: int) -> None:
+    """
+    Replace the global limit on concurrent LLM requests.
+
+    Args:
+        limit (int): Maximum number of Ollama chat requests in flight.
+    """
+    global _llm_budget, _llm_budget_limit
+    _llm_budget_limit = max(1, limit)
+    _llm_budget = threading.BoundedSemaphore(_llm_budget_limit)
+    _async_llm_budgets.clear()
+
+def _async_llm_budget() -> asyncio.Semaphore:
+    """Return the LLM request budget of the running event loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _async_llm_budgets:
+        _async_llm_budgets[loop] = asyncio.Semaphore(_llm_budget_limit)
+    return _async_llm_budgets[loop]
+
+def _cache_lookup(model: str, schema: dict, options: dict, prompt: str, cache_mode: Optional[str]) -> Tuple[Optional[SqliteCache], Optional[str], Any]:
+    """Return the LLM cache, the prompt's cache key and its cached content (None on a miss)."""
+    mode = cache_mode or get_llm_cache_mode()
+    cache = get_llm_cache() if mode != "bypass" else None
+    if cache is None:
+        return None, None, None
+    key = llm_cache_key(model, schema, options, prompt)
+    cached = cache.get(key) if mode == "use" else None
+    return cache, key, json.loads(cached) if cached is not None else None
+
+def _response_content(response: Any, cache: Optional[SqliteCache], key: Optional[str]) -> Any:
+    """Parse the JSON content of a chat response and store it in the cache."""
+    content = response["message"]["content"]
+    if isinstance(content, str):
+        content = json.loads(content)
+    if cache:
+        cache.set(key, json.dumps(content).encode("utf-8"))
+    return content
+
+def structured_llm(model: Optional[str], schema: dict, cache_mode: Optional[str] = None, stage: str = "call"):
     """
     Create a structured LLM function for JSON output.
 
+    Responses are cached on disk keyed by model, schema, options and prompt (see
+    src.utils.cache), so repeated prompts skip the Ollama call. Each call is traced as
+    an 'llm.<stage>' span with Ollama's token counts and durations. The model, options
+    and keep_alive come from the stage's route (see src.utils.routing); requests go through the
+    shared pooled Client with timeouts and retries (see src.utils.ollama_client).
+
     Args:
-        model (str): LLM model name (e.g., 'llama3.2').
+        model (Optional[str]): LLM model name, or None for the stage's routed model.
         schema (dict): JSON schema for output validation.
+        cache_mode (Optional[str]): 'use', 'refresh' or 'bypass' (default: configured mode).
+        stage (str): Pipeline stage (e.g., 'gap'), used for model routing and the span name.
 
     Returns:
         callable: Function that generates structured output.
     """
+    route = stage_route(stage)
+    model = model or route["model"]
+
     def generate_structured(prompt: str) -> dict:
+        with span(f"llm.{stage}", model=model, prompt_chars=len(prompt), cache_hit=False) as attrs:
+            cache, key, cached = _cache_lookup(model, schema, route["options"], prompt, cache_mode)
+            if cached is not None:
+                attrs["cache_hit"] = True
+                return cached
+            try:
+                queued = time.perf_counter()
+                with _llm_budget:
+                    attrs["queue_seconds"] = time.perf_counter() - queued
+                    response = chat(
+                        model=model,
+                        messages=[{"role": "user", "content": prompt}],
+                        format=schema,
+                        options=route["options"],
+                        keep_alive=route["keep_alive"]
+                    )
+                attrs.update(response_metrics(response))
+                return _response_content(response, cache, key)
+            except Exception as e:
+                print(f"Error in structured_llm for model {model}: {str(e)}")
+                raise
+    return generate_structured
+
+def async_structured_llm(model: Optional[str], schema: dict, cache_mode: Optional[str] = None, stage: str = "call"):
+    """
+    Create an async structured LLM function for JSON output.
+
+    Same caching and tracing as structured_llm, but requests go through the shared
+    pooled AsyncClient with per-call timeouts and retries (see src.utils.ollama_client),
+    and cache reads and writes run in a worker thread.
+
+    Args:
+        model (Optional[str]): LLM model name, or None for the stage's routed model.
+        schema (dict): JSON schema for output validation.
+        cache_mode (Optional[str]): 'use', 'refresh' or 'bypass' (default: configured mode).
+        stage (str): Pipeline stage (e.g., 'gap'), used for model routing and the span name.
+
+    Returns:
+        callable: Coroutine function that generates structured output.
+    """
+    route = stage_route(stage)
+    model = model or route["model"]
+
+    async def generate_structured(prompt: str) -> dict:
+        with span(f"llm.{stage}", model=model, prompt_chars=len(prompt), cache_hit=False) as attrs:
+            # The cache is SQLite, so its reads and writes stay off the event loop
+            cache, key, cached = await asyncio.to_thread(_cache_lookup, model, schema, route["options"], prompt, cache_mode)
+            if cached is not None:
+                attrs["cache_hit"] = True
+                return cached
+            try:
+                queued = time.perf_counter()
+                async with _async_llm_budget():
+                    attrs["queue_seconds"] = time.perf_counter() - queued
+                    response = await achat(
+                        model=model,
+                        messages=[{"role": "user", "content": prompt}],
+                        format=schema,
+                        options=route["options"],
+                        keep_alive=route["keep_alive"]
+                    )
+                attrs.update(response_metrics(response))
+                return await asyncio.to_thread(_response_content, response, cache, key)
+            except Exception as e:
+                print(f"Error in structured_llm for model {model}: {str(e)}")
+                raise
+    return generate_structured
+
+def _llm_call(model: Optional[str], schema: dict, stage: str, prompt: str) -> Call:
+    """Describe one structured LLM request of a stage, for a step generator to yield."""
+    return call(
+        lambda prompt: structured_llm(model, schema, stage=stage)(prompt),
+        lambda prompt: async_structured_llm(model, schema, stage=stage)(prompt),
+        prompt
+    )
+
+def _llm_batch(model: Optional[str], schema: dict, stage: str, prompts: List[str]) -> List[Any]:
+    """Run a stage's prompts concurrently, returning each result or the exception it raised."""
+    llm = structured_llm(model, schema, stage=stage)
+
+    def run(prompt: str) -> Any:
         try:
-            response = ollama.chat(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                format=schema,
-                options={"temperature": 0.5}
-            )
-            content = response["message"]["content"]
-            if isinstance(content, str):
-                content = json.loads(content)
-            return content
+            return llm(prompt)
         except Exception as e:
-            print(f"Error in structured_llm for model {model}: {str(e)}")
-            raise
-    return generate_structured
+            return e
+
+    with ThreadPoolExecutor(max_workers=get_setting("workflow_settings", "max_concurrent_llm_calls", 4)) as executor:
+        # Each prompt runs in a copy of this context so its span nests under the caller's
+        futures = [executor.submit(contextvars.copy_context().run, run, prompt) for prompt in prompts]
+        return [future.result() for future in futures]
+
+async def _allm_batch(model: Optional[str], schema: dict, stage: str, prompts: List[str]) -> List[Any]:
+    """Async variant of _llm_batch; prompts run as concurrent tasks."""
+    llm = async_structured_llm(model, schema, stage=stage)
+    limit = asyncio.Semaphore(get_setting("workflow_settings", "max_concurrent_llm_calls", 4))
+
+    async def run(prompt: str) -> Any:
+        async with limit:
+            try:
+                return await llm(prompt)
+            except Exception as e:
+                return e
+
+    return list(await asyncio.gather(*(run(prompt) for prompt in prompts)))
+
+def _planning_data(state: WorkflowState, collection: chromadb.Collection, mode: str) -> str:
+    """
+    Collect the data block of the orchestrator prompt.
+
+    Holds the note type's template when refining it, and the article headings of the
+    chunks retrieved for the topic, so planned sections follow the corpus.
+    """
+    parts = []
+    if mode == "refine":
+        outline = template_outline(state.note_type)
+        if outline:
+            parts.append(f"Section template for a '{state.note_type}' note:\n{outline}")
+    n_results = get_setting("planning_settings", "heading_chunks", 10)
+    if n_results:
+        try:
+            results = hybrid_query(collection, [state.topic], n_results)
+            headings = list(dict.fromkeys(
+                meta.get("heading_path") for meta in results["metadatas"][0] if meta and meta.get("heading_path")
+            ))
+            if headings:
+                parts.append("Article headings found for the topic:\n" + "\n".join(f"- {heading}" for heading in headings))
+        except Exception as e:
+            print(f"Warning: Could not retrieve headings for planning: {str(e)}")
+    return "\n\n".join(parts)
+
+def _orchestrator_prompt(state: WorkflowState, data: str) -> str:
+    """Format the orchestrator prompt for a topic."""
+    prompt = ORCHESTRATOR_PROMPT.format(
+        topic=state.topic,
+        note_type=state.note_type,
+        data=data or "(no data available)",
+        orchestrator_output_schema=json.dumps(ORCHESTRATOR_SCHEMA)
+    )
+    print(f"DEBUG: Orchestrator prompt: {prompt[:100]}...")
+    return prompt
 
+def _planned_sections(result: Any) -> Optional[List[Dict[str, str]]]:
+    """Extract valid sections from orchestrator output, or None if there are none."""
+    if not isinstance(result, dict) or not isinstance(result.get("sections"), list):
+        print(f"Error: Invalid orchestrator output: {result}")
+        return None
+    sections = [
+        {"title": section["title"], "structure": section.get("structure") or "Simple list"}
+        for section in result["sections"]
+        if isinstance(section, dict) and isinstance(section.get("title"), str) and section["title"].strip()
+    ]
+    return sections or None
+
+def _stored_plan(state: WorkflowState, collection: chromadb.Collection, mode: str) -> Tuple[Optional[List[Dict[str, str]]], Optional[str]]:
+    """
+    Return the plan available without an LLM call: the template plan, or a cached
+    orchestrator plan. Also returns the plan cache key for LLM planning modes, which
+    covers the orchestrator prompt and the corpus the planning headings come from.
+    """
+    if mode == "template":
+        sections = template_sections(state.note_type)
+        if not sections:
+            print(f"Warning: No template for note type '{state.note_type}', using default sections")
+        return sections or DEFAULT_SECTIONS, None
+    corpus = manifest_digest(manifest_path(collection_db_path(collection)))
+    key = plan_key(state.topic, state.note_type, mode, stage_route("orchestrator")["model"], ORCHESTRATOR_PROMPT, corpus)
+    sections = load_plan(key)
+    if sections:
+        print(f"DEBUG: Using cached section plan for '{state.topic}'")
+    return sections, key
+
+def _fallback_sections(note_type: str) -> List[Dict[str, str]]:
+    """Sections used when orchestrator planning fails: the template, else DEFAULT_SECTIONS."""
+    return template_sections(note_type) or DEFAULT_SECTIONS
+
+def _apply_sections(state: WorkflowState, sections: List[Dict[str, str]]) -> WorkflowState:
+    """Store the planned sections in the state."""
+    state.sections = [NoteSection(title=section["title"], content=[], source="Unknown") for section in sections]
+    state.section_structures = {section["title"]: section["structure"] for section in sections}
+    print(f"DEBUG: Orchestrator completed with {len(state.sections)} sections")
+    return state
+
+def _orchestrator_steps(state: WorkflowState, collection: chromadb.Collection) -> Steps[WorkflowState]:
+    """Plan the sections of a note, yielding the retrieval and LLM calls (see orchestrator)."""
+    print(f"DEBUG: Entering orchestrator for topic '{state.topic}', note_type '{state.note_type}'")
+    mode = planning_mode()
+    sections, key = yield blocking(_stored_plan, state, collection, mode)
+    if sections is None:
+        try:
+            data = yield blocking(_planning_data, state, collection, mode)
+            sections = _planned_sections((yield _llm_call(None, ORCHESTRATOR_SCHEMA, "orchestrator", _orchestrator_prompt(state, data))))
+        except Exception as e:
+            print(f"Error in orchestrator LLM call: {str(e)}")
+        if sections:
+            yield blocking(save_plan, key, sections)
+        else:
+            sections = _fallback_sections(state.note_type)
+    return _apply_sections(state, sections)
+
+@traced("node.orchestrator")
 def orchestrator(state: WorkflowState, collection: chromadb.Collection) -> WorkflowState:
     """
-    Generate a list of sections for the medical note without document retrieval.
+    Plan the sections of the medical note.
+
+    Depending on planning_settings.mode, sections come from the note type's config
+    template, or from an orchestrator LLM call (optionally refining the template) whose
+    plan is kept in the plan cache, so repeated runs of a topic skip the call.
 
     Args:
         state (WorkflowState): Current workflow state.
-        collection (chromadb.Collection): ChromaDB collection (unused here but required for workflow).
+        collection (chromadb.Collection): ChromaDB collection, searched for article headings.
 
     Returns:
         WorkflowState: Updated state with sections and section structures.
     """
-    print(f"DEBUG: Entering orchestrator for topic '{state.topic}', note_type '{state.note_type}'")
-    structured_llm_gen = structured_llm("llama3.2", {
-        "type": "object",
-        "properties": {"sections": {"type": "array", "items": {
-            "type": "object",
-            "properties": {"title": {"type": "string"}, "structure": {"type": "string"}}
-        }}}
-    })
-    prompt = ORCHESTRATOR_PROMPT.format(topic=state.topic, note_type=state.note_type)
-    print(f"DEBUG: Orchestrator prompt: {prompt[:100]}...")
+    return run_steps(_orchestrator_steps(state, collection))
+
+@traced("node.orchestrator")
+async def aorchestrator(state: WorkflowState, collection: chromadb.Collection) -> WorkflowState:
+    """
+    Async variant of orchestrator.
+
+    Args:
+        state (WorkflowState): Current workflow state.
+        collection (chromadb.Collection): ChromaDB collection, searched for article headings.
+
+    Returns:
+        WorkflowState: Updated state with sections and section structures.
+    """
+    return await arun_steps(_orchestrator_steps(state, collection))
+
+def section_n_results(structure: str) -> int:
+    """
+    Choose how many chunks to retrieve for a section from its structure.
+
+    The first keyword of retrieval_settings.n_results_by_structure found in the
+    structure (case-insensitive) wins, so nested sections can draw more context than
+    simple lists.
+
+    Args:
+        structure (str): Section structuring instruction (e.g., 'Nested list by drug class').
+
+    Returns:
+        int: Number of chunks to retrieve (default: ingestion_settings.max_chunks_per_subtask).
+    """
+    for keyword, n_results in (get_setting("retrieval_settings", "n_results_by_structure", {}) or {}).items():
+        if str(keyword).lower() in structure.lower():
+            return int(n_results)
+    return get_setting("ingestion_settings", "max_chunks_per_subtask", 5)
+
+def plan_stages(structure: str) -> Dict[str, Any]:
+    """
+    Decide which worker stages a section runs, from its structure.
+
+    The first keyword of stage_settings.stages_by_structure found in the structure
+    (case-insensitive) selects the stage list, as for n_results_by_structure; other
+    sections run stage_settings.default_stages. The high-level summarizer always runs.
+
+    Args:
+        structure (str): Section structuring instruction (e.g., 'Simple list').
+
+    Returns:
+        Dict[str, Any]: 'gap', 'detail' and 'optimizer' flags, plus 'max_detail_queries'
+        and 'optimizer_needs_gaps' (skip the optimizer when the gap evaluator finds nothing).
+    """
+    stages = get_setting("stage_settings", "default_stages", ["high_level", "gap", "detail", "optimizer"])
+    for keyword, keyword_stages in (get_setting("stage_settings", "stages_by_structure", {}) or {}).items():
+        if str(keyword).lower() in structure.lower():
+            stages = keyword_stages or []
+            break
+    return {
+        "gap": "gap" in stages,
+        # Detail queries are driven by the gap evaluator's output, so they need its stage
+        "detail": "detail" in stages and "gap" in stages,
+        "optimizer": "optimizer" in stages,
+        "max_detail_queries": get_setting("stage_settings", "max_detail_queries", 8),
+        "optimizer_needs_gaps": get_setting("stage_settings", "skip_optimizer_without_gaps", True)
+    }
+
+def _run_optimizer(plan: Dict[str, Any], gap_result: Dict, section: str) -> bool:
+    """Tell whether the optimizer should rewrite a section, given its plan and gaps."""
+    if not plan["optimizer"]:
+        return False
+    if plan["optimizer_needs_gaps"] and not gap_result.get("gaps"):
+        print(f"DEBUG: No gaps found for section '{section}', skipping optimizer")
+        return False
+    return True
+
+def section_docs(state: WorkflowState, section: str) -> List[Dict[str, str]]:
+    """
+    Resolve the passages retrieved for a section.
+
+    Args:
+        state (WorkflowState): Workflow state after document retrieval.
+        section (str): Section title.
+
+    Returns:
+        List[Dict[str, str]]: Passages with 'text', 'source' and 'heading_path', in rank order.
+    """
+    return [state.passages[id_] for id_ in state.retrieved_docs.get(section, []) if id_ in state.passages]
+
+# Worker stages whose model, options and prompts shape a section's content
+WORKER_STAGES = ("high_level", "gap", "detail", "optimizer")
+
+def section_fingerprint(state: WorkflowState, section: str, model: Optional[str] = None) -> str:
+    """
+    Fingerprint everything a worker's output for a section depends on.
+
+    Covers the topic, note type, output format, section title and structure, the
+    stage plan, each worker stage's model route (or the model override), the context
+    budgets, the worker prompts, the routed sources that detail queries search, and
+    the ids and content hashes (text, source and heading path) of the passages
+    retrieved for the section, in rank order. A section whose evidence and settings are unchanged gets
+    the same fingerprint on every run.
+
+    Args:
+        state (WorkflowState): Workflow state after document retrieval.
+        section (str): Section title.
+        model (Optional[str]): LLM model override passed to the worker.
+
+    Returns:
+        str: Hex SHA-256 digest.
+    """
+    structure = state.section_structures.get(section, "Simple list")
+    routes = {stage: stage_route(stage) for stage in WORKER_STAGES}
+    if model:
+        routes = {stage: {**route, "model": model} for stage, route in routes.items()}
+    evidence = [
+        [id_, content_hash(json.dumps(state.passages[id_], sort_keys=True, ensure_ascii=False))]
+        for id_ in state.retrieved_docs.get(section, []) if id_ in state.passages
+    ]
+    payload = json.dumps({
+        "topic": state.topic,
+        "note_type": state.note_type,
+        "output_format": state.output_format,
+        "section": section,
+        "structure": structure,
+        "plan": plan_stages(structure),
+        "routes": {stage: {"model": route["model"], "options": route["options"]} for stage, route in routes.items()},
+        "context": load_config().get("context_settings") or {},
+        "prompts": [HIGH_LEVEL_PROMPT, GAP_EVALUATOR_PROMPT, DETAIL_QUERY_PROMPT, OPTIMIZER_PROMPT],
+        "routed_sources": state.routed_sources,
+        "evidence": evidence
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def load_section(fingerprint: str) -> Optional[NoteSection]:
+    """
+    Look up a previously generated section by fingerprint.
+
+    Args:
+        fingerprint (str): Key from section_fingerprint.
+
+    Returns:
+        Optional[NoteSection]: Stored section, or None on a miss or when the cache is
+        disabled or bypassed/refreshed (cache_settings.llm_cache_mode).
+    """
+    cache = get_section_cache()
+    if cache is None or get_llm_cache_mode() != "use":
+        return None
+    stored = cache.get(fingerprint)
+    if stored is None:
+        return None
     try:
-        result = structured_llm_gen(prompt)
-        if not isinstance(result, dict) or "sections" not in result:
-            print(f"Error: Invalid orchestrator output: {result}")
-            result = {"sections": [
-                {"title": "Definition", "structure": "Simple list"},
-                {"title": "Epidemiology", "structure": "Simple list"},
-                {"title": "Treatment", "structure": "Detailed hierarchy"}
-            ]}
-    except Exception as e:
-        print(f"Error in orchestrator LLM call: {str(e)}")
-        result = {"sections": [
-            {"title": "Definition", "structure": "Simple list"},
-            {"title": "Epidemiology", "structure": "Simple list"},
-            {"title": "Treatment", "structure": "Detailed hierarchy"}
-        ]}
-    
-    state.sections = [NoteSection(title=section["title"], content=[], source="Unknown") for section in result["sections"]]
-    state.section_structures = {section["title"]: section["structure"] for section in result["sections"]}
-    print(f"DEBUG: Orchestrator completed with {len(state.sections)} sections")
-    return state
+        return NoteSection.model_validate_json(stored)
+    except ValueError as e:
+        print(f"Warning: Ignoring unreadable cached section: {str(e)}")
+        return None
+
+def save_section(fingerprint: str, section: NoteSection) -> None:
+    """
+    Store a generated section under its fingerprint.
+
+    Empty sections (a failed summarizer or no passages) are not stored, so the next
+    run retries them.
 
+    Args:
+        fingerprint (str): Key from section_fingerprint.
+        section (NoteSection): Generated section.
+    """
+    cache = get_section_cache()
+    if cache is None or get_llm_cache_mode() == "bypass" or not section.content:
+        return
+    cache.set(fingerprint, section.model_dump_json().encode("utf-8"))
+
+@traced("node.retrieve_docs")
 def retrieve_docs(state: WorkflowState, collection: chromadb.Collection) -> WorkflowState:
     """
     Retrieve relevant documents for each section using RAG.
 
+    The note is first routed to its top articles (see src.utils.articles), and chunk
+    search is restricted to their sources. When chunks were tagged with template
+    sections at ingestion (see src.utils.tagging), those sections are a filtered
+    lookup with the topic embedding. All other section queries go through one
+    hybrid_query call (one embedding request and one multi-query Chroma search, fused
+    with BM25 hits). Passages are stored once in state.passages; each section keeps
+    only the ids of its passages, so chunks shared by sections are not duplicated.
+
     Args:
         state (WorkflowState): Current workflow state.
         collection (chromadb.Collection): ChromaDB collection for document retrieval.
@@ -93,180 +529,439 @@ def retrieve_docs(state: WorkflowState, collection: chromadb.Collection) -> Work
     Returns:
         WorkflowState: Updated state with retrieved documents.
     """
-    print(f"DEBUG: Entering retrieve_docs with collection: {collection}, count: {collection.count()}")
+    print(f"DEBUG: Entering retrieve_docs for topic '{state.topic}'")
     if not isinstance(collection, chromadb.Collection):
         print(f"Error: Invalid collection type: {type(collection)}")
         raise TypeError("Collection must be a chromadb.Collection")
-    
-    state.retrieved_docs = {}
-    for section in [s.title for s in state.sections]:
-        prompt = f"{section} of {state.topic}"
-        try:
-            response = ollama.embed(model="mxbai-embed-large", input=prompt)
-            results = collection.query(
-                query_embeddings=[response["embeddings"]],
-                include=["documents", "metadatas"],
-                n_results=5
+
+    sections = list(dict.fromkeys(s.title for s in state.sections))
+    state.retrieved_docs = {section: [] for section in sections}
+    state.passages = {}
+    if not sections:
+        return state
+    limits = {section: section_n_results(state.section_structures.get(section, "")) for section in sections}
+    found: Dict[str, Tuple[List[str], List[str], List[Dict[str, Any]]]] = {}
+    try:
+        state.routed_sources = route_articles(collection, state.topic)
+        sources = state.routed_sources or None
+        if get_setting("tagging_settings", "enabled", False):
+            # Sections tagged at ingestion are a filtered lookup; the rest are searched
+            found = tagged_query(collection, state.topic, limits, sources)
+        remaining = [section for section in sections if section not in found]
+        if remaining:
+            results = hybrid_query(
+                collection,
+                [f"{section} of {state.topic}" for section in remaining],
+                max(limits[section] for section in remaining),
+                sources=sources
             )
-            state.retrieved_docs[section] = [
-                {"text": doc, "source": meta["source"]}
-                for doc, meta in zip(results["documents"][0], results["metadatas"][0])
-            ] if results["documents"] else []
-            print(f"DEBUG: Retrieved {len(state.retrieved_docs[section])} documents for section '{section}'")
-        except Exception as e:
-            print(f"Error in retrieve_docs for section '{section}': {str(e)}")
-            state.retrieved_docs[section] = []
-    print(f"DEBUG: retrieve_docs completed with {len(state.retrieved_docs)} sections")
+            found.update(zip(remaining, zip(results["ids"], results["documents"], results["metadatas"])))
+    except Exception as e:
+        print(f"Error in retrieve_docs for topic '{state.topic}': {str(e)}")
+        return state
+
+    for section in sections:
+        ids, docs, metas = found.get(section, ([], [], []))
+        for id_, doc, meta in list(zip(ids, docs, metas))[:limits[section]]:
+            if id_ not in state.passages:
+                state.passages[id_] = {"text": doc, "source": meta.get("source", "Unknown"), "heading_path": meta.get("heading_path", "")}
+            state.retrieved_docs[section].append(id_)
+        print(f"DEBUG: Retrieved {len(state.retrieved_docs[section])} documents for section '{section}'")
+    shared = sum(len(ids) for ids in state.retrieved_docs.values()) - len(state.passages)
+    print(f"DEBUG: retrieve_docs completed with {len(sections)} sections, {len(state.passages)} unique passages ({shared} shared)")
     return state
 
-def worker_node(state: WorkflowState, section: str, collection: chromadb.Collection, model: str = "llama3.2") -> NoteSection:
+
+async def aretrieve_docs(state: WorkflowState, collection: chromadb.Collection) -> WorkflowState:
     """
-    Process a single section using RAG for summarization, gap evaluation, and optimization.
+    Async variant of retrieve_docs.
+
+    Chroma and the lexical index have no async API, so the batched retrieval runs in a
+    worker thread while the event loop keeps serving LLM requests.
 
     Args:
         state (WorkflowState): Current workflow state.
-        section (str): Section title to process.
         collection (chromadb.Collection): ChromaDB collection for document retrieval.
-        model (str): LLM model name (default: 'llama3.2').
 
     Returns:
-        NoteSection: Processed section with structured content.
+        WorkflowState: Updated state with retrieved documents.
     """
-    print(f"DEBUG: Entering worker_node for section '{section}' with collection: {collection}, count: {collection.count()}")
-    docs = state.retrieved_docs.get(section, [])
-    if not docs:
-        print(f"Warning: No documents retrieved for section '{section}'")
-        return NoteSection(title=section, content=[], source="Unknown")
-    doc_texts = [doc["text"] for doc in docs if isinstance(doc["text"], str)]
-    sources = [doc["source"] for doc in docs if isinstance(doc["text"], str)]
-    structure = state.section_structures.get(section, "Simple list")
-    
-    # 1. High-Level Summarizer (RAG)
-    high_level_llm = structured_llm(model, NoteSection.model_json_schema())
-    prompt = HIGH_LEVEL_PROMPT.format(
+    return await asyncio.to_thread(retrieve_docs, state, collection)
+
+def detail_schema() -> dict:
+    """
+    Return the JSON schema of a detail generator response (a list of NoteItems).
+
+    Returns:
+        dict: Array schema with NoteItem's $defs at the root.
+    """
+    # NoteItem is self-referencing, so its $defs must sit at the root for "#/$defs/NoteItem" to resolve
+    item_schema = NoteItem.model_json_schema()
+    return {
+        "type": "array",
+        "items": {"$ref": item_schema["$ref"]},
+        "$defs": item_schema["$defs"]
+    }
+
+def _detail_jobs(
+    state: WorkflowState,
+    section: str,
+    section_output: NoteSection,
+    gap_result: Dict,
+    max_queries: Optional[int] = None
+) -> List[Tuple[NoteItem, str, str, Optional[Dict]]]:
+    """
+    List (subitem, focus, query, gap) detail jobs; each job's details are attached to its NoteItem subitem.
+
+    Beyond max_queries, jobs answering a gap are kept before generic subitem queries.
+    """
+    jobs: List[Tuple[NoteItem, str, str, Optional[Dict]]] = []
+    for item in section_output.content:
+        for sub in item.subitems:
+            if not isinstance(sub, NoteItem):
+                # Details can only be attached to NoteItem subitems, so plain strings are not queried
+                continue
+            focus = sub.text
+            relevant_gaps = [gap for gap in gap_result.get("gaps", []) if focus.lower() in gap.get("query", "").lower()]
+            if relevant_gaps:
+                jobs.extend((sub, focus, gap["query"], gap) for gap in relevant_gaps)
+            else:
+                jobs.append((sub, focus, f"{focus} in the context of {section} for {state.topic}", None))
+    if max_queries is not None and len(jobs) > max_queries:
+        ranked = sorted(range(len(jobs)), key=lambda i: jobs[i][3] is None)
+        kept = sorted(ranked[:max_queries])
+        print(f"DEBUG: Capping detail queries for section '{section}' at {max_queries} of {len(jobs)}")
+        jobs = [jobs[i] for i in kept]
+    return jobs
+
+def _detail_prompt(state: WorkflowState, section: str, focus: str, detail_results: Dict[str, List], index: int) -> str:
+    """Format the detail prompt of one job from its retrieved passages."""
+    detail_data = pack_documents(detail_results["documents"][index], detail_results["metadatas"][index], prompt_budget("detail"))
+    return DETAIL_QUERY_PROMPT.format(
         section=section,
         topic=state.topic,
-        output_format=state.output_format,
-        structure=structure,
-        data="".join(doc_texts)
+        focus=focus,
+        data=detail_data
     )
+
+def _detail_items(detail_subitems: List[Dict], gap: Optional[Dict]) -> List[NoteItem]:
+    """Validate detail generator output, carrying over the gap's reasoning."""
+    for subitem in detail_subitems:
+        if gap:
+            subitem["reasoning"] = gap["reasoning"]
+    return [NoteItem.model_validate(s) for s in detail_subitems]
+
+def _attach_details(jobs: List[Tuple[NoteItem, str, str, Optional[Dict]]], results: List[Optional[List[NoteItem]]]) -> None:
+    """Attach detail results to their subitems in job order."""
+    # Later jobs for the same subitem replace earlier ones, as in sequential processing
+    for (sub, _, _, _), details in zip(jobs, results):
+        if details is not None:
+            sub.subitems = details
+
+def _detail_steps(
+    state: WorkflowState,
+    section: str,
+    section_output: NoteSection,
+    gap_result: Dict,
+    collection: chromadb.Collection,
+    model: Optional[str] = None,
+    max_queries: Optional[int] = None
+) -> Steps[None]:
+    """Expand a section's subitems, yielding the retrieval and LLM calls (see generate_details)."""
+    jobs = _detail_jobs(state, section, section_output, gap_result, max_queries)
+    if not jobs:
+        return
+
     try:
-        high_level_output = high_level_llm(prompt)
-        section_output = NoteSection.model_validate_json(high_level_output)
+        detail_results = yield blocking(
+            functools.partial(hybrid_query, sources=state.routed_sources or None),
+            collection, [query for _, _, query, _ in jobs], 3
+        )
     except Exception as e:
-        print(f"Error in high-level summarizer for section '{section}': {str(e)}")
-        return NoteSection(title=section, content=[], source="Unknown")
-    
-    # 2. Gap Evaluator (RAG)
-    gap_schema = {"type": "object", "properties": {
-        "gaps": {"type": "array", "items": {
-            "type": "object",
-            "properties": {
-                "missing": {"type": "string"},
-                "query": {"type": "string"},
-                "reasoning": {"type": "string"}
-            }
-        }}
-    }}
-    gap_llm = structured_llm(model, gap_schema)
-    gap_prompt = GAP_EVALUATOR_PROMPT.format(
+        print(f"Error retrieving details for section '{section}': {str(e)}")
+        return
+
+    prompts = [_detail_prompt(state, section, focus, detail_results, i) for i, (_, focus, _, _) in enumerate(jobs)]
+    responses = yield call(_llm_batch, _allm_batch, model, detail_schema(), "detail", prompts)
+    results: List[Optional[List[NoteItem]]] = []
+    for (_, focus, _, gap), response in zip(jobs, responses):
+        try:
+            if isinstance(response, Exception):
+                raise response
+            results.append(_detail_items(response, gap))
+        except Exception as e:
+            print(f"Error in detail generator for section '{section}', focus '{focus}': {str(e)}")
+            results.append(None)
+
+    _attach_details(jobs, results)
+    print(f"DEBUG: Generated details for {len(jobs)} focus queries in section '{section}'")
+
+def generate_details(
+    state: WorkflowState,
+    section: str,
+    section_output: NoteSection,
+    gap_result: Dict,
+    collection: chromadb.Collection,
+    model: Optional[str] = None,
+    max_queries: Optional[int] = None
+) -> None:
+    """
+    Expand the subitems of a summarized section with detail queries, in place.
+
+    All (focus, query, gap) jobs are collected first and retrieved together with one
+    hybrid_query call, so dose and drug-name queries also get BM25 matches. The detail
+    LLM calls then run concurrently (workflow_settings.max_concurrent_llm_calls) and
+    results are merged back in job order, so the resulting tree does not depend on
+    completion order.
+
+    Args:
+        state (WorkflowState): Current workflow state.
+        section (str): Section title being processed.
+        section_output (NoteSection): High-level summary whose subitems are expanded.
+        gap_result (Dict): Gap evaluator output with a 'gaps' list.
+        collection (chromadb.Collection): ChromaDB collection for document retrieval.
+        model (Optional[str]): LLM model name for every stage (default: each stage's routed model).
+        max_queries (Optional[int]): Cap on detail queries, gap-driven ones first (default: no cap).
+    """
+    run_steps(_detail_steps(state, section, section_output, gap_result, collection, model, max_queries))
+
+async def agenerate_details(
+    state: WorkflowState,
+    section: str,
+    section_output: NoteSection,
+    gap_result: Dict,
+    collection: chromadb.Collection,
+    model: Optional[str] = None,
+    max_queries: Optional[int] = None
+) -> None:
+    """
+    Async variant of generate_details; detail LLM calls run as concurrent tasks.
+
+    Args:
+        state (WorkflowState): Current workflow state.
+        section (str): Section title being processed.
+        section_output (NoteSection): High-level summary whose subitems are expanded.
+        gap_result (Dict): Gap evaluator output with a 'gaps' list.
+        collection (chromadb.Collection): ChromaDB collection for document retrieval.
+        model (Optional[str]): LLM model name for every stage (default: each stage's routed model).
+        max_queries (Optional[int]): Cap on detail queries, gap-driven ones first (default: no cap).
+    """
+    await arun_steps(_detail_steps(state, section, section_output, gap_result, collection, model, max_queries))
+
+def _worker_contexts(docs: List[Dict[str, str]], section: str, plan: Dict[str, Any]) -> Dict[str, str]:
+    """Pack a section's passages for each planned worker prompt within its token budget."""
+    stages = ["high_level"] + [stage for stage in ("gap", "optimizer") if plan[stage]]
+    # Each prompt gets its own token budget; the summarizer sees the most context
+    contexts = {stage: pack_context(docs, prompt_budget(stage)) for stage in stages}
+    print(f"DEBUG: Packed context for section '{section}': " + ", ".join(f"{stage} ~{estimate_tokens(text)} tokens" for stage, text in contexts.items()))
+    return contexts
+
+def _high_level_prompt(state: WorkflowState, section: str, structure: str, data: str) -> str:
+    """Format the high-level summarizer prompt."""
+    return HIGH_LEVEL_PROMPT.format(
+        section=section,
+        topic=state.topic,
+        output_format=state.output_format,
+        structure=structure,
+        data=data
+    )
+
+def _gap_prompt(state: WorkflowState, section: str, structure: str, section_output: NoteSection, data: str) -> str:
+    """Format the gap evaluator prompt."""
+    return GAP_EVALUATOR_PROMPT.format(
         section=section,
         topic=state.topic,
         structure=structure,
         summary=section_output.model_dump_json(),
-        data="".join(doc_texts)
+        data=data
     )
-    try:
-        gap_result = gap_llm(gap_prompt)
-    except Exception as e:
-        print(f"Error in gap evaluator for section '{section}': {str(e)}")
-        gap_result = {"gaps": []}
-    
-    # 3. Detail Generator (RAG)
-    detail_llm = structured_llm(model, {"type": "array", "items": NoteItem.model_json_schema()})
-    for item in section_output.content:
-        focus_points = [subitem.text if isinstance(subitem, NoteItem) else subitem for subitem in item.subitems]
-        for focus in focus_points:
-            relevant_gaps = [gap for gap in gap_result["gaps"] if focus.lower() in gap["query"].lower()]
-            queries = [gap["query"] for gap in relevant_gaps] or [f"{focus} in the context of {section} for {state.topic}"]
-            
-            for query, gap in [(q, g) for q in queries for g in relevant_gaps if g["query"] == q] or [(queries[0], None)]:
-                try:
-                    response = ollama.embed(model="mxbai-embed-large", input=query)
-                    detail_results = collection.query(query_embeddings=[response["embeddings"]], n_results=3)
-                    detail_docs = [
-                        {"text": doc, "source": meta["source"]}
-                        for doc, meta in zip(detail_results["documents"][0], detail_results["metadatas"][0])
-                    ]
-                    detail_data = "".join(doc["text"] for doc in detail_docs)
-                    
-                    detail_prompt = DETAIL_QUERY_PROMPT.format(
-                        section=section,
-                        topic=state.topic,
-                        focus=focus,
-                        data=detail_data
-                    )
-                    detail_subitems = detail_llm(detail_prompt)
-                    for subitem in detail_subitems:
-                        if gap:
-                            subitem["reasoning"] = gap["reasoning"]
-                    for sub in item.subitems:
-                        if isinstance(sub, NoteItem) and sub.text == focus:
-                            sub.subitems = [NoteItem.model_validate_json(json.dumps(s)) for s in detail_subitems]
-                except Exception as e:
-                    print(f"Error in detail generator for section '{section}', focus '{focus}': {str(e)}")
-    
-    # 4. Optimizer (RAG)
-    opt_llm = structured_llm(model, NoteSection.model_json_schema())
-    opt_prompt = OPTIMIZER_PROMPT.format(
+
+def _optimizer_prompt(
+    state: WorkflowState,
+    section: str,
+    structure: str,
+    gap_result: Dict,
+    high_level_output: Dict,
+    section_output: NoteSection,
+    data: str
+) -> str:
+    """Format the optimizer prompt."""
+    return OPTIMIZER_PROMPT.format(
         section=section,
         topic=state.topic,
         output_format=state.output_format,
         structure=structure,
         gaps=json.dumps(gap_result["gaps"]),
-        summary=high_level_output,
+        summary=json.dumps(high_level_output),
         details=section_output.model_dump_json(),
-        data="".join(doc_texts)
+        data=data
     )
+
+def _worker_steps(state: WorkflowState, section: str, collection: chromadb.Collection, model: Optional[str] = None) -> Steps[NoteSection]:
+    """Process one section, yielding the LLM and retrieval calls (see worker_node)."""
+    print(f"DEBUG: Entering worker_node for section '{section}'")
+    docs = section_docs(state, section)
+    if not docs:
+        print(f"Warning: No documents retrieved for section '{section}'")
+        return NoteSection(title=section, content=[], source="Unknown")
+    structure = state.section_structures.get(section, "Simple list")
+    plan = plan_stages(structure)
+    print(f"DEBUG: Stage plan for section '{section}': " + ", ".join(stage for stage in ("gap", "detail", "optimizer") if plan[stage]))
+    contexts = _worker_contexts(docs, section, plan)
+
+    # 1. High-Level Summarizer (RAG)
+    try:
+        high_level_output = yield _llm_call(
+            model, NoteSection.model_json_schema(), "high_level", _high_level_prompt(state, section, structure, contexts["high_level"])
+        )
+        section_output = NoteSection.model_validate(high_level_output)
+    except Exception as e:
+        print(f"Error in high-level summarizer for section '{section}': {str(e)}")
+        return NoteSection(title=section, content=[], source="Unknown")
+
+    # 2. Gap Evaluator (RAG)
+    gap_result = {"gaps": []}
+    if plan["gap"]:
+        try:
+            gap_result = yield _llm_call(model, GAP_SCHEMA, "gap", _gap_prompt(state, section, structure, section_output, contexts["gap"]))
+        except Exception as e:
+            print(f"Error in gap evaluator for section '{section}': {str(e)}")
+            gap_result = {"gaps": []}
+
+    # 3. Detail Generator (RAG)
+    if plan["detail"]:
+        with span("worker.detail", section=section):
+            yield from _detail_steps(state, section, section_output, gap_result, collection, model, plan["max_detail_queries"])
+
+    # 4. Optimizer (RAG)
+    if not _run_optimizer(plan, gap_result, section):
+        return section_output
+    opt_prompt = _optimizer_prompt(state, section, structure, gap_result, high_level_output, section_output, contexts["optimizer"])
     try:
-        final_output = opt_llm(opt_prompt)
-        return NoteSection.model_validate_json(final_output)
+        final_output = yield _llm_call(model, NoteSection.model_json_schema(), "optimizer", opt_prompt)
+        return NoteSection.model_validate(final_output)
     except Exception as e:
         print(f"Warning: Validation error in optimizer for section '{section}': {str(e)}")
         return section_output
 
-def generate_markdown(state: WorkflowState) -> str:
+def worker_node(state: WorkflowState, section: str, collection: chromadb.Collection, model: Optional[str] = None) -> NoteSection:
     """
-    Generate markdown output from workflow state.
+    Process a single section using RAG for summarization, gap evaluation, and optimization.
+
+    Retrieved passages are packed per prompt within context_settings token budgets,
+    deduplicated and labeled with their source (see src.utils.context). Which stages
+    run after the high-level summary is decided per section by plan_stages.
 
     Args:
-        state (WorkflowState): Workflow state with sections.
+        state (WorkflowState): Current workflow state.
+        section (str): Section title to process.
+        collection (chromadb.Collection): ChromaDB collection for document retrieval.
+        model (Optional[str]): LLM model name for every stage (default: each stage's routed model).
 
     Returns:
-        str: Formatted markdown string.
+        NoteSection: Processed section with structured content.
+    """
+    return run_steps(_worker_steps(state, section, collection, model))
+
+async def aworker_node(state: WorkflowState, section: str, collection: chromadb.Collection, model: Optional[str] = None) -> NoteSection:
     """
-    markdown = f"# Notes on {state.topic}\n\n"
-    def format_item(item: Union[NoteItem, str], level: int = 0) -> str:
-        indent = "  " * level
-        if isinstance(item, str):
-            return f"{indent}- {item}\n"
-        result = f"{indent}- {item.text}\n"
+    Async variant of worker_node.
+
+    Args:
+        state (WorkflowState): Current workflow state.
+        section (str): Section title to process.
+        collection (chromadb.Collection): ChromaDB collection for document retrieval.
+        model (Optional[str]): LLM model name for every stage (default: each stage's routed model).
+
+    Returns:
+        NoteSection: Processed section with structured content.
+    """
+    return await arun_steps(_worker_steps(state, section, collection, model))
+
+def _markdown_item(item: Union[NoteItem, str], lines: List[str], level: int = 0) -> None:
+    """Append the markdown lines of a note item and its subitems."""
+    indent = "  " * level
+    if isinstance(item, str):
+        lines.append(f"{indent}- {item}\n")
+        return
+    lines.append(f"{indent}- {item.text}\n")
+    if item.source:
+        lines.append(f"{indent}  *Source*: {item.source}\n")
+    if item.quote:
+        lines.append(f"{indent}  *Quote*: {item.quote}\n")
+    if item.reasoning:
+        lines.append(f"{indent}  *Reasoning*: {item.reasoning}\n")
+    for subitem in item.subitems:
+        _markdown_item(subitem, lines, level + 1)
+
+def _org_item(item: Union[NoteItem, str], lines: List[str], level: int = 0) -> None:
+    """Append the org-mode lines of a note item and its subitems."""
+    indent = "  " * level
+    if isinstance(item, str):
+        lines.append(f"{indent}- {item}\n")
+        return
+    lines.append(f"{indent}- {item.text}\n")
+    if item.source or item.quote or item.reasoning:
+        lines.append(f"{indent}  :PROPERTIES:\n")
         if item.source:
-            result += f"{indent}  *Source*: {item.source}\n"
+            lines.append(f"{indent}  :Source: {item.source}\n")
         if item.quote:
-            result += f"{indent}  *Quote*: {item.quote}\n"
+            lines.append(f"{indent}  :Quote: {item.quote}\n")
         if item.reasoning:
-            result += f"{indent}  *Reasoning*: {item.reasoning}\n"
-        for subitem in item.subitems:
-            result += format_item(subitem, level + 1)
-        return result
-    
-    for section in state.sections:
-        markdown += f"## {section.title}\n<details>\n<summary>View {section.title}</summary>\n\n"
+            lines.append(f"{indent}  :Reasoning: {item.reasoning}\n")
+        lines.append(f"{indent}  :END:\n")
+    for subitem in item.subitems:
+        _org_item(subitem, lines, level + 1)
+
+def render_header(topic: str, output_format: str) -> str:
+    """
+    Render the title of a note.
+
+    Args:
+        topic (str): Medical topic.
+        output_format (str): Output format ('markdown' or 'org').
+
+    Returns:
+        str: Title line followed by a blank line.
+    """
+    if output_format == "markdown":
+        return f"# Notes on {topic}\n\n"
+    return f"* Notes on {topic}\n\n"
+
+def render_section(section: NoteSection, output_format: str) -> str:
+    """
+    Render one note section.
+
+    Args:
+        section (NoteSection): Processed section.
+        output_format (str): Output format ('markdown' or 'org').
+
+    Returns:
+        str: The formatted section.
+    """
+    if output_format == "markdown":
+        lines = [f"## {section.title}\n<details>\n<summary>View {section.title}</summary>\n\n"]
+        for item in section.content:
+            _markdown_item(item, lines)
+        lines.append(f"*Primary Source*: {section.source}\n\n</details>\n\n")
+    else:
+        lines = [f"** {section.title}\n"]
         for item in section.content:
-            markdown += format_item(item)
-        markdown += f"*Primary Source*: {section.source}\n\n</details>\n\n"
-    return markdown
+            _org_item(item, lines)
+        lines.append(f"  - *Primary Source*: {section.source}\n\n")
+    return "".join(lines)
+
+def generate_markdown(state: WorkflowState) -> str:
+    """
+    Generate markdown output from workflow state.
+
+    Args:
+        state (WorkflowState): Workflow state with sections.
+
+    Returns:
+        str: Formatted markdown string.
+    """
+    return render_header(state.topic, "markdown") + "".join(render_section(section, "markdown") for section in state.sections)
 
 def generate_org_mode(state: WorkflowState) -> str:
     """
@@ -278,32 +973,9 @@ def generate_org_mode(state: WorkflowState) -> str:
     Returns:
         str: Formatted org-mode string.
     """
-    org = f"* Notes on {state.topic}\n\n"
-    def format_item_org(item: Union[NoteItem, str], level: int = 0) -> str:
-        indent = "  " * level
-        if isinstance(item, str):
-            return f"{indent}- {item}\n"
-        result = f"{indent}- {item.text}\n"
-        if item.source or item.quote or item.reasoning:
-            result += f"{indent}  :PROPERTIES:\n"
-            if item.source:
-                result += f"{indent}  :Source: {item.source}\n"
-            if item.quote:
-                result += f"{indent}  :Quote: {item.quote}\n"
-            if item.reasoning:
-                result += f"{indent}  :Reasoning: {item.reasoning}\n"
-            result += f"{indent}  :END:\n"
-        for subitem in item.subitems:
-            result += format_item_org(subitem, level + 1)
-        return result
-    
-    for section in state.sections:
-        org += f"** {section.title}\n"
-        for item in section.content:
-            org += format_item_org(item)
-        org += f"  - *Primary Source*: {section.source}\n\n"
-    return org
+    return render_header(state.topic, "org") + "".join(render_section(section, "org") for section in state.sections)
 
+@traced("node.generate_output")
 def generate_output(state: WorkflowState) -> str:
     """
     Generate output in the specified format.
@@ -1,10 +1,12 @@
 ORCHESTRATOR_PROMPT = """You are an Orchestrator for medical note generation in a Zettelkasten format.
-Task: Identify sections for a medical note on the topic '{topic}' based on type '{note_type}' (e.g., 'condition' or 'complaint'). Use the provided data to inform section choices:
+Task: Identify sections for a medical note on the topic '{topic}' based on type '{note_type}' (e.g., 'condition', 'complaint' or 'drug'). Use the provided data (the section template, when given, and the headings of articles about the topic) to inform section choices:
 {data}
 
 Instructions:
 - For 'condition', prioritize these sections if relevant to the data: Definition, Epidemiology, Pathophysiology, Clinical Features, Signs, Investigations (Ix), Diagnosis (Dx), Management (Mx), Complications, and topic-specific headers (e.g., 'Risk Factors for {topic}').
 - For 'complaint', prioritize these sections if relevant to the data: Definition, Epidemiology, Differential Diagnosis (DDx), Salient Points of History (Hx), Physical Examination (P/E), Investigations (Ix), Management (Mx).
+- For 'drug', prioritize these sections if relevant to the data: Class, Mechanism of Action, Route of Administration, Indications, Dosing, Cautions, Side Effects, Monitoring.
+- When a section template is provided, keep its sections and structures unless the data shows a section does not apply, and add topic-specific sections the data supports.
 - For Investigations (Ix), structure as a nested list by test categories (e.g., routine bloods, microbiology, endoscopy, imaging).
 - For Management (Mx), structure as a nested list by principles, goals, modalities (e.g., dietary, pharmacological), and specific treatments (e.g., medications, mechanism of action, dosing, indications, side effects).
 - Only include sections supported by the data or highly relevant to the topic and note type. Add topic-specific sections (e.g., 'Initial Drug Therapy for {topic}') if the data suggests them.
@@ -142,4 +144,105 @@ Example for valid 'Clinical Features' with structure 'Simple list':
   "feedback": ["All points grounded", "Correct formatting", "All subtopics covered"],
   "follow_up_questions": []
 }}
-"""
\ No newline at end of file
+"""
+
+HIGH_LEVEL_PROMPT = """You are a medical note-taking assistant generating a high-level summary for the '{section}' section of '{topic}' in {output_format} format.
+- Use only the provided data to create a concise overview.
+- Structure according to: {structure}
+- Format as a nested bullet-point list with *bold* or _underscore_ for key terms (e.g., *IBS*, _serotonin_).
+- Append a colon (:) to items with intended subitems (e.g., '*Pathophysiology of IBS*:').
+- Support up to two levels of nesting.
+- Avoid hallucination: every point must be supported by the data.
+- Include source (JSON file name) for each point.
+Data: {data}
+Output format: JSON conforming to the NoteSection schema.
+Example:
+{{
+  "title": "Mx",
+  "content": [
+    {{
+      "text": "*Principles* - Symptom relief and improved *quality of life*:",
+      "subitems": [],
+      "source": "article1.json"
+    }},
+    {{
+      "text": "*Modalities* - Dietary, pharmacological, psychological:",
+      "subitems": [],
+      "source": "article1.json"
+    }}
+  ],
+  "source": "article1.json"
+}}
+"""
+
+GAP_EVALUATOR_PROMPT = """You are a Gap Evaluator for medical note accuracy in the '{section}' section of '{topic}'.
+- Review the high-level summary and identify missing details according to the structure: {structure}
+- Suggest specific follow-up queries for missing details (e.g., for Ix: specific test results; for Mx: medication MOA, dosing).
+- Provide reasoning for each gap (e.g., 'Missing dosing information for rifaximin').
+Generated summary: {summary}
+Data: {data}
+Output format: JSON with gaps and queries.
+Example:
+{{
+  "gaps": [
+    {{
+      "missing": "Dosing for rifaximin in *IBS-D*.",
+      "query": "Rifaximin dosing for IBS-D",
+      "reasoning": "High-level summary mentions rifaximin but lacks dosing details."
+    }}
+  ]
+}}
+"""
+
+DETAIL_QUERY_PROMPT = """You are generating detailed subpoints for the '{section}' section of '{topic}', focusing on '{focus}'.
+- Use only the provided data to extract specific details (e.g., for Ix: test results; for Mx: medication MOA, dosing, indications, side effects).
+- Format as a list of bullet points with *bold* or _underscore_ for key terms.
+- Include source (JSON file name) and a direct quote where applicable.
+- Provide reasoning for including each detail (e.g., 'Included to specify dosing').
+Data: {data}
+Output format: JSON list of NoteItem objects.
+Example:
+[
+  {{
+    "text": "_Rifaximin_: For *SIBO*-related *IBS*.",
+    "subitems": [
+      {{"text": "*MOA*: Non-absorbable antibiotic.", "subitems": [], "source": "article1.json", "reasoning": "Included to clarify mechanism."}},
+      {{"text": "*Dosing*: 550 mg three times daily for 14 days.", "subitems": [], "source": "article1.json", "reasoning": "Included to specify dosing."}}
+    ],
+    "source": "article1.json",
+    "quote": "Rifaximin is effective for IBS-D with SIBO.",
+    "reasoning": "Included to detail treatment for SIBO."
+  }}
+]
+"""
+
+OPTIMIZER_PROMPT = """You are an Optimizer for medical note clarity and accuracy in {output_format} format.
+- Combine and refine the '{section}' section for '{topic}' based on high-level summary, detailed subpoints, and gap evaluator feedback, with structure '{structure}'.
+- Ensure:
+  - **Clarity and conciseness**: Clear, precise language without redundancy.
+  - **Structure**: Nested list with *bold* or _underscore_ for key terms, colons (:) for items with subitems.
+  - **Completeness**: Include all relevant data, addressing gap feedback.
+  - **Accuracy**: Eliminate hallucination by adhering to the data.
+  - **Source attribution**: Retain or add source references, quotes, and reasoning for each point.
+Gap feedback: {gaps}
+High-level summary: {summary}
+Detailed subpoints: {details}
+Data: {data}
+Output format: JSON conforming to the NoteSection schema.
+"""
+
+CHUNK_TAGGING_PROMPT = """You are classifying passages of medical reference articles by the note sections they provide evidence for.
+
+Sections:
+{sections}
+
+Passages:
+{passages}
+
+Instructions:
+- For each passage, list the titles of the sections it contains useful information for, exactly as written above.
+- A passage may support several sections, or none (use an empty list for references, navigation text or unrelated content).
+- Output a JSON object with a 'tags' key containing one object per passage with its 'passage' number and 'sections' list.
+
+{schema}
+"""
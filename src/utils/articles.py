@@ -0,0 +1,230 @@
+import re
+import threading
+import chromadb
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from src.utils.config import get_setting
+from src.utils.embeddings import (
+    open_collection, embed_in_batches, embed_texts, content_hash, collection_db_path,
+    embedding_mismatch, record_embedding_model
+)
+from src.utils.routing import stage_route, EMBEDDING_STAGE
+from src.utils.lexical import TOKEN, STOPWORDS
+from src.utils.instrumentation import span
+from src.utils.dedup import SOURCE_SEPARATOR
+
+HEADING = re.compile(r"^#{1,6}\s+(.+?)\s*#*\s*$", re.MULTILINE)
+
+# Article collections by (persistence directory, name), opened once per process
+_article_collections: Dict[Tuple[str, str], chromadb.Collection] = {}
+_article_collections_lock = threading.Lock()
+
+def article_collection_name(collection_name: Optional[str] = None) -> str:
+    """
+    Return the name of the article-level collection that routes a chunk collection.
+
+    Args:
+        collection_name (Optional[str]): Chunk collection (default: ingestion_settings.collection_name).
+
+    Returns:
+        str: Collection name such as 'notes_articles'.
+    """
+    return f"{collection_name or get_setting('ingestion_settings', 'collection_name', 'notes')}_articles"
+
+def article_collection(collection: chromadb.Collection) -> Optional[chromadb.Collection]:
+    """
+    Return the article collection stored next to a chunk collection.
+
+    Args:
+        collection (chromadb.Collection): Chunk collection.
+
+    Returns:
+        Optional[chromadb.Collection]: Its article collection, or None if there is none.
+    """
+    key = (collection_db_path(collection), article_collection_name(collection.name))
+    with _article_collections_lock:
+        if key not in _article_collections:
+            try:
+                _article_collections[key] = chromadb.PersistentClient(path=key[0]).get_collection(key[1])
+            except Exception:
+                return None
+        return _article_collections[key]
+
+def summarize_articles(
+    records: Iterable[Tuple[str, str, Dict[str, Any]]],
+    articles: Dict[str, Dict[str, Any]]
+) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+    """
+    Pass records through unchanged while summarizing each source article.
+
+    Records of a source arrive together (see iter_json_records), so word counts are
+    kept for one article at a time. Each summary holds the article title, topic
+    keywords and the opening routing_settings.summary_chars characters of its text.
+
+    Args:
+        records (Iterable[Tuple[str, str, Dict[str, Any]]]): (text, source, metadata) records.
+        articles (Dict[str, Dict[str, Any]]): Filled with 'title', 'url', 'keywords' and
+            'summary' per source as the records are consumed.
+
+    Yields:
+        Tuple[str, str, Dict[str, Any]]: The input records.
+    """
+    summary_chars = get_setting("routing_settings", "summary_chars", 1000)
+    keyword_limit = get_setting("routing_settings", "keywords", 8)
+    current: Optional[str] = None
+    counts: Counter = Counter()
+
+    def finish() -> None:
+        if current is None:
+            return
+        article = articles[current]
+        article["keywords"] = [word for word, _ in counts.most_common(keyword_limit)]
+        article["summary"] = "\n".join(
+            part for part in (article["title"], "Keywords: " + ", ".join(article["keywords"]), article.pop("lead")) if part
+        )
+
+    for text, source, metadata in records:
+        if source != current:
+            finish()
+            current = source
+            counts = Counter()
+            heading = HEADING.search(text)
+            title = metadata.get("title") or (heading.group(1) if heading else source.rsplit("/", 1)[-1].rsplit(".", 1)[0])
+            articles[source] = {"title": title, "url": metadata.get("url"), "lead": ""}
+        article = articles[source]
+        if len(article["lead"]) < summary_chars:
+            article["lead"] = (article["lead"] + "\n" + text).strip()[:summary_chars]
+        counts.update(
+            word for word in (token.lower() for token in TOKEN.findall(text))
+            if len(word) > 3 and not word.isdigit() and word not in STOPWORDS
+        )
+        yield text, source, metadata
+    finish()
+
+def _see_also(article: Dict[str, Any]) -> Optional[str]:
+    """Join the sources holding an article's deduplicated chunks, or None if there are none."""
+    return SOURCE_SEPARATOR.join(article["see_also"]) if article.get("see_also") else None
+
+def store_articles(
+    articles: Dict[str, Dict[str, Any]],
+    db_path: Optional[str] = None,
+    collection_name: Optional[str] = None,
+    prune: bool = False,
+    unloaded: Optional[Set[str]] = None
+) -> Optional[chromadb.Collection]:
+    """
+    Embed article summaries into the article-level collection.
+
+    Articles are stored under their source, with title, url, keywords and a content
+    hash as metadata; only summaries whose hash changed are embedded again. The
+    embedding model is recorded in the collection metadata, and a collection embedded
+    with another model is rebuilt (see src.utils.embeddings.embedding_mismatch). An
+    article's 'see_also' lists the sources holding chunks deduplicated from it (see
+    src.utils.dedup), so routing to it also searches them.
+
+    Args:
+        articles (Dict[str, Dict[str, Any]]): Summaries from summarize_articles.
+        db_path (Optional[str]): ChromaDB persistence directory (default: ingestion_settings.db_path).
+        collection_name (Optional[str]): Chunk collection the articles route (default: ingestion_settings.collection_name).
+        prune (bool): Delete articles whose source is absent from articles (default: False).
+        unloaded (Optional[Set[str]]): Sources that failed to load; never pruned.
+
+    Returns:
+        Optional[chromadb.Collection]: Article collection, or None if there were no articles.
+    """
+    if not articles:
+        return None
+    client, collection = open_collection(db_path, article_collection_name(collection_name))
+    model = stage_route(EMBEDDING_STAGE)["model"]
+    mismatch = embedding_mismatch(collection, model)
+    if mismatch:
+        print(f"Warning: {mismatch}; re-embedding every article summary")
+        client.delete_collection(collection.name)
+        collection = client.get_or_create_collection(name=collection.name)
+    with _article_collections_lock:
+        _article_collections[(collection_db_path(collection), collection.name)] = collection
+    sources = list(articles)
+    stored = collection.get(ids=sources, include=["metadatas"])
+    stored_metadata = {id_: meta or {} for id_, meta in zip(stored["ids"], stored["metadatas"] or [])}
+    pending = [
+        source for source in sources
+        if stored_metadata.get(source, {}).get("content_hash") != content_hash(articles[source]["summary"])
+    ]
+    # Unchanged summaries whose duplicate sources changed only need a metadata update
+    relinked = [
+        source for source in sources
+        if source in stored_metadata and source not in pending
+        and stored_metadata[source].get("see_also") != _see_also(articles[source])
+    ]
+
+    dimension = None
+    with span("ingest.articles", articles=len(sources), embedded=len(pending)):
+        for offset, size, vectors in embed_in_batches([articles[source]["summary"] for source in pending], model):
+            if vectors is None:
+                continue
+            dimension = len(vectors[0])
+            batch = pending[offset:offset + size]
+            metadatas = []
+            for source in batch:
+                article = articles[source]
+                metadata = {
+                    "source": source,
+                    "title": article["title"],
+                    "keywords": ", ".join(article["keywords"]),
+                    "content_hash": content_hash(article["summary"])
+                }
+                if article.get("url"):
+                    metadata["url"] = article["url"]
+                if _see_also(article):
+                    metadata["see_also"] = _see_also(article)
+                metadatas.append(metadata)
+            collection.upsert(
+                ids=batch,
+                embeddings=vectors,
+                documents=[articles[source]["summary"] for source in batch],
+                metadatas=metadatas
+            )
+        if relinked:
+            collection.update(ids=relinked, metadatas=[{"see_also": _see_also(articles[source])} for source in relinked])
+        if prune:
+            kept = set(articles) | (unloaded or set())
+            stale = [id_ for id_ in collection.get(include=[])["ids"] if id_ not in kept]
+            if stale:
+                collection.delete(ids=stale)
+                print(f"DEBUG: Deleted {len(stale)} stale article summaries")
+        record_embedding_model(collection, model, dimension)
+    print(f"DEBUG: Article routing index holds {collection.count()} articles ({len(pending)} embedded)")
+    return collection
+
+def route_articles(collection: chromadb.Collection, query: str, top_k: Optional[int] = None) -> List[str]:
+    """
+    Route a query to its most relevant articles.
+
+    Args:
+        collection (chromadb.Collection): Chunk collection; its article collection lives next to it.
+        query (str): Free-text query (e.g., the note topic).
+        top_k (Optional[int]): Articles to keep (default: routing_settings.top_k_articles).
+
+    Returns:
+        List[str]: Sources of the top articles and their 'see_also' sources, or an empty list when routing is disabled,
+        there is no article collection, or it holds no more than top_k articles (routing
+        would keep everything).
+    """
+    if not get_setting("routing_settings", "enabled", True):
+        return []
+    top_k = top_k or get_setting("routing_settings", "top_k_articles", 8)
+    articles = article_collection(collection)
+    if articles is None or articles.count() <= top_k:
+        return []
+    with span("route.articles", top_k=top_k) as attrs:
+        results = articles.query(query_embeddings=embed_texts([query]), n_results=top_k, include=["metadatas"])
+        sources = []
+        for id_, meta in zip(results["ids"][0], results["metadatas"][0]):
+            meta = meta or {}
+            sources.append(meta.get("source", id_))
+            # Chunks deduplicated from this article are stored under the sources that kept them
+            sources.extend(meta["see_also"].split(SOURCE_SEPARATOR) if meta.get("see_also") else [])
+        sources = list(dict.fromkeys(sources))
+        attrs["articles"] = len(results["ids"][0])
+    print(f"DEBUG: Routed '{query}' to {len(sources)} articles: {', '.join(sources)}")
+    return sources
@@ -0,0 +1,428 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from src.utils.config import get_setting
+
+CACHE_MODES = ("use", "refresh", "bypass")
+
+class SqliteCache:
+    """
+    Thread-safe on-disk key-value cache with size-based LRU eviction.
+
+    Values are stored as BLOBs in a single SQLite table. Every read refreshes the
+    entry's access time; when the total stored size exceeds max_bytes, the least
+    recently used entries are evicted until the cache is back under 90% of the limit.
+    """
+
+    def __init__(self, path: str, table: str = "entries", max_bytes: int = 512 * 1024 * 1024):
+        """
+        Open (or create) a cache database.
+
+        Args:
+            path (str): SQLite database file path.
+            table (str): Table holding the entries, allowing several caches per file.
+            max_bytes (int): Maximum total size of stored values before eviction.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.table = table
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()[0]
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Look up a value and mark it as recently used.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            Optional[bytes]: Stored value, or None on a miss.
+        """
+        with self._lock:
+            row = self._conn.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, value: bytes) -> None:
+        """
+        Store a value, evicting least recently used entries if the cache is full.
+
+        Args:
+            key (str): Cache key.
+            value (bytes): Value to store.
+        """
+        self.set_many([(key, value)])
+
+    def set_many(self, items: Sequence[Tuple[str, bytes]]) -> None:
+        """
+        Store several values in one transaction, evicting if the cache is full.
+
+        Args:
+            items (Sequence[Tuple[str, bytes]]): Key and value pairs to store.
+        """
+        now = time.time()
+        with self._lock:
+            for key, value in items:
+                previous = self._conn.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                    (key, value, len(value), now)
+                )
+                self._total_bytes += len(value) - (previous[0] if previous else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+            self._conn.commit()
+
+    def _evict(self, target_bytes: int) -> None:
+        """Delete least recently used entries until the total size is at most target_bytes."""
+        evicted = 0
+        rows = self._conn.execute(f"SELECT key, size FROM {self.table} ORDER BY last_access").fetchall()
+        for key, size in rows:
+            if self._total_bytes <= target_bytes:
+                break
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._total_bytes -= size
+            evicted += 1
+        print(f"DEBUG: Evicted {evicted} entries from cache '{self.path}:{self.table}'")
+
+    def clear(self) -> None:
+        """Remove every entry and reset the counters."""
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+            self._total_bytes = 0
+            self.hits = self.misses = 0
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Summarize cache usage.
+
+        Returns:
+            Dict[str, Any]: Entry count, stored bytes, size limit, and hit/miss counters.
+        """
+        with self._lock:
+            entries = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "table": self.table,
+            "entries": entries,
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+def llm_cache_key(model: str, schema: Any, options: Optional[Dict[str, Any]], prompt: str) -> str:
+    """
+    Build the cache key for a structured LLM call.
+
+    Args:
+        model (str): LLM model name.
+        schema (Any): JSON schema passed as the response format.
+        options (Optional[Dict[str, Any]]): Ollama generation options.
+        prompt (str): User prompt.
+
+    Returns:
+        str: Hex SHA-256 digest of the canonical JSON encoding of the inputs.
+    """
+    payload = json.dumps(
+        {"model": model, "schema": schema, "options": options or {}, "prompt": prompt},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    Two-level cache of embedding vectors: an in-memory LRU in front of a SqliteCache.
+
+    Keys combine the model name with whitespace-normalized text. Vectors are kept as
+    float32 arrays in memory and as their raw bytes on disk.
+    """
+
+    def __init__(self, store: Optional[SqliteCache] = None, max_memory_entries: int = 4096):
+        """
+        Create an embedding cache.
+
+        Args:
+            store (Optional[SqliteCache]): Persistent backing store, or None for memory only.
+            max_memory_entries (int): Vectors kept in the in-memory LRU.
+        """
+        self.store = store
+        self.max_memory_entries = max_memory_entries
+        self.memory_hits = 0
+        self._memory: "OrderedDict[str, array]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        """
+        Build the cache key for a text embedded with a model.
+
+        Args:
+            model (str): Embedding model name.
+            text (str): Text to embed.
+
+        Returns:
+            str: Hex SHA-256 digest of the model and normalized text.
+        """
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{model}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: array) -> None:
+        """Insert a vector into the in-memory LRU, evicting the oldest entry if full."""
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        Look up cached vectors for several texts.
+
+        Args:
+            model (str): Embedding model name.
+            texts (Sequence[str]): Texts to look up.
+
+        Returns:
+            List[Optional[List[float]]]: Vector per text, or None where it is not cached.
+        """
+        results: List[Optional[List[float]]] = []
+        for text in texts:
+            key = self.key(model, text)
+            with self._lock:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+            if vector is None and self.store is not None:
+                stored = self.store.get(key)
+                if stored is not None:
+                    vector = array("f")
+                    vector.frombytes(stored)
+                    self._remember(key, vector)
+            results.append(vector.tolist() if vector is not None else None)
+        return results
+
+    def set_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """
+        Store vectors for several texts.
+
+        Args:
+            model (str): Embedding model name.
+            texts (Sequence[str]): Embedded texts.
+            vectors (Sequence[Sequence[float]]): Their embedding vectors.
+        """
+        items = []
+        for text, values in zip(texts, vectors):
+            key = self.key(model, text)
+            vector = array("f", values)
+            self._remember(key, vector)
+            items.append((key, vector.tobytes()))
+        if self.store is not None:
+            self.store.set_many(items)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Summarize cache usage.
+
+        Returns:
+            Dict[str, Any]: In-memory size and hits, plus the persistent store statistics.
+        """
+        with self._lock:
+            stats = {"memory_entries": len(self._memory), "memory_hits": self.memory_hits}
+        if self.store is not None:
+            stats.update(self.store.stats())
+        return stats
+
+# Persistent caches by cache_settings prefix: (table, default path)
+CACHE_FILES = {
+    "llm_cache": ("llm_responses", "./cache/llm_cache.sqlite"),
+    "embedding_cache": ("embeddings", "./cache/embedding_cache.sqlite"),
+    "plan_cache": ("section_plans", "./cache/plan_cache.sqlite"),
+    "section_cache": ("sections", "./cache/section_cache.sqlite")
+}
+
+def read_cache_stats(name: str) -> Optional[Dict[str, Any]]:
+    """
+    Read a persistent cache's statistics without opening or creating it.
+
+    Args:
+        name (str): Cache name from CACHE_FILES (e.g., 'llm_cache').
+
+    Returns:
+        Optional[Dict[str, Any]]: Path, table, entry count and stored bytes, or None
+        when the cache file does not exist.
+    """
+    table, default_path = CACHE_FILES[name]
+    path = get_setting("cache_settings", f"{name}_path", default_path)
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True, timeout=30)
+    try:
+        entries, size = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {table}").fetchone()
+    except sqlite3.OperationalError:
+        entries, size = 0, 0
+    finally:
+        conn.close()
+    return {"path": path, "table": table, "entries": entries, "bytes": size}
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_llm_cache: Optional[SqliteCache] = None
+_llm_cache_mode: Optional[str] = None
+_plan_cache: Optional[SqliteCache] = None
+_section_cache: Optional[SqliteCache] = None
+_llm_cache_lock = threading.Lock()
+
+def get_llm_cache() -> Optional[SqliteCache]:
+    """
+    Return the shared LLM response cache configured in cache_settings.
+
+    Returns:
+        Optional[SqliteCache]: The cache, or None when caching is disabled.
+    """
+    global _llm_cache
+    if not get_setting("cache_settings", "llm_cache_enabled", True):
+        return None
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = SqliteCache(
+                get_setting("cache_settings", "llm_cache_path", "./cache/llm_cache.sqlite"),
+                table="llm_responses",
+                max_bytes=int(get_setting("cache_settings", "llm_cache_max_mb", 512) * 1024 * 1024)
+            )
+    return _llm_cache
+
+def get_llm_cache_mode() -> str:
+    """
+    Return how structured LLM calls use the cache.
+
+    'use' reads and writes the cache, 'refresh' ignores stored responses but writes new
+    ones, and 'bypass' neither reads nor writes.
+
+    Returns:
+        str: The active cache mode.
+    """
+    return _llm_cache_mode or get_setting("cache_settings", "llm_cache_mode", "use")
+
+def set_llm_cache_mode(mode: str) -> None:
+    """
+    Override the configured LLM cache mode for this process.
+
+    Args:
+        mode (str): One of 'use', 'refresh' or 'bypass'.
+
+    Raises:
+        ValueError: If mode is not a known cache mode.
+    """
+    global _llm_cache_mode
+    if mode not in CACHE_MODES:
+        raise ValueError(f"Unknown cache mode '{mode}', expected one of {CACHE_MODES}")
+    _llm_cache_mode = mode
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Return the shared embedding cache configured in cache_settings.
+
+    Returns:
+        Optional[EmbeddingCache]: The cache, or None when caching is disabled.
+    """
+    global _embedding_cache
+    if not get_setting("cache_settings", "embedding_cache_enabled", True):
+        return None
+    with _llm_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache(
+                SqliteCache(
+                    get_setting("cache_settings", "embedding_cache_path", "./cache/embedding_cache.sqlite"),
+                    table="embeddings",
+                    max_bytes=int(get_setting("cache_settings", "embedding_cache_max_mb", 1024) * 1024 * 1024)
+                ),
+                max_memory_entries=get_setting("cache_settings", "embedding_memory_entries", 4096)
+            )
+    return _embedding_cache
+
+def get_plan_cache() -> Optional[SqliteCache]:
+    """
+    Return the shared section plan cache configured in cache_settings.
+
+    Returns:
+        Optional[SqliteCache]: The cache, or None when plan caching is disabled.
+    """
+    global _plan_cache
+    if not get_setting("cache_settings", "plan_cache_enabled", True):
+        return None
+    with _llm_cache_lock:
+        if _plan_cache is None:
+            _plan_cache = SqliteCache(
+                get_setting("cache_settings", "plan_cache_path", "./cache/plan_cache.sqlite"),
+                table="section_plans",
+                max_bytes=int(get_setting("cache_settings", "plan_cache_max_mb", 16) * 1024 * 1024)
+            )
+    return _plan_cache
+
+def get_section_cache() -> Optional[SqliteCache]:
+    """
+    Return the shared section result cache configured in cache_settings.
+
+    Returns:
+        Optional[SqliteCache]: The cache, or None when section caching is disabled.
+    """
+    global _section_cache
+    if not get_setting("cache_settings", "section_cache_enabled", True):
+        return None
+    with _llm_cache_lock:
+        if _section_cache is None:
+            _section_cache = SqliteCache(
+                get_setting("cache_settings", "section_cache_path", "./cache/section_cache.sqlite"),
+                table="sections",
+                max_bytes=int(get_setting("cache_settings", "section_cache_max_mb", 256) * 1024 * 1024)
+            )
+    return _section_cache
+
+def reset_caches() -> None:
+    """Close the shared caches so the next access reopens them from the current settings."""
+    global _embedding_cache, _llm_cache, _plan_cache, _section_cache
+    with _llm_cache_lock:
+        if _llm_cache is not None:
+            _llm_cache.close()
+        if _embedding_cache is not None and _embedding_cache.store is not None:
+            _embedding_cache.store.close()
+        for cache in (_plan_cache, _section_cache):
+            if cache is not None:
+                cache.close()
+        _llm_cache = _embedding_cache = _plan_cache = _section_cache = None
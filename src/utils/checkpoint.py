@@ -0,0 +1,132 @@
+import os
+import re
+import sqlite3
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+from src.utils.config import get_setting
+from src.models import NoteItem, NoteSection, SectionTask, WorkflowState
+
+try:
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+except ImportError:  # older langgraph-checkpoint releases
+    JsonPlusSerializer = None
+
+try:
+    from langgraph.checkpoint.sqlite import SqliteSaver
+except ImportError:  # langgraph-checkpoint-sqlite is optional
+    SqliteSaver = None
+
+try:
+    import aiosqlite
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+except ImportError:  # the async saver also needs aiosqlite
+    AsyncSqliteSaver = None
+
+# Workflow state models stored in checkpoints; msgpack revives only allow-listed types
+CHECKPOINT_TYPES = (NoteItem, NoteSection, SectionTask, WorkflowState)
+
+def default_run_id(topic: str, note_type: str, output_format: str) -> str:
+    """
+    Derive the run id of a note, so rerunning the same command resumes it.
+
+    Args:
+        topic (str): Medical topic.
+        note_type (str): Type of note.
+        output_format (str): Output format.
+
+    Returns:
+        str: Run id such as 'condition-hypertension-markdown'.
+    """
+    slug = re.sub(r"[^a-z0-9]+", "_", topic.lower()).strip("_")
+    return f"{note_type}-{slug}-{output_format}"
+
+_checkpointer: Optional[Any] = None
+_checkpointer_lock = threading.Lock()
+_warned = False
+
+def checkpoint_path() -> str:
+    """
+    Return the checkpoint database path, creating its directory.
+
+    Returns:
+        str: SQLite file from checkpoint_settings.path.
+    """
+    path = get_setting("checkpoint_settings", "path", "./checkpoints/workflow.sqlite")
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return path
+
+def checkpoint_serde() -> Optional[Any]:
+    """
+    Build the checkpoint serializer, allow-listing the workflow models of src.models.
+
+    Returns:
+        Optional[JsonPlusSerializer]: The serializer, or None (LangGraph's default) when
+        this langgraph-checkpoint release has no msgpack allow-list.
+    """
+    if JsonPlusSerializer is None:
+        return None
+    try:
+        return JsonPlusSerializer(allowed_msgpack_modules=CHECKPOINT_TYPES)
+    except TypeError:
+        return None
+
+def _unavailable(package: str) -> None:
+    """Report once that checkpointing is off because a package is missing."""
+    global _warned
+    if not _warned:
+        print(f"Error: Checkpointing needs the {package} package; runs will not be resumable")
+        _warned = True
+
+def get_checkpointer() -> Optional[Any]:
+    """
+    Return the shared SQLite checkpointer configured in checkpoint_settings.
+
+    Returns:
+        Optional[SqliteSaver]: The checkpointer, or None when checkpointing is disabled
+        or langgraph-checkpoint-sqlite is not installed.
+    """
+    global _checkpointer
+    if not get_setting("checkpoint_settings", "enabled", True):
+        return None
+    if SqliteSaver is None:
+        _unavailable("langgraph-checkpoint-sqlite")
+        return None
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            _checkpointer = SqliteSaver(
+                sqlite3.connect(checkpoint_path(), check_same_thread=False, timeout=30),
+                serde=checkpoint_serde()
+            )
+    return _checkpointer
+
+@asynccontextmanager
+async def async_checkpointer() -> AsyncIterator[Optional[Any]]:
+    """
+    Open an async SQLite checkpointer for one run of the async workflow.
+
+    The connection belongs to the running event loop, so it is opened per run rather
+    than shared like get_checkpointer().
+
+    Yields:
+        Optional[AsyncSqliteSaver]: The checkpointer, or None when checkpointing is disabled
+        or langgraph-checkpoint-sqlite/aiosqlite are not installed.
+    """
+    if not get_setting("checkpoint_settings", "enabled", True):
+        yield None
+    elif AsyncSqliteSaver is None:
+        _unavailable("aiosqlite")
+        yield None
+    else:
+        async with aiosqlite.connect(checkpoint_path()) as conn:
+            yield AsyncSqliteSaver(conn, serde=checkpoint_serde())
+
+def reset_checkpointer() -> None:
+    """Close the shared checkpointer so the next access reopens it."""
+    global _checkpointer
+    with _checkpointer_lock:
+        if _checkpointer is not None:
+            _checkpointer.conn.close()
+            _checkpointer = None
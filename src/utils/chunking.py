@@ -0,0 +1,222 @@
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from src.utils.config import get_setting
+
+# Markdown ATX headings, e.g. '## RELATED TOPICS'
+ATX_HEADING = re.compile(r"^\s*(#{1,6})\s+(.+?)\s*#*\s*$")
+# UpToDate top-level headings end a paragraph, e.g. 'TREATMENT — ' (sometimes glued to the previous sentence)
+SECTION_HEADING = re.compile(r"([A-Z][A-Z0-9 ,'()/&-]{2,}[A-Z0-9)])\s+—\s*$")
+# UpToDate subheadings open a paragraph, e.g. 'Drug selection — When ...'
+INLINE_HEADING = re.compile(r"^([A-Z][^\n.—]{1,100}?)\s+—\s+\S")
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n")
+
+def _is_caps_heading(paragraph: str) -> bool:
+    """Check whether a paragraph is a standalone all-caps heading line."""
+    return (
+        "\n" not in paragraph
+        and len(paragraph) <= 100
+        and any(c.isalpha() for c in paragraph)
+        and paragraph == paragraph.upper()
+    )
+
+def _split_paragraphs(text: str) -> List[Tuple[int, int]]:
+    """Return (start, end) offsets of the non-blank paragraphs in text."""
+    spans = []
+    start = 0
+    for match in PARAGRAPH_BREAK.finditer(text):
+        spans.append((start, match.start()))
+        start = match.end()
+    spans.append((start, len(text)))
+    result = []
+    for s, e in spans:
+        segment = text[s:e]
+        stripped = segment.strip()
+        if stripped:
+            lead = len(segment) - len(segment.lstrip())
+            result.append((s + lead, s + lead + len(stripped)))
+    return result
+
+def _split_long(text: str, start: int, end: int, chunk_size: int) -> List[Tuple[int, int]]:
+    """Split an oversized paragraph at sentence or line boundaries, hard-splitting as a last resort."""
+    pieces = []
+    piece_start = start
+    last_break = None
+    pos = start
+    for match in SENTENCE_BREAK.finditer(text, start, end):
+        if match.start() - piece_start > chunk_size and last_break is not None:
+            pieces.append((piece_start, last_break))
+            piece_start = pos
+        last_break = match.start()
+        pos = match.end()
+    tail = (piece_start, end)
+    if last_break is not None and end - piece_start > chunk_size and last_break > piece_start:
+        pieces.append((piece_start, last_break))
+        tail = (pos, end)
+    pieces.append(tail)
+    result = []
+    for s, e in pieces:
+        while e - s > chunk_size:
+            result.append((s, s + chunk_size))
+            s += chunk_size
+        if e > s:
+            result.append((s, e))
+    return result
+
+def _overlap_start(text: str, start: int, end: int, chunk_overlap: int) -> int:
+    """Return the offset where an overlap of at most chunk_overlap characters before end begins, snapped to a word."""
+    if chunk_overlap <= 0 or end - start <= chunk_overlap:
+        return end
+    pos = end - chunk_overlap
+    space = text.find(" ", pos, end)
+    return space + 1 if space != -1 else pos
+
+def chunk_markdown(text: str, chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Split UpToDate markdown into heading-aware chunks.
+
+    Paragraphs are packed into chunks of at most chunk_size characters. A chunk never
+    spans two sections; consecutive chunks within a section share up to chunk_overlap
+    characters. Top-level headings are recognised from markdown '#' lines, UpToDate
+    'SECTION — ' paragraphs and standalone all-caps lines; inline 'Subheading — text'
+    openers start a nested heading.
+
+    Args:
+        text (str): Markdown text of one article.
+        chunk_size (Optional[int]): Maximum characters per chunk (default: ingestion_settings.chunk_size).
+        chunk_overlap (Optional[int]): Characters repeated between chunks (default: ingestion_settings.chunk_overlap).
+
+    Returns:
+        List[Dict[str, Any]]: Chunks with 'text', 'heading_path', 'start', 'end' and 'chunk_index'.
+    """
+    chunk_size = chunk_size or get_setting("ingestion_settings", "chunk_size", 1500)
+    if chunk_overlap is None:
+        chunk_overlap = get_setting("ingestion_settings", "chunk_overlap", 150)
+    chunk_overlap = min(chunk_overlap, chunk_size // 2)
+
+    chunks: List[Dict[str, Any]] = []
+    headings: List[Tuple[int, str]] = []
+    current: Optional[List[int]] = None
+    current_path = ""
+
+    def heading_path() -> str:
+        return " > ".join(title for _, title in headings)
+
+    def push_heading(level: int, title: str) -> None:
+        while headings and headings[-1][0] >= level:
+            headings.pop()
+        headings.append((level, title))
+
+    def flush() -> None:
+        nonlocal current
+        if current is not None:
+            chunks.append({
+                "text": text[current[0]:current[1]],
+                "heading_path": current_path,
+                "start": current[0],
+                "end": current[1],
+                "chunk_index": len(chunks)
+            })
+        current = None
+
+    for start, end in _split_paragraphs(text):
+        paragraph = text[start:end]
+        atx = ATX_HEADING.match(paragraph) if "\n" not in paragraph else None
+        section = SECTION_HEADING.search(paragraph)
+        if atx:
+            flush()
+            # Page chrome uses '##' for top-level headings, so '#' and '##' share level 1
+            push_heading(max(1, len(atx.group(1)) - 1), atx.group(2))
+            continue
+        if section:
+            # Keep any sentence the heading was glued to with the previous section
+            if section.start() > 0 and paragraph[:section.start()].strip():
+                end = start + section.start()
+                paragraph = None
+            else:
+                flush()
+                push_heading(1, section.group(1).strip())
+                continue
+        elif _is_caps_heading(paragraph):
+            flush()
+            push_heading(1, paragraph.strip())
+            continue
+        else:
+            inline = INLINE_HEADING.match(paragraph)
+            if inline:
+                flush()
+                push_heading(2, inline.group(1).strip())
+
+        for piece_start, piece_end in _split_long(text, start, end, chunk_size):
+            if current is not None and piece_end - current[0] <= chunk_size:
+                current[1] = piece_end
+                continue
+            if current is not None:
+                overlap = _overlap_start(text, current[0], current[1], chunk_overlap)
+                flush()
+                if piece_end - overlap <= chunk_size:
+                    piece_start = overlap
+            current = [piece_start, piece_end]
+            current_path = heading_path()
+
+        if section and paragraph is None:
+            flush()
+            push_heading(1, section.group(1).strip())
+    flush()
+    return chunks
+
+def iter_chunks(
+    records: Iterable[Tuple[str, str, Dict[str, Any]]],
+    chunk_size: Optional[int] = None,
+    chunk_overlap: Optional[int] = None
+) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+    """
+    Chunk a stream of loaded articles for embedding, one article at a time.
+
+    Args:
+        records (Iterable[Tuple[str, str, Dict[str, Any]]]): (text, source, metadata) records,
+            e.g. from iter_json_records.
+        chunk_size (Optional[int]): Maximum characters per chunk.
+        chunk_overlap (Optional[int]): Characters repeated between consecutive chunks.
+
+    Yields:
+        Tuple[str, str, Dict[str, Any]]: Chunk text, its source and its metadata (the
+        article metadata plus heading path and character offsets in the article).
+    """
+    for text, source, metadata in records:
+        chunks = chunk_markdown(text, chunk_size, chunk_overlap)
+        for chunk in chunks:
+            yield chunk["text"], source, {
+                **metadata,
+                "heading_path": chunk["heading_path"],
+                "start": chunk["start"],
+                "end": chunk["end"],
+                "chunk_index": chunk["chunk_index"]
+            }
+        print(f"DEBUG: Split '{source}' into {len(chunks)} chunks")
+
+def chunk_documents(
+    texts: List[str],
+    sources: List[str],
+    chunk_size: Optional[int] = None,
+    chunk_overlap: Optional[int] = None
+) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+    """
+    Chunk loaded articles for embedding.
+
+    Args:
+        texts (List[str]): Article texts from load_json_files.
+        sources (List[str]): Source filenames corresponding to texts.
+        chunk_size (Optional[int]): Maximum characters per chunk.
+        chunk_overlap (Optional[int]): Characters repeated between consecutive chunks.
+
+    Returns:
+        Tuple[List[str], List[str], List[Dict[str, Any]]]: Chunk texts, their sources and
+        per-chunk metadata (heading path and character offsets in the article).
+    """
+    chunk_texts, chunk_sources, metadatas = [], [], []
+    for text, source, metadata in iter_chunks(((text, source, {}) for text, source in zip(texts, sources)), chunk_size, chunk_overlap):
+        chunk_texts.append(text)
+        chunk_sources.append(source)
+        metadatas.append(metadata)
+    return chunk_texts, chunk_sources, metadatas
@@ -0,0 +1,70 @@
+import os
+import yaml
+from typing import Any, Dict, Optional
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "config.yaml")
+
+_config_cache: Dict[str, Dict[str, Any]] = {}
+_active_config_path: Optional[str] = None
+
+def load_config(config_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Load the YAML configuration file, caching the parsed result per path.
+
+    Args:
+        config_path (Optional[str]): Path to the config file (default: the path given to
+            set_config_path, else the repository config.yaml).
+
+    Returns:
+        Dict[str, Any]: Parsed configuration, or an empty dict if the file cannot be read.
+    """
+    config_path = os.path.normpath(config_path or _active_config_path or DEFAULT_CONFIG_PATH)
+    if config_path not in _config_cache:
+        try:
+            with open(config_path, "r", encoding="utf-8") as f:
+                _config_cache[config_path] = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError) as e:
+            print(f"Warning: Could not load config '{config_path}': {str(e)}")
+            _config_cache[config_path] = {}
+    return _config_cache[config_path]
+
+def get_setting(section: str, key: str, default: Any = None, config_path: Optional[str] = None) -> Any:
+    """
+    Read a single setting from a top-level config section.
+
+    Args:
+        section (str): Top-level section name (e.g., 'ingestion_settings').
+        key (str): Setting name within the section.
+        default (Any): Value returned when the section or key is missing.
+        config_path (Optional[str]): Path to the config file.
+
+    Returns:
+        Any: Configured value or default.
+    """
+    values = load_config(config_path).get(section) or {}
+    return values.get(key, default)
+
+def set_config_path(config_path: str) -> None:
+    """
+    Use a different config file for all subsequent load_config calls.
+
+    Args:
+        config_path (str): Path to the config file.
+    """
+    global _active_config_path
+    _active_config_path = config_path
+
+def override_setting(section: str, key: str, value: Any, config_path: Optional[str] = None) -> None:
+    """
+    Override a setting in the loaded configuration for the rest of the process.
+
+    Args:
+        section (str): Top-level section name (e.g., 'models').
+        key (str): Setting name within the section.
+        value (Any): New value.
+        config_path (Optional[str]): Path to the config file.
+    """
+    config = load_config(config_path)
+    if not isinstance(config.get(section), dict):
+        config[section] = {}
+    config[section][key] = value
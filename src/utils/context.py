@@ -0,0 +1,145 @@
+import re
+from typing import Any, Dict, List, Optional, Sequence
+from src.utils.config import get_setting
+
+WHITESPACE = re.compile(r"\s+")
+# Shortest shared prefix/suffix treated as a chunk overlap rather than a coincidence
+MIN_OVERLAP_CHARS = 40
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of model tokens in a text.
+
+    Uses a characters-per-token ratio (context_settings.chars_per_token), which is close
+    enough for English clinical text to size prompts without loading a tokenizer.
+
+    Args:
+        text (str): Text to measure.
+
+    Returns:
+        int: Estimated token count.
+    """
+    chars_per_token = get_setting("context_settings", "chars_per_token", 4)
+    return -(-len(text) // chars_per_token)
+
+def prompt_budget(stage: str) -> int:
+    """
+    Return the token budget for the retrieved context of a prompt.
+
+    Args:
+        stage (str): Prompt stage ('high_level', 'gap', 'detail' or 'optimizer').
+
+    Returns:
+        int: Maximum context tokens (context_settings.<stage>_tokens).
+    """
+    return get_setting("context_settings", f"{stage}_tokens", get_setting("context_settings", "default_tokens", 2000))
+
+def _label(index: int, passage: Dict[str, Any]) -> str:
+    """Format the citation label placed above a passage."""
+    label = f"[{index}] {passage.get('source') or 'Unknown'}"
+    if passage.get("heading_path"):
+        label += f" | {passage['heading_path']}"
+    return label
+
+def _truncate(text: str, max_chars: int) -> str:
+    """Cut text to at most max_chars, preferring a sentence and then a word boundary."""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    sentence = max(cut.rfind(". "), cut.rfind(".\n"))
+    if sentence > max_chars // 2:
+        return cut[:sentence + 1]
+    space = cut.rfind(" ")
+    return (cut[:space] if space > max_chars // 2 else cut) + " ..."
+
+def _overlap(before: str, after: str) -> int:
+    """Return the length of the longest suffix of before that is also a prefix of after, or 0 below MIN_OVERLAP_CHARS."""
+    if len(after) < MIN_OVERLAP_CHARS:
+        return 0
+    probe = after[:MIN_OVERLAP_CHARS]
+    position = before.find(probe, max(0, len(before) - len(after)))
+    while position != -1:
+        if after.startswith(before[position:]):
+            return len(before) - position
+        position = before.find(probe, position + 1)
+    return 0
+
+def _trim_overlaps(text: str, packed: Sequence[str]) -> str:
+    """Cut the parts of text that repeat the start or end of an already packed passage."""
+    for previous in packed:
+        head = _overlap(previous, text)
+        if head:
+            text = text[head:].lstrip()
+        tail = _overlap(text, previous)
+        if tail:
+            text = text[:len(text) - tail].rstrip()
+    return text
+
+def pack_context(passages: Sequence[Dict[str, Any]], budget_tokens: int) -> str:
+    """
+    Pack ranked passages into a labeled context block that fits a token budget.
+
+    Passages are taken in rank order. Duplicates and passages contained in an already
+    packed one are dropped, and text a passage shares with the end or start of an
+    already packed one (the overlap between neighbouring chunks) is trimmed from it, so
+    it is packed only once. Passages that no longer fit are skipped in favour of
+    shorter ones further down; the top passage is truncated rather than dropped when
+    it alone exceeds the budget. Each passage is labeled '[n] source | heading path'
+    so the model can cite it.
+
+    Args:
+        passages (Sequence[Dict[str, Any]]): Passages with 'text', 'source' and optional 'heading_path', best first.
+        budget_tokens (int): Maximum estimated tokens for the packed block.
+
+    Returns:
+        str: Labeled passages separated by blank lines.
+    """
+    chars_per_token = get_setting("context_settings", "chars_per_token", 4)
+    min_tokens = get_setting("context_settings", "min_passage_tokens", 50)
+    packed: List[str] = []
+    seen: List[str] = []
+    texts: List[str] = []
+    used = 0
+    for passage in passages:
+        text = passage.get("text")
+        if not isinstance(text, str) or not text.strip():
+            continue
+        normalized = WHITESPACE.sub(" ", text).strip().lower()
+        if any(normalized in previous for previous in seen):
+            continue
+        body = _trim_overlaps(text.strip(), texts)
+        if not body:
+            continue
+        block = f"{_label(len(packed) + 1, passage)}\n{body}"
+        tokens = estimate_tokens(block) + 1
+        if used + tokens > budget_tokens:
+            remaining = budget_tokens - used
+            if packed or remaining < min_tokens:
+                continue
+            block = _truncate(block, remaining * chars_per_token)
+            tokens = estimate_tokens(block) + 1
+        packed.append(block)
+        seen.append(normalized)
+        texts.append(text.strip())
+        used += tokens
+        if budget_tokens - used < min_tokens:
+            break
+    return "\n\n".join(packed)
+
+def pack_documents(documents: Sequence[str], metadatas: Optional[Sequence[Dict[str, Any]]], budget_tokens: int) -> str:
+    """
+    Pack a query result's documents and metadata into a labeled context block.
+
+    Args:
+        documents (Sequence[str]): Retrieved chunk texts, best first.
+        metadatas (Optional[Sequence[Dict[str, Any]]]): Their metadata with 'source' and 'heading_path'.
+        budget_tokens (int): Maximum estimated tokens for the packed block.
+
+    Returns:
+        str: Labeled passages separated by blank lines.
+    """
+    metadatas = metadatas or [{}] * len(documents)
+    return pack_context(
+        [{"text": doc, "source": (meta or {}).get("source"), "heading_path": (meta or {}).get("heading_path", "")} for doc, meta in zip(documents, metadatas)],
+        budget_tokens
+    )
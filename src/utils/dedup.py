@@ -0,0 +1,218 @@
+import re
+import zlib
+import numpy as np
+from functools import lru_cache
+import chromadb
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from src.utils.config import get_setting
+from src.utils.embeddings import chunk_id
+
+WORD = re.compile(r"\w+")
+# Shingle hashes stay below this Mersenne prime, so combining them never overflows 64 bits
+PRIME = (1 << 31) - 1
+# Multiplier combining consecutive word hashes into a shingle hash
+SHINGLE_BASE = 1000003
+# Joins source names in 'sources' and 'see_also' metadata
+SOURCE_SEPARATOR = " | "
+
+@lru_cache(maxsize=1 << 17)
+def word_hash(word: str) -> int:
+    """Hash a word below PRIME; memoized, since a corpus reuses a small vocabulary."""
+    return zlib.crc32(word.encode("utf-8")) % PRIME
+
+def shingles(text: str, size: int) -> np.ndarray:
+    """
+    Hash the word shingles of a text.
+
+    Word hashes are combined with numpy, so no n-gram strings are built.
+
+    Args:
+        text (str): Chunk text.
+        size (int): Words per shingle; shorter texts form a single shingle.
+
+    Returns:
+        np.ndarray: Distinct hashes (below PRIME) of the lowercase word n-grams, empty
+        for a text without words.
+    """
+    words = WORD.findall(text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    word_hashes = np.fromiter(map(word_hash, words), dtype=np.uint64, count=len(words))
+    size = min(max(1, size), len(words))
+    count = len(words) - size + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(size):
+        hashes = (hashes * SHINGLE_BASE + word_hashes[offset:offset + count]) % PRIME
+    return np.unique(hashes)
+
+class MinHashLSH:
+    """
+    MinHash signatures of kept chunks, indexed by LSH bands for near-duplicate lookup.
+
+    Signatures are split into bands; chunks sharing any band are candidates, and a
+    candidate is a near duplicate when the share of equal signature values (an
+    estimate of the shingle Jaccard similarity) reaches the threshold.
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 8, threshold: float = 0.8, seed: int = 1):
+        """
+        Create an empty index.
+
+        Args:
+            num_perm (int): Hash permutations per signature.
+            bands (int): LSH bands; num_perm is rounded down to a multiple of it.
+            threshold (float): Minimum estimated Jaccard similarity of near duplicates.
+            seed (int): Seed of the permutations, fixed so runs agree.
+        """
+        self.bands = max(1, bands)
+        self.rows = max(1, num_perm // self.bands)
+        self.threshold = threshold
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hash functions: odd 64-bit multipliers, keeping the high 32 bits
+        self._a = rng.integers(0, 1 << 63, self.bands * self.rows, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, self.bands * self.rows, dtype=np.uint64)
+        self._buckets: Dict[int, List[str]] = {}
+        self._signatures: Dict[str, np.ndarray] = {}
+
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Compute the MinHash signature of a shingle set.
+
+        Args:
+            hashes (np.ndarray): Shingle hashes from shingles().
+
+        Returns:
+            np.ndarray: Minimum permuted hash per permutation.
+        """
+        # uint64 arithmetic wraps modulo 2**64, as multiply-shift hashing expects
+        return ((np.outer(hashes, self._a) + self._b) >> np.uint64(32)).min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[int]:
+        """Hash each band of a signature."""
+        return [hash((band, signature[band * self.rows:(band + 1) * self.rows].tobytes())) for band in range(self.bands)]
+
+    def query(self, signature: np.ndarray) -> Optional[str]:
+        """
+        Find a kept chunk that the signature nearly duplicates.
+
+        Args:
+            signature (np.ndarray): Signature of the new chunk.
+
+        Returns:
+            Optional[str]: Key of the first near-duplicate kept chunk, or None.
+        """
+        for key in self._band_keys(signature):
+            for candidate in self._buckets.get(key, []):
+                if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                    return candidate
+        return None
+
+    def add(self, key: str, signature: np.ndarray) -> None:
+        """
+        Index a kept chunk.
+
+        Args:
+            key (str): Chunk id.
+            signature (np.ndarray): Its signature.
+        """
+        self._signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            self._buckets.setdefault(band_key, []).append(key)
+
+def dedup_chunks(
+    chunks: Iterable[Tuple[str, str, Dict[str, Any]]],
+    attributions: Dict[str, List[str]]
+) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+    """
+    Drop chunks that nearly duplicate an earlier chunk of the stream.
+
+    The first copy is kept (sources arrive in sorted order, so top-level files win over
+    copies in subdirectories) and the sources of its dropped copies are recorded, so
+    they can be attributed to it after storage (see record_attributions). Disabled
+    with dedup_settings.enabled.
+
+    Args:
+        chunks (Iterable[Tuple[str, str, Dict[str, Any]]]): (text, source, metadata) chunks.
+        attributions (Dict[str, List[str]]): Filled with kept chunk ids mapped to every
+            source of their copies, the kept chunk's own source first.
+
+    Yields:
+        Tuple[str, str, Dict[str, Any]]: Chunks that are not near duplicates.
+    """
+    if not get_setting("dedup_settings", "enabled", True):
+        yield from chunks
+        return
+    size = get_setting("dedup_settings", "shingle_words", 5)
+    index = MinHashLSH(
+        num_perm=get_setting("dedup_settings", "num_perm", 64),
+        bands=get_setting("dedup_settings", "bands", 8),
+        threshold=get_setting("dedup_settings", "threshold", 0.8)
+    )
+    dropped = 0
+    for text, source, metadata in chunks:
+        hashes = shingles(text, size) if isinstance(text, str) else np.empty(0, dtype=np.uint64)
+        if not hashes.size:
+            yield text, source, metadata
+            continue
+        signature = index.signature(hashes)
+        kept = index.query(signature)
+        if kept is None:
+            index.add(chunk_id(source, text), signature)
+            yield text, source, metadata
+            continue
+        sources = attributions.setdefault(kept, [kept.rsplit("::", 1)[0]])
+        if source not in sources:
+            sources.append(source)
+        dropped += 1
+    print(f"DEBUG: Dropped {dropped} near-duplicate chunks")
+
+def duplicate_sources(attributions: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """
+    Map each source whose chunks were dropped to the sources that kept them.
+
+    Args:
+        attributions (Dict[str, List[str]]): From dedup_chunks.
+
+    Returns:
+        Dict[str, List[str]]: Sources mapped to the sorted sources holding their duplicates.
+    """
+    aliases: Dict[str, Set[str]] = {}
+    for sources in attributions.values():
+        for source in sources[1:]:
+            if source != sources[0]:
+                aliases.setdefault(source, set()).add(sources[0])
+    return {source: sorted(kept) for source, kept in aliases.items()}
+
+def record_attributions(collection: chromadb.Collection, attributions: Dict[str, List[str]], batch_size: int = 1000) -> None:
+    """
+    Store the sources of dropped copies on the chunks that were kept.
+
+    Kept chunks get 'sources' (every source of the passage) and 'has_duplicates'
+    metadata; chunks that no longer have duplicates lose them.
+
+    Args:
+        collection (chromadb.Collection): Chunk collection.
+        attributions (Dict[str, List[str]]): From dedup_chunks.
+        batch_size (int): Ids per Chroma request.
+    """
+    previous = collection.get(where={"has_duplicates": True}, include=[])["ids"]
+    cleared = [id_ for id_ in previous if id_ not in attributions]
+    for start in range(0, len(cleared), batch_size):
+        batch = cleared[start:start + batch_size]
+        collection.update(ids=batch, metadatas=[{"sources": None, "has_duplicates": None}] * len(batch))
+    ids = list(attributions)
+    updated = 0
+    for start in range(0, len(ids), batch_size):
+        stored = collection.get(ids=ids[start:start + batch_size], include=["metadatas"])
+        changes = [
+            (id_, SOURCE_SEPARATOR.join(attributions[id_]))
+            for id_, meta in zip(stored["ids"], stored["metadatas"])
+            if (meta or {}).get("sources") != SOURCE_SEPARATOR.join(attributions[id_])
+        ]
+        if changes:
+            collection.update(
+                ids=[id_ for id_, _ in changes],
+                metadatas=[{"sources": sources, "has_duplicates": True} for _, sources in changes]
+            )
+            updated += len(changes)
+    print(f"DEBUG: Attributed duplicates on {updated} chunks, cleared {len(cleared)}")
@@ -1,45 +1,511 @@
+import time
+import hashlib
+import contextvars
 import chromadb
-from typing import List
-from ollama import embed
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from src.utils.config import get_setting
+from src.utils.cache import get_embedding_cache
+from src.utils.manifest import manifest_path, read_manifest, write_manifest
+from src.utils.instrumentation import span, response_metrics
+from src.utils.lexical import get_lexical_index
+from src.utils.routing import stage_route, EMBEDDING_STAGE
+from src.utils.ollama_client import embed
 
-def store_embeddings(texts: List[str], sources: List[str]) -> chromadb.Collection:
+# Collection metadata recording which model produced the stored vectors
+EMBEDDING_MODEL_KEY = "embedding_model"
+EMBEDDING_DIMENSION_KEY = "embedding_dimension"
+
+def content_hash(text: str) -> str:
     """
-    Store text embeddings in a ChromaDB collection.
+    Compute a stable hash of a chunk's content.
 
     Args:
-        texts (List[str]): List of text strings to embed.
-        sources (List[str]): List of source filenames corresponding to texts.
+        text (str): Chunk text.
+
+    Returns:
+        str: Hex SHA-256 digest of the UTF-8 encoded text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def chunk_id(source: str, text: str) -> str:
+    """
+    Derive a stable ChromaDB id from the source file and chunk content.
+
+    Args:
+        source (str): Source filename of the chunk.
+        text (str): Chunk text.
+
+    Returns:
+        str: Id of the form '<source>::<hash prefix>'.
+    """
+    return f"{source}::{content_hash(text)[:16]}"
+
+def load_manifest(collection: chromadb.Collection, path: str) -> Dict[str, List[str]]:
+    """
+    Load the ingestion manifest mapping each source to the ids stored for it.
+
+    Falls back to rebuilding the manifest from the collection metadata when the
+    manifest file is missing, unreadable or describes another collection.
+
+    Args:
+        collection (chromadb.Collection): Collection the manifest describes.
+        path (str): Path to the manifest JSON file.
+
+    Returns:
+        Dict[str, List[str]]: Source filenames mapped to their stored ids.
+    """
+    manifest = read_manifest(path)
+    if manifest and manifest.get("collection") == collection.name:
+        return manifest["sources"]
+    print(f"DEBUG: Rebuilding ingestion manifest for collection '{collection.name}'")
+    sources: Dict[str, List[str]] = {}
+    stored = collection.get(include=["metadatas"])
+    for id_, meta in zip(stored["ids"], stored["metadatas"] or []):
+        source = (meta or {}).get("source", "Unknown")
+        sources.setdefault(source, []).append(id_)
+    return sources
+
+def open_collection(db_path: Optional[str] = None, collection_name: Optional[str] = None) -> Tuple[Any, chromadb.Collection]:
+    """
+    Open the persistent ChromaDB client and collection.
+
+    Args:
+        db_path (Optional[str]): ChromaDB persistence directory (default: ingestion_settings.db_path).
+        collection_name (Optional[str]): Collection name (default: ingestion_settings.collection_name).
+
+    Returns:
+        Tuple[Any, chromadb.Collection]: The client and the (possibly new) collection.
+    """
+    client = chromadb.PersistentClient(path=db_path or get_setting("ingestion_settings", "db_path", "./chroma_db"))
+    collection = client.get_or_create_collection(name=collection_name or get_setting("ingestion_settings", "collection_name", "notes"))
+    return client, collection
+
+def collection_db_path(collection: chromadb.Collection) -> str:
+    """
+    Return the persistence directory of the client that owns a collection.
+
+    Indexes stored next to a collection (lexical index, article summaries) are found
+    through it, so a collection opened with an explicit db_path uses its own.
+
+    Args:
+        collection (chromadb.Collection): Persistent collection.
+
+    Returns:
+        str: Its client's persist_directory, or ingestion_settings.db_path if unknown.
+    """
+    try:
+        path = collection._client.get_settings().persist_directory
+    except AttributeError:
+        path = None
+    return path or get_setting("ingestion_settings", "db_path", "./chroma_db")
+
+def _stored_dimension(collection: chromadb.Collection) -> Optional[int]:
+    """Return the length of one stored vector, or None if the collection is empty."""
+    stored = collection.get(limit=1, include=["embeddings"])
+    embeddings = stored["embeddings"]
+    return len(embeddings[0]) if embeddings is not None and len(embeddings) else None
+
+def embedding_mismatch(collection: chromadb.Collection, model: Optional[str] = None) -> Optional[str]:
+    """
+    Check that a collection's vectors were produced by the given embedding model.
+
+    The model is recorded in the collection metadata when chunks are stored. For
+    collections stored before it was recorded, the dimension of a stored vector is
+    compared with the model's instead.
+
+    Args:
+        collection (chromadb.Collection): Collection to check.
+        model (Optional[str]): Embedding model name (default: the embedding stage's routed model).
+
+    Returns:
+        Optional[str]: Description of the mismatch, or None if the vectors can be used.
+    """
+    if not collection.count():
+        return None
+    model = model or stage_route(EMBEDDING_STAGE)["model"]
+    recorded = (collection.metadata or {}).get(EMBEDDING_MODEL_KEY)
+    if recorded:
+        if recorded == model:
+            return None
+        return f"Collection '{collection.name}' was embedded with '{recorded}', not '{model}'"
+    stored = _stored_dimension(collection)
+    current = len(embed_texts([collection.name], model)[0])
+    if stored in (None, current):
+        return None
+    return f"Collection '{collection.name}' holds {stored}-dimensional vectors, '{model}' produces {current}"
+
+def record_embedding_model(collection: chromadb.Collection, model: str, dimension: Optional[int]) -> None:
+    """
+    Record the model and vector dimension of a collection's embeddings in its metadata.
+
+    Args:
+        collection (chromadb.Collection): Collection the vectors were stored in.
+        model (str): Embedding model name.
+        dimension (Optional[int]): Dimension of the vectors just stored (default: that of a stored vector).
+    """
+    metadata = collection.metadata or {}
+    dimension = dimension or _stored_dimension(collection)
+    if dimension and (metadata.get(EMBEDDING_MODEL_KEY), metadata.get(EMBEDDING_DIMENSION_KEY)) != (model, dimension):
+        collection.modify(metadata={**metadata, EMBEDDING_MODEL_KEY: model, EMBEDDING_DIMENSION_KEY: dimension})
+
+def check_embedding_model(collection: chromadb.Collection) -> None:
+    """
+    Refuse to query a collection embedded with another model.
+
+    Args:
+        collection (chromadb.Collection): Collection about to be queried.
+
+    Raises:
+        ValueError: If the collection was embedded with a different model than the routed one.
+    """
+    mismatch = embedding_mismatch(collection)
+    if mismatch:
+        raise ValueError(f"{mismatch}; run 'ingest' to re-embed it")
+
+def _embed_batch(texts: List[str], model: str) -> List[List[float]]:
+    """
+    Embed a batch of texts in a single Ollama request.
+
+    The request carries the embedding stage's options and keep_alive, so the model
+    stays loaded between ingestion batches and query embeddings.
+
+    Args:
+        texts (List[str]): Texts to embed.
+        model (str): Embedding model name.
+
+    Returns:
+        List[List[float]]: One embedding vector per input text.
+
+    Raises:
+        ValueError: If the response does not contain one vector of floats per text.
+    """
+    route = stage_route(EMBEDDING_STAGE)
+    with span("embed.batch", model=model, texts=len(texts)) as attrs:
+        response = embed(model=model, input=texts, options=route["options"] or None, keep_alive=route["keep_alive"])
+        attrs.update(response_metrics(response))
+    embeddings = response["embeddings"]
+    if len(embeddings) != len(texts):
+        raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+    for vector in embeddings:
+        if not vector or not all(isinstance(x, (int, float)) for x in vector):
+            raise ValueError(f"Invalid embedding format, expected list of floats, got {type(vector)}")
+    return embeddings
+
+def embed_texts(texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+    """
+    Embed texts through the shared embedding cache.
+
+    Cached vectors are returned without contacting Ollama; the remaining texts are
+    embedded in a single request and added to the cache.
+
+    Args:
+        texts (List[str]): Texts to embed.
+        model (Optional[str]): Embedding model name (default: the embedding stage's routed model).
+
+    Returns:
+        List[List[float]]: One embedding vector per input text.
+    """
+    model = model or stage_route(EMBEDDING_STAGE)["model"]
+    cache = get_embedding_cache()
+    with span("embed.texts", model=model, texts=len(texts)) as attrs:
+        vectors = cache.get_many(model, texts) if cache else [None] * len(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        attrs["cache_hits"] = len(texts) - len(missing)
+        attrs["cache_hit"] = not missing
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            fresh = _embed_batch(missing_texts, model)
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+            if cache:
+                cache.set_many(model, missing_texts, fresh)
+    return vectors
+
+def embed_in_batches(
+    texts: List[str],
+    model: Optional[str] = None,
+    batch_size: Optional[int] = None,
+    concurrency: Optional[int] = None
+) -> Iterator[Tuple[int, int, Optional[List[List[float]]]]]:
+    """
+    Embed texts in batches with a bounded number of concurrent requests.
+
+    Batches are yielded as they complete, not in input order. A failed batch yields
+    None instead of vectors so the caller can skip its texts.
+
+    Args:
+        texts (List[str]): Texts to embed.
+        model (Optional[str]): Embedding model name (default: the embedding stage's routed model).
+        batch_size (Optional[int]): Texts per request (default: ingestion_settings.embed_batch_size).
+        concurrency (Optional[int]): Requests in flight (default: ingestion_settings.embed_concurrency).
+
+    Yields:
+        Tuple[int, int, Optional[List[List[float]]]]: Offset and size of the batch in texts, and its vectors.
+    """
+    batch_size = max(1, batch_size or get_setting("ingestion_settings", "embed_batch_size", 32))
+    concurrency = max(1, concurrency or get_setting("ingestion_settings", "embed_concurrency", 4))
+    started = time.perf_counter()
+    done = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(contextvars.copy_context().run, embed_texts, texts[offset:offset + batch_size], model): offset
+            for offset in range(0, len(texts), batch_size)
+        }
+        for future in as_completed(futures):
+            offset = futures[future]
+            size = min(batch_size, len(texts) - offset)
+            try:
+                vectors = future.result()
+            except Exception as e:
+                print(f"Error embedding batch at offset {offset} ({size} texts): {str(e)}")
+                vectors = None
+            done += size
+            elapsed = time.perf_counter() - started
+            print(f"DEBUG: Embedded {done}/{len(texts)} texts ({done / elapsed if elapsed else 0.0:.1f} chunks/s)")
+            yield offset, size, vectors
+
+def store_chunks(
+    chunks: Iterable[Tuple[str, str, Dict[str, Any]]],
+    db_path: Optional[str] = None,
+    collection_name: Optional[str] = None,
+    incremental: bool = True,
+    prune: bool = False,
+    unloaded: Optional[Set[str]] = None,
+    batch_size: Optional[int] = None,
+    concurrency: Optional[int] = None
+) -> chromadb.Collection:
+    """
+    Store a stream of chunks and their embeddings in a ChromaDB collection.
+
+    In incremental mode each chunk is stored under an id derived from its source and
+    content hash, and only chunks whose id is not already recorded in the manifest are
+    embedded. The stream is consumed in windows of ingestion_settings.ingest_window new
+    chunks: each window is embedded through embed_in_batches and upserted in
+    write_batch_size batches before more chunks are read, so only the ids of the whole
+    corpus are held in memory. Once the stream ends, ids that a source no longer
+    produces are deleted; sources absent from the stream are kept unless prune is
+    set, so ingesting a single file leaves the rest of the corpus alone. The collection's lexical index (src.utils.lexical) is kept in sync
+    with the same ids.
+
+    An unchanged chunk keeps its id when an earlier part of its article is edited, but
+    its position (offsets, chunk index, heading path) may move; for sources whose ids
+    changed, the metadata of the chunks that were kept is updated in place.
+
+    The embedding model and vector dimension are recorded in the collection metadata
+    and the manifest. A collection embedded with another model is dropped and every
+    chunk is embedded again.
+
+    Args:
+        chunks (Iterable[Tuple[str, str, Dict[str, Any]]]): (text, source, metadata) chunks, e.g. from iter_chunks.
+        db_path (Optional[str]): ChromaDB persistence directory (default: ingestion_settings.db_path).
+        collection_name (Optional[str]): Collection to populate (default: ingestion_settings.collection_name).
+        incremental (bool): Skip chunks already embedded and delete stale ones (default: True).
+        prune (bool): Also delete sources that are absent from the input (default: False).
+        unloaded (Optional[Set[str]]): Sources that failed to load, filled while the stream
+            is consumed (see iter_json_records); they are never pruned.
+        batch_size (Optional[int]): Texts per embedding request.
+        concurrency (Optional[int]): Embedding requests in flight.
 
     Returns:
         chromadb.Collection: ChromaDB collection with stored embeddings.
     """
-    client = chromadb.PersistentClient(path="./chroma_db")
-    collection = client.get_or_create_collection(name="notes")
-    if not texts:
-        print("Warning: No texts to embed, returning empty collection")
-        return collection
-    for i, (text, source) in enumerate(zip(texts, sources)):
+    client, collection = open_collection(db_path, collection_name)
+    db_path = db_path or get_setting("ingestion_settings", "db_path", "./chroma_db")
+    path = manifest_path(db_path)
+    manifest = load_manifest(collection, path) if incremental else {}
+    existing_ids = {id_ for ids in manifest.values() for id_ in ids}
+    lexical = get_lexical_index(db_path, collection.name)
+    indexed = lexical.ids() if lexical else set()
+    model = stage_route(EMBEDDING_STAGE)["model"]
+    mismatch = embedding_mismatch(collection, model)
+    if mismatch:
+        print(f"Warning: {mismatch}; re-embedding every chunk")
+        # Vectors of another model may differ in dimension, so the collection is recreated
+        client.delete_collection(collection.name)
+        collection = client.get_or_create_collection(name=collection.name)
+        existing_ids = set()
+        if lexical:
+            lexical.delete(list(indexed))
+            indexed = set()
+    dimension = (collection.metadata or {}).get(EMBEDDING_DIMENSION_KEY)
+
+    write_batch_size = min(
+        get_setting("ingestion_settings", "write_batch_size", 1000),
+        client.get_max_batch_size()
+    )
+    window_size = max(1, get_setting("ingestion_settings", "ingest_window", 2000))
+    wanted: Dict[str, List[str]] = {}
+    wanted_ids = set()
+    failed = set()
+    embedded = 0
+    relocated = 0
+    buffer: Dict[str, list] = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+
+    def flush() -> None:
+        if not buffer["ids"]:
+            return
+        try:
+            collection.upsert(**buffer)
+            if lexical:
+                lexical.add(buffer["ids"], buffer["documents"], [meta["source"] for meta in buffer["metadatas"]])
+            print(f"DEBUG: Upserted {len(buffer['ids'])} embeddings")
+        except Exception as e:
+            print(f"Error writing {len(buffer['ids'])} embeddings to collection: {str(e)}")
+            failed.update(buffer["ids"])
+        for values in buffer.values():
+            values.clear()
+
+    def store_window(window: List[Tuple[str, str, str, Dict[str, Any]]]) -> None:
+        nonlocal dimension
+        window_texts = [text for _, text, _, _ in window]
+        for offset, size, vectors in embed_in_batches(window_texts, model, batch_size=batch_size, concurrency=concurrency):
+            batch = window[offset:offset + size]
+            if vectors is None:
+                failed.update(id_ for id_, _, _, _ in batch)
+                continue
+            dimension = len(vectors[0])
+            for (id_, text, source, metadata), vector in zip(batch, vectors):
+                buffer["ids"].append(id_)
+                buffer["embeddings"].append(vector)
+                buffer["documents"].append(text)
+                buffer["metadatas"].append({**metadata, "source": source, "content_hash": content_hash(text)})
+            if len(buffer["ids"]) >= write_batch_size:
+                flush()
+        flush()
+
+    def refresh_metadata(kept: List[Tuple[str, Dict[str, Any]]]) -> None:
+        nonlocal relocated
+        current = dict(kept)
+        stored = collection.get(ids=list(current), include=["metadatas"])
+        changes = [
+            id_ for id_, meta in zip(stored["ids"], stored["metadatas"] or [])
+            if any((meta or {}).get(key) != value for key, value in current[id_].items())
+        ]
+        for start in range(0, len(changes), write_batch_size):
+            batch = changes[start:start + write_batch_size]
+            # update merges metadata, so attributions and section tags are kept
+            collection.update(ids=batch, metadatas=[current[id_] for id_ in batch])
+        relocated += len(changes)
+
+    def backfill_lexical(backfill: List[Tuple[str, str, str]]) -> None:
+        # Chunks embedded before the lexical index existed are indexed without re-embedding
+        lexical.add([id_ for id_, _, _ in backfill], [text for _, text, _ in backfill], [source for _, _, source in backfill])
+        print(f"DEBUG: Added {len(backfill)} existing chunks to the lexical index")
+
+    pending: List[Tuple[str, str, str, Dict[str, Any]]] = []
+    backfill: List[Tuple[str, str, str]] = []
+    # Chunks of the current source that are already stored, and those of edited sources
+    held: List[Tuple[str, Dict[str, Any]]] = []
+    moved: List[Tuple[str, Dict[str, Any]]] = []
+    current_source = None
+
+    def finish_source() -> None:
+        nonlocal moved
+        # Positions only move when the source's ids changed (records of a source arrive together)
+        if held and wanted[current_source] != manifest.get(current_source):
+            moved.extend(held)
+        held.clear()
+        if len(moved) >= window_size:
+            refresh_metadata(moved)
+            moved = []
+
+    for i, (text, source, metadata) in enumerate(chunks):
         if not isinstance(text, str):
             print(f"Error: Invalid text type {type(text)} for source {source}, skipping")
             continue
-        try:
-            response = embed(model="mxbai-embed-large", input=text)
-            embeddings = response["embeddings"]
-            if isinstance(embeddings, list) and embeddings and isinstance(embeddings[0], list):
-                embedding_vector = embeddings[0]
-            else:
-                embedding_vector = embeddings
-            if not all(isinstance(x, (int, float)) for x in embedding_vector):
-                print(f"Error: Invalid embedding format for source {source}, expected list of floats, got {type(embedding_vector[0])}")
-                continue
-            collection.add(
-                embeddings=[embedding_vector],
-                documents=[text],
-                metadatas=[{"source": source}],
-                ids=[f"doc_{i}"]
-            )
-            print(f"Successfully added embedding for source {source}")
-        except Exception as e:
-            print(f"Error processing embedding for source {source}: {str(e)}")
+        id_ = chunk_id(source, text) if incremental else f"doc_{i}"
+        if id_ in wanted_ids:
             continue
-    return collection
\ No newline at end of file
+        if source != current_source:
+            finish_source()
+            current_source = source
+        wanted_ids.add(id_)
+        wanted.setdefault(source, []).append(id_)
+        if id_ in existing_ids:
+            held.append((id_, {**(metadata or {}), "source": source}))
+        if id_ not in existing_ids:
+            pending.append((id_, text, source, metadata or {}))
+            if len(pending) >= window_size:
+                store_window(pending)
+                embedded += len(pending)
+                pending = []
+        elif lexical and id_ not in indexed:
+            backfill.append((id_, text, source))
+            if len(backfill) >= window_size:
+                backfill_lexical(backfill)
+                backfill = []
+    if pending:
+        store_window(pending)
+        embedded += len(pending)
+    if backfill:
+        backfill_lexical(backfill)
+    finish_source()
+    if moved:
+        refresh_metadata(moved)
+
+    if not wanted:
+        # An empty stream (e.g., an unreadable corpus) leaves the stored collection as it is
+        print("Warning: No texts to embed, returning empty collection")
+        return collection
+    print(f"DEBUG: Embedded {embedded} new or changed texts, {len(wanted_ids) - embedded} unchanged ({relocated} repositioned)")
+
+    unloaded = unloaded or set()
+    stale_sources = set(manifest) - unloaded if prune else set(manifest) & set(wanted)
+    stale_ids = [id_ for source in stale_sources for id_ in manifest[source] if id_ not in wanted_ids]
+    if stale_ids:
+        collection.delete(ids=stale_ids)
+        if lexical:
+            lexical.delete(stale_ids)
+        print(f"DEBUG: Deleted {len(stale_ids)} stale embeddings")
+
+    record_embedding_model(collection, model, dimension)
+    dimension = (collection.metadata or {}).get(EMBEDDING_DIMENSION_KEY)
+    embedding = {"model": model, "dimension": dimension} if dimension else None
+
+    if incremental:
+        # Failed ids stay out of the manifest so the next run retries them
+        for source, ids in wanted.items():
+            manifest[source] = [id_ for id_ in ids if id_ not in failed]
+        if prune:
+            manifest = {source: ids for source, ids in manifest.items() if source in wanted or source in unloaded}
+        write_manifest(path, collection.name, manifest, embedding=embedding)
+    return collection
+
+def store_embeddings(
+    texts: List[str],
+    sources: List[str],
+    metadatas: Optional[List[Dict[str, Any]]] = None,
+    db_path: Optional[str] = None,
+    collection_name: Optional[str] = None,
+    incremental: bool = True,
+    prune: bool = False,
+    batch_size: Optional[int] = None,
+    concurrency: Optional[int] = None
+) -> chromadb.Collection:
+    """
+    Store text embeddings in a ChromaDB collection (see store_chunks).
+
+    Args:
+        texts (List[str]): List of text strings to embed.
+        sources (List[str]): List of source filenames corresponding to texts.
+        metadatas (Optional[List[Dict[str, Any]]]): Extra metadata per text (e.g., chunk heading path and offsets).
+        db_path (Optional[str]): ChromaDB persistence directory (default: ingestion_settings.db_path).
+        collection_name (Optional[str]): Collection to populate (default: ingestion_settings.collection_name).
+        incremental (bool): Skip texts already embedded and delete stale ones (default: True).
+        prune (bool): Also delete sources that are absent from the input (default: False).
+        batch_size (Optional[int]): Texts per embedding request.
+        concurrency (Optional[int]): Embedding requests in flight.
+
+    Returns:
+        chromadb.Collection: ChromaDB collection with stored embeddings.
+    """
+    return store_chunks(
+        zip(texts, sources, metadatas or [{}] * len(texts)),
+        db_path=db_path,
+        collection_name=collection_name,
+        incremental=incremental,
+        prune=prune,
+        batch_size=batch_size,
+        concurrency=concurrency
+    )
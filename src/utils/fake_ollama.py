@@ -0,0 +1,278 @@
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Union
+import ollama
+from ollama import ChatResponse, EmbedResponse, Message
+
+# Words used to fill generated strings, so outputs look like short clinical bullet points
+VOCABULARY = (
+    "blood pressure", "dose", "first-line", "thiazide", "monitoring", "risk", "renal function",
+    "lifestyle", "sodium", "target", "follow-up", "adverse effects", "indication", "screening"
+)
+
+# Section structures the orchestrator may plan, from flat to deeply nested
+STRUCTURES = ("Simple list", "Nested list by category", "Detailed hierarchy")
+
+class FakeOllama:
+    """
+    Deterministic local stand-in for an Ollama server.
+
+    Chat responses are generated from the requested JSON schema, so every structured_llm
+    call receives schema-valid output; embeddings are derived from a hash of the input
+    text. Latency is simulated per request, per embedded text and per generated token,
+    and at most `parallel` requests are served at once, like OLLAMA_NUM_PARALLEL.
+    """
+
+    def __init__(
+        self,
+        chat_latency: float = 0.05,
+        token_latency: float = 0.0,
+        embed_latency: float = 0.005,
+        embed_text_latency: float = 0.0005,
+        dimensions: int = 256,
+        parallel: int = 4,
+        list_length: int = 3
+    ):
+        """
+        Configure the fake backend.
+
+        Args:
+            chat_latency (float): Seconds per chat request.
+            token_latency (float): Additional seconds per generated token.
+            embed_latency (float): Seconds per embed request.
+            embed_text_latency (float): Additional seconds per embedded text.
+            dimensions (int): Embedding vector length.
+            parallel (int): Requests served concurrently.
+            list_length (int): Items generated for top-level JSON arrays.
+        """
+        self.chat_latency = chat_latency
+        self.token_latency = token_latency
+        self.embed_latency = embed_latency
+        self.embed_text_latency = embed_text_latency
+        self.dimensions = dimensions
+        self.list_length = list_length
+        self.calls = {"chat": 0, "embed": 0, "embedded_texts": 0}
+        self.parallel = max(1, parallel)
+        self._slots = threading.BoundedSemaphore(self.parallel)
+        self._async_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        """Increment a call counter."""
+        with self._lock:
+            self.calls[key] += amount
+
+    def embedding(self, text: str) -> List[float]:
+        """
+        Return a deterministic unit-length embedding for a text.
+
+        Args:
+            text (str): Input text.
+
+        Returns:
+            List[float]: Vector of `dimensions` floats.
+        """
+        values: List[float] = []
+        counter = 0
+        while len(values) < self.dimensions:
+            digest = hashlib.sha256(f"{counter}\0{text}".encode("utf-8")).digest()
+            values.extend(b / 127.5 - 1.0 for b in digest)
+            counter += 1
+        values = values[:self.dimensions]
+        norm = sum(v * v for v in values) ** 0.5 or 1.0
+        return [v / norm for v in values]
+
+    def generate(self, schema: Optional[Dict[str, Any]], prompt: str) -> Any:
+        """
+        Generate a value that satisfies a JSON schema.
+
+        Args:
+            schema (Optional[Dict[str, Any]]): JSON schema passed as the response format.
+            prompt (str): Prompt text, used to seed the generated strings.
+
+        Returns:
+            Any: JSON-compatible value conforming to the schema.
+        """
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        return self._generate(schema or {"type": "object", "properties": {}}, schema or {}, rng, "value", 0)
+
+    def _generate(self, schema: Dict[str, Any], root: Dict[str, Any], rng: random.Random, name: str, depth: int) -> Any:
+        """Recursively generate a value for a (sub)schema."""
+        if "$ref" in schema:
+            return self._generate(root["$defs"][schema["$ref"].split("/")[-1]], root, rng, name, depth)
+        if "anyOf" in schema:
+            options = [option for option in schema["anyOf"] if option.get("type") != "null"]
+            # Nest objects for the first levels, then fall back to the last option (e.g., plain strings)
+            option = options[0] if depth <= 4 else options[-1]
+            return self._generate(option, root, rng, name, depth)
+        kind = schema.get("type", "string")
+        if kind == "object":
+            return {
+                key: self._generate(value, root, rng, key, depth + 1)
+                for key, value in schema.get("properties", {}).items()
+            }
+        if kind == "array":
+            length = self.list_length if depth <= 1 else (2 if depth <= 3 else 0)
+            return [self._generate(schema.get("items", {}), root, rng, name, depth + 1) for _ in range(length)]
+        if kind in ("integer", "number"):
+            return rng.randint(1, 100)
+        if kind == "boolean":
+            return rng.random() < 0.5
+        if name == "structure":
+            return rng.choice(STRUCTURES)
+        if name in ("title", "missing"):
+            return f"{rng.choice(VOCABULARY).capitalize()} and {rng.choice(VOCABULARY)}"
+        return f"*{rng.choice(VOCABULARY)}*: " + " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(4, 12)))
+
+    def _chat_response(self, model: str, messages: Optional[List[Dict[str, Any]]], format: Any) -> tuple:
+        """Build a chat response and the latency it simulates."""
+        self._count("chat")
+        prompt = (messages or [{}])[-1].get("content", "")
+        content = json.dumps(self.generate(format if isinstance(format, dict) else None, prompt))
+        prompt_tokens = max(1, len(prompt) // 4)
+        eval_tokens = max(1, len(content) // 4)
+        seconds = self.chat_latency + eval_tokens * self.token_latency
+        response = ChatResponse(
+            model=model,
+            done=True,
+            message=Message(role="assistant", content=content),
+            prompt_eval_count=prompt_tokens,
+            eval_count=eval_tokens,
+            total_duration=int(seconds * 1e9),
+            prompt_eval_duration=int(self.chat_latency * 1e9),
+            eval_duration=int(eval_tokens * self.token_latency * 1e9)
+        )
+        return response, seconds
+
+    def _embed_response(self, model: str, input: Union[str, List[str]]) -> tuple:
+        """Build an embed response and the latency it simulates."""
+        texts = [input] if isinstance(input, str) else list(input)
+        self._count("embed")
+        self._count("embedded_texts", len(texts))
+        seconds = self.embed_latency + len(texts) * self.embed_text_latency
+        response = EmbedResponse(
+            model=model,
+            embeddings=[self.embedding(text) for text in texts],
+            prompt_eval_count=sum(max(1, len(text) // 4) for text in texts),
+            total_duration=int(seconds * 1e9)
+        )
+        return response, seconds
+
+    def _async_slot(self) -> asyncio.Semaphore:
+        """Return the request slots of the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._async_slots:
+                self._async_slots[loop] = asyncio.Semaphore(self.parallel)
+            return self._async_slots[loop]
+
+    def chat(self, model: str = "", messages: Optional[List[Dict[str, Any]]] = None, format: Any = None, options: Any = None, **kwargs: Any) -> ChatResponse:
+        """
+        Answer a chat request with schema-valid JSON content.
+
+        Args:
+            model (str): Model name, echoed in the response.
+            messages (Optional[List[Dict[str, Any]]]): Chat messages; the last one is the prompt.
+            format (Any): JSON schema of the expected output.
+            options (Any): Generation options (ignored).
+            **kwargs (Any): Other Ollama arguments (ignored).
+
+        Returns:
+            ChatResponse: Response with token counts and durations in nanoseconds.
+        """
+        response, seconds = self._chat_response(model, messages, format)
+        with self._slots:
+            time.sleep(seconds)
+        return response
+
+    async def achat(self, model: str = "", messages: Optional[List[Dict[str, Any]]] = None, format: Any = None, options: Any = None, **kwargs: Any) -> ChatResponse:
+        """Async variant of chat; latency is simulated without blocking the event loop."""
+        response, seconds = self._chat_response(model, messages, format)
+        async with self._async_slot():
+            await asyncio.sleep(seconds)
+        return response
+
+    def embed(self, model: str = "", input: Union[str, List[str]] = "", **kwargs: Any) -> EmbedResponse:
+        """
+        Answer an embed request with deterministic vectors.
+
+        Args:
+            model (str): Model name, echoed in the response.
+            input (Union[str, List[str]]): Text or texts to embed.
+            **kwargs (Any): Other Ollama arguments (ignored).
+
+        Returns:
+            EmbedResponse: One vector per input text.
+        """
+        response, seconds = self._embed_response(model, input)
+        with self._slots:
+            time.sleep(seconds)
+        return response
+
+    async def aembed(self, model: str = "", input: Union[str, List[str]] = "", **kwargs: Any) -> EmbedResponse:
+        """Async variant of embed."""
+        response, seconds = self._embed_response(model, input)
+        async with self._async_slot():
+            await asyncio.sleep(seconds)
+        return response
+
+    def client(self, *args: Any, **kwargs: Any) -> "FakeClient":
+        """Create a synchronous client bound to this backend (replaces ollama.Client)."""
+        return FakeClient(self)
+
+    def async_client(self, *args: Any, **kwargs: Any) -> "FakeAsyncClient":
+        """Create an asynchronous client bound to this backend (replaces ollama.AsyncClient)."""
+        return FakeAsyncClient(self)
+
+class FakeClient:
+    """Drop-in for ollama.Client that forwards to a FakeOllama."""
+
+    def __init__(self, backend: FakeOllama):
+        self.backend = backend
+
+    def chat(self, *args: Any, **kwargs: Any) -> ChatResponse:
+        return self.backend.chat(*args, **kwargs)
+
+    def embed(self, *args: Any, **kwargs: Any) -> EmbedResponse:
+        return self.backend.embed(*args, **kwargs)
+
+class FakeAsyncClient:
+    """Drop-in for ollama.AsyncClient that forwards to a FakeOllama's async methods."""
+
+    def __init__(self, backend: FakeOllama):
+        self.backend = backend
+
+    async def chat(self, *args: Any, **kwargs: Any) -> ChatResponse:
+        return await self.backend.achat(*args, **kwargs)
+
+    async def embed(self, *args: Any, **kwargs: Any) -> EmbedResponse:
+        return await self.backend.aembed(*args, **kwargs)
+
+@contextmanager
+def patched_ollama(backend: FakeOllama) -> Iterator[FakeOllama]:
+    """
+    Route the ollama module's chat, embed, Client and AsyncClient to a fake backend.
+
+    Args:
+        backend (FakeOllama): Backend answering the requests.
+
+    Yields:
+        FakeOllama: The installed backend.
+    """
+    names = ("chat", "embed", "Client", "AsyncClient")
+    originals = {name: getattr(ollama, name) for name in names}
+    ollama.chat = backend.chat
+    ollama.embed = backend.embed
+    ollama.Client = backend.client
+    ollama.AsyncClient = backend.async_client
+    try:
+        yield backend
+    finally:
+        for name, original in originals.items():
+            setattr(ollama, name, original)
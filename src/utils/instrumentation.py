@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import uuid
+import threading
+import inspect
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from src.utils.config import get_setting
+
+# Ollama response fields copied onto LLM and embedding spans; durations are reported in nanoseconds
+OLLAMA_COUNT_FIELDS = ("prompt_eval_count", "eval_count")
+OLLAMA_DURATION_FIELDS = ("total_duration", "load_duration", "prompt_eval_duration", "eval_duration")
+
+_current_span: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_span", default=None)
+
+class Tracer:
+    """
+    Collects timing spans for a run and exports them as JSON lines.
+
+    Each span records its name, parent span, wall time, thread and free-form attributes
+    (e.g., section title, token counts, cache hits). Spans are appended to the trace file
+    as they finish, so a crashed run keeps the spans it completed.
+    """
+
+    def __init__(self, trace_path: Optional[str] = None):
+        """
+        Create a tracer.
+
+        Args:
+            trace_path (Optional[str]): JSON lines file to append finished spans to, or None.
+        """
+        self.trace_path = trace_path
+        self.run_id = uuid.uuid4().hex[:12]
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Time a block of work.
+
+        The yielded dict can be updated inside the block to attach more attributes.
+
+        Args:
+            name (str): Span name (e.g., 'worker.gap', 'llm.call').
+            **attrs (Any): Initial span attributes.
+
+        Yields:
+            Dict[str, Any]: Mutable span attributes.
+        """
+        span_id = uuid.uuid4().hex[:12]
+        parent = _current_span.get()
+        token = _current_span.set(span_id)
+        started_at = time.time()
+        started = time.perf_counter()
+        error = None
+        try:
+            yield attrs
+        except BaseException as e:
+            error = f"{type(e).__name__}: {str(e)}"
+            raise
+        finally:
+            _current_span.reset(token)
+            self.record({
+                "run_id": self.run_id,
+                "span_id": span_id,
+                "parent_id": parent,
+                "name": name,
+                "start": started_at,
+                "seconds": time.perf_counter() - started,
+                "thread": threading.current_thread().name,
+                "error": error,
+                "attrs": attrs
+            })
+
+    def record(self, span: Dict[str, Any]) -> None:
+        """
+        Store a finished span and append it to the trace file.
+
+        Args:
+            span (Dict[str, Any]): Span record.
+        """
+        with self._lock:
+            self.spans.append(span)
+            if self.trace_path:
+                directory = os.path.dirname(self.trace_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.trace_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(span, default=str) + "\n")
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Aggregate spans by name.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Per span name: count, total/mean/max seconds, errors,
+            cache hits and summed Ollama token counts and durations (as 'ollama_*_seconds').
+        """
+        with self._lock:
+            spans = list(self.spans)
+        summary: Dict[str, Dict[str, Any]] = {}
+        for span in spans:
+            entry = summary.setdefault(span["name"], {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0, "errors": 0, "cache_hits": 0})
+            entry["count"] += 1
+            entry["total_seconds"] += span["seconds"]
+            entry["max_seconds"] = max(entry["max_seconds"], span["seconds"])
+            entry["errors"] += span["error"] is not None
+            attrs = span["attrs"]
+            entry["cache_hits"] += bool(attrs.get("cache_hit"))
+            for field in OLLAMA_COUNT_FIELDS:
+                if attrs.get(field) is not None:
+                    entry[field] = entry.get(field, 0) + attrs[field]
+            for field in OLLAMA_DURATION_FIELDS:
+                if attrs.get(field) is not None:
+                    key = "ollama_" + field.replace("_duration", "_seconds")
+                    entry[key] = entry.get(key, 0.0) + attrs[field] / 1e9
+        for entry in summary.values():
+            entry["mean_seconds"] = entry["total_seconds"] / entry["count"]
+        return summary
+
+    def print_summary(self) -> None:
+        """Print the per-span summary, slowest total time first."""
+        summary = self.summary()
+        if not summary:
+            return
+        print(f"Run {self.run_id} timing summary:")
+        print(f"  {'span':<28}{'count':>7}{'total s':>10}{'mean s':>9}{'max s':>9}{'prompt tok':>12}{'eval tok':>10}{'cached':>8}")
+        for name, entry in sorted(summary.items(), key=lambda item: -item[1]["total_seconds"]):
+            print(
+                f"  {name:<28}{entry['count']:>7}{entry['total_seconds']:>10.2f}{entry['mean_seconds']:>9.2f}"
+                f"{entry['max_seconds']:>9.2f}{entry.get('prompt_eval_count', 0):>12}{entry.get('eval_count', 0):>10}"
+                f"{entry['cache_hits']:>8}"
+            )
+        if self.trace_path:
+            print(f"  Trace written to {self.trace_path}")
+
+def response_metrics(response: Any) -> Dict[str, Any]:
+    """
+    Extract token counts and durations from an Ollama chat or embed response.
+
+    Args:
+        response (Any): Ollama response object or dict.
+
+    Returns:
+        Dict[str, Any]: The fields present in the response.
+    """
+    metrics = {}
+    for field in OLLAMA_COUNT_FIELDS + OLLAMA_DURATION_FIELDS:
+        try:
+            value = response.get(field)
+        except AttributeError:
+            value = None
+        if value is not None:
+            metrics[field] = value
+    return metrics
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+def get_tracer() -> Tracer:
+    """
+    Return the process-wide tracer configured in instrumentation_settings.
+
+    Returns:
+        Tracer: Shared tracer; its trace file is None when tracing to disk is disabled.
+    """
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            trace_path = None
+            if get_setting("instrumentation_settings", "enabled", True):
+                trace_dir = get_setting("instrumentation_settings", "trace_dir", "./traces")
+                trace_path = os.path.join(trace_dir, f"trace_{time.strftime('%Y%m%d_%H%M%S')}.jsonl")
+            _tracer = Tracer(trace_path)
+    return _tracer
+
+def reset_tracer(trace_path: Optional[str] = None) -> Tracer:
+    """
+    Replace the process-wide tracer, e.g. to measure one benchmark run in isolation.
+
+    Args:
+        trace_path (Optional[str]): JSON lines file for the new tracer, or None.
+
+    Returns:
+        Tracer: The new shared tracer.
+    """
+    global _tracer
+    with _tracer_lock:
+        _tracer = Tracer(trace_path)
+    return _tracer
+
+def span(name: str, **attrs: Any):
+    """
+    Time a block of work with the shared tracer.
+
+    Args:
+        name (str): Span name.
+        **attrs (Any): Initial span attributes.
+
+    Returns:
+        ContextManager[Dict[str, Any]]: Context manager yielding the mutable span attributes.
+    """
+    return get_tracer().span(name, **attrs)
+
+def traced(name: str) -> Callable[[Callable], Callable]:
+    """
+    Decorate a function so every call is timed as a span.
+
+    Coroutine functions are timed until the coroutine completes.
+
+    Args:
+        name (str): Span name (e.g., 'node.orchestrator').
+
+    Returns:
+        Callable[[Callable], Callable]: Decorator wrapping the function in a span.
+    """
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
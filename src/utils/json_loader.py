@@ -1,116 +1,250 @@
 import os
 import json
-from typing import List, Tuple
+import codecs
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from src.utils.config import get_setting
 
-def load_json_files(json_path: str) -> Tuple[List[str], List[str]]:
+# Byte order marks, longest first so UTF-32 LE is not mistaken for UTF-16 LE
+BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16")
+)
+
+# Article metadata copied onto records (and from there onto chunks)
+METADATA_FIELDS = ("title", "url")
+
+Record = Tuple[str, str, Dict[str, Any]]
+
+def sniff_encoding(raw: bytes) -> str:
     """
-    Load text content and sources from JSON files in a directory or single file.
+    Detect the text encoding of a file's bytes in one pass.
+
+    A byte order mark wins; otherwise the bytes are UTF-8 if they decode as such,
+    then Windows-1252, with Latin-1 (which decodes anything) as the last resort.
 
     Args:
-        json_path (str): Path to a JSON file or directory containing JSON files.
+        raw (bytes): File content.
 
     Returns:
-        Tuple[List[str], List[str]]: Lists of text content and corresponding source filenames.
-
-    Raises:
-        ValueError: If json_path is neither a valid file nor directory.
+        str: Python codec name.
     """
+    for bom, encoding in BOMS:
+        if raw.startswith(bom):
+            return encoding
+    for encoding in ("utf-8", "cp1252"):
+        try:
+            raw.decode(encoding)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return "latin-1"
+
+def _item_texts(items: List[Any]) -> List[str]:
+    """Collect the text of list items: strings, or dicts with 'markdown', 'content' or 'text'."""
     texts = []
-    sources = []
-    encodings = ["utf-8", "utf-8-sig", "latin-1", "cp1252", "cp950"]
-
-    def process_file(file_path: str) -> None:
-        if os.path.getsize(file_path) == 0:
-            print(f"Warning: Empty JSON file '{file_path}' skipped")
-            return
-        for encoding in encodings:
-            try:
-                with open(file_path, "r", encoding=encoding) as f:
-                    data = json.load(f)
-                    if not data:
-                        print(f"Warning: No data in JSON file '{file_path}'")
-                        return
-                    # Handle UpToDate JSON structure with "content.markdown"
-                    if isinstance(data, dict) and "content" in data and isinstance(data["content"], dict) and "markdown" in data["content"]:
-                        markdown = data["content"]["markdown"]
-                        if isinstance(markdown, str):
-                            texts.append(markdown)
-                            sources.append(os.path.basename(file_path))
-                            print(f"Successfully processed '{file_path}' with {encoding} encoding (content.markdown structure)")
-                            return
-                        else:
-                            print(f"Error: 'markdown' field in '{file_path}' is not a string, got {type(markdown)}")
-                    # Fallback for other structures
-                    elif isinstance(data, dict):
-                        if "content" in data and isinstance(data["content"], str):
-                            texts.append(data["content"])
-                            sources.append(os.path.basename(file_path))
-                            print(f"Successfully processed '{file_path}' with {encoding} encoding (dict with content)")
-                            return
-                        elif "text" in data and isinstance(data["text"], str):
-                            texts.append(data["text"])
-                            sources.append(os.path.basename(file_path))
-                            print(f"Successfully processed '{file_path}' with {encoding} encoding (dict with text)")
-                            return
-                        elif "data" in data and isinstance(data["data"], list):
-                            content_items = []
-                            for item in data["data"]:
-                                if isinstance(item, dict):
-                                    if "markdown" in item:
-                                        content_items.append(item["markdown"])
-                                    elif "content" in item:
-                                        content_items.append(item["content"])
-                                    elif "text" in item:
-                                        content_items.append(item["text"])
-                                elif isinstance(item, str):
-                                    content_items.append(item)
-                            if content_items:
-                                texts.extend([item for item in content_items if isinstance(item, str)])
-                                sources.extend([os.path.basename(file_path)] * len(content_items))
-                                print(f"Successfully processed '{file_path}' with {encoding} encoding (nested data list)")
-                                return
-                        else:
-                            print(f"Error: No valid text field ('markdown', 'content', or 'text') in dictionary structure in '{file_path}'")
-                    elif isinstance(data, list):
-                        content_items = []
-                        for item in data:
-                            if isinstance(item, dict):
-                                if "markdown" in item:
-                                    content_items.append(item["markdown"])
-                                elif "content" in item:
-                                    content_items.append(item["content"])
-                                elif "text" in item:
-                                    content_items.append(item["text"])
-                            elif isinstance(item, str):
-                                content_items.append(item)
-                        if content_items:
-                            texts.extend([item for item in content_items if isinstance(item, str)])
-                            sources.extend([os.path.basename(file_path)] * len(content_items))
-                            print(f"Successfully processed '{file_path}' with {encoding} encoding (list structure)")
-                            return
-                    else:
-                        print(f"Error: Unexpected JSON structure in '{file_path}': {type(data)}")
-                    return
-            except json.JSONDecodeError as e:
-                print(f"Error: Failed to parse JSON in '{file_path}' with {encoding}: {str(e)}")
-                continue
-            except UnicodeDecodeError as e:
-                print(f"Error: Unicode decode issue in '{file_path}' with {encoding}: {str(e)}")
-                continue
-            except Exception as e:
-                print(f"Error: Unexpected issue in '{file_path}' with {encoding}: {str(e)}")
-                continue
-        print(f"Error: Could not process '{file_path}' with any encoding")
+    for item in items:
+        if isinstance(item, dict):
+            for key in ("markdown", "content", "text"):
+                if key in item:
+                    texts.append(item[key])
+                    break
+        elif isinstance(item, str):
+            texts.append(item)
+    return [text for text in texts if isinstance(text, str)]
+
+def extract_texts(data: Any) -> Tuple[List[str], str]:
+    """
+    Extract article texts from parsed JSON.
+
+    Handles the UpToDate export ('content.markdown'), dicts with a 'content' or 'text'
+    string or a 'data' list, and top-level lists.
+
+    Args:
+        data (Any): Parsed JSON document.
+
+    Returns:
+        Tuple[List[str], str]: Texts found, and a description of the structure (or of
+        the problem when no text was found).
+    """
+    if isinstance(data, dict) and isinstance(data.get("content"), dict) and "markdown" in data["content"]:
+        markdown = data["content"]["markdown"]
+        if isinstance(markdown, str):
+            return [markdown], "content.markdown structure"
+        return [], f"'markdown' field is not a string, got {type(markdown)}"
+    if isinstance(data, dict):
+        if isinstance(data.get("content"), str):
+            return [data["content"]], "dict with content"
+        if isinstance(data.get("text"), str):
+            return [data["text"]], "dict with text"
+        if isinstance(data.get("data"), list):
+            return _item_texts(data["data"]), "nested data list"
+        return [], "no valid text field ('markdown', 'content', or 'text') in dictionary structure"
+    if isinstance(data, list):
+        return _item_texts(data), "list structure"
+    return [], f"unexpected JSON structure: {type(data)}"
+
+def parse_json_file(file_path: str, source: str) -> Tuple[List[Record], List[str]]:
+    """
+    Read and parse one JSON file into records.
+
+    Runs in loader worker processes, so log lines are returned for the parent to print.
+
+    Args:
+        file_path (str): File to parse.
+        source (str): Source name recorded for its texts.
+
+    Returns:
+        Tuple[List[Record], List[str]]: (text, source, metadata) records and log lines.
+    """
+    try:
+        with open(file_path, "rb") as f:
+            raw = f.read()
+    except OSError as e:
+        return [], [f"Error: Could not read '{file_path}': {str(e)}"]
+    if not raw.strip():
+        return [], [f"Warning: Empty JSON file '{file_path}' skipped"]
+    encoding = sniff_encoding(raw)
+    try:
+        data = json.loads(raw.decode(encoding))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        return [], [f"Error: Failed to parse JSON in '{file_path}' with {encoding}: {str(e)}"]
+    if not data:
+        return [], [f"Warning: No data in JSON file '{file_path}'"]
+    texts, structure = extract_texts(data)
+    if not texts:
+        return [], [f"Error: No text extracted from '{file_path}': {structure}"]
+    article = data.get("metadata") if isinstance(data, dict) else None
+    metadata = {
+        field: article[field] for field in METADATA_FIELDS
+        if isinstance(article, dict) and isinstance(article.get(field), str) and article[field]
+    }
+    records = [(text, source, metadata) for text in texts]
+    return records, [f"Successfully processed '{file_path}' with {encoding} encoding ({structure})"]
+
+def source_root(json_path: str) -> str:
+    """
+    Return the directory that source names are relative to.
+
+    Sources are named relative to ingestion_settings.corpus_root, so a file keeps its
+    name (and its chunk ids) whether it is ingested alone, with its directory or with
+    the whole corpus. A path outside the corpus root is named relative to itself (a
+    file relative to its directory).
+
+    Args:
+        json_path (str): JSON file or directory being ingested.
+
+    Returns:
+        str: Absolute directory that source names are relative to.
+    """
+    root = os.path.abspath(get_setting("ingestion_settings", "corpus_root", "json_data"))
+    path = os.path.abspath(json_path)
+    if os.path.commonpath([root, path]) == root:
+        return root
+    return path if os.path.isdir(path) else os.path.dirname(path)
+
+def find_json_files(json_path: str) -> List[Tuple[str, str]]:
+    """
+    List the JSON files under a path, recursing into subdirectories.
+
+    Args:
+        json_path (str): JSON file or directory.
 
+    Returns:
+        List[Tuple[str, str]]: File paths and their source names, in sorted order. The
+        source is the path relative to source_root(json_path).
+
+    Raises:
+        ValueError: If json_path is neither a JSON file nor a directory.
+    """
     if os.path.isfile(json_path) and json_path.endswith(".json"):
-        process_file(json_path)
+        paths = [json_path]
     elif os.path.isdir(json_path):
-        for file in os.listdir(json_path):
-            if file.endswith(".json"):
-                process_file(os.path.join(json_path, file))
+        paths = []
+        for directory, subdirectories, names in os.walk(json_path):
+            subdirectories.sort()
+            paths.extend(os.path.join(directory, name) for name in sorted(names) if name.endswith(".json"))
     else:
         raise ValueError(f"Error: '{json_path}' is neither a valid JSON file nor a directory")
-    
-    if not texts:
+    root = source_root(json_path)
+    # Forward slashes keep source names (and chunk ids) the same on every platform
+    return [(path, os.path.relpath(os.path.abspath(path), root).replace(os.sep, "/")) for path in paths]
+
+def iter_json_records(json_path: str, workers: Optional[int] = None, unloaded: Optional[Set[str]] = None) -> Iterator[Record]:
+    """
+    Stream (text, source, metadata) records from JSON files, in file order.
+
+    Files are parsed in a process pool when there are at least
+    ingestion_settings.loader_pool_min_files of them. At most a few files per worker
+    are parsed ahead of the consumer, so memory stays bounded by the files in flight
+    rather than the corpus.
+
+    Args:
+        json_path (str): JSON file or directory (searched recursively).
+        workers (Optional[int]): Parser processes (default: ingestion_settings.loader_workers).
+        unloaded (Optional[Set[str]]): Filled with the sources of files that yielded no records.
+
+    Yields:
+        Record: Article text, source path relative to source_root(json_path), and article metadata.
+
+    Raises:
+        ValueError: If json_path is neither a JSON file nor a directory.
+    """
+    files = find_json_files(json_path)
+    workers = workers or get_setting("ingestion_settings", "loader_workers", 4)
+    found = 0
+    if workers <= 1 or len(files) < get_setting("ingestion_settings", "loader_pool_min_files", 16):
+        results = (parse_json_file(path, source) for path, source in files)
+    else:
+        results = _parse_in_pool(files, workers)
+    # Both parsers return results in file order
+    for (_, source), (records, messages) in zip(files, results):
+        for message in messages:
+            print(message)
+        if not records and unloaded is not None:
+            unloaded.add(source)
+        found += len(records)
+        yield from records
+    if not found:
         print(f"Warning: No valid content extracted from '{json_path}'")
-    return texts, sources
\ No newline at end of file
+
+def _parse_in_pool(files: List[Tuple[str, str]], workers: int) -> Iterator[Tuple[List[Record], List[str]]]:
+    """Parse files in worker processes, keeping a bounded window of files in flight."""
+    # Spawned workers do not inherit the parent's threads (Chroma, embedding pools)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        remaining = iter(files)
+        in_flight = deque(executor.submit(parse_json_file, path, source) for path, source in itertools.islice(remaining, workers * 2))
+        while in_flight:
+            result = in_flight.popleft().result()
+            following = next(remaining, None)
+            if following is not None:
+                in_flight.append(executor.submit(parse_json_file, *following))
+            yield result
+
+def load_json_files(json_path: str) -> Tuple[List[str], List[str]]:
+    """
+    Load text content and sources from JSON files in a directory or single file.
+
+    Collects iter_json_records into lists; prefer the generator for large corpora.
+
+    Args:
+        json_path (str): Path to a JSON file or directory containing JSON files.
+
+    Returns:
+        Tuple[List[str], List[str]]: Lists of text content and corresponding source names.
+
+    Raises:
+        ValueError: If json_path is neither a valid file nor directory.
+    """
+    texts, sources = [], []
+    for text, source, _ in iter_json_records(json_path):
+        texts.append(text)
+        sources.append(source)
+    return texts, sources
@@ -0,0 +1,218 @@
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from src.utils.config import get_setting
+
+# Words, and numbers with decimal parts kept together (e.g., '12.5')
+TOKEN = re.compile(r"\d+(?:[.,]\d+)*|\w+")
+STOPWORDS = frozenset((
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "into", "is", "it",
+    "of", "on", "or", "the", "to", "with", "what", "which", "how", "context"
+))
+
+def query_terms(text: str) -> List[str]:
+    """
+    Split a query into lowercase search terms, dropping stopwords.
+
+    Args:
+        text (str): Free-text query.
+
+    Returns:
+        List[str]: Terms in query order without duplicates.
+    """
+    terms = [token.lower() for token in TOKEN.findall(text)]
+    return list(dict.fromkeys(term for term in terms if term not in STOPWORDS))
+
+def lexical_index_path(db_path: str, collection_name: str) -> str:
+    """
+    Return the location of a collection's lexical index inside a ChromaDB directory.
+
+    Args:
+        db_path (str): ChromaDB persistence directory.
+        collection_name (str): Collection the index mirrors.
+
+    Returns:
+        str: Path of the SQLite index file.
+    """
+    return os.path.join(db_path, f"lexical_{collection_name}.sqlite")
+
+class LexicalIndex:
+    """
+    BM25 inverted index over the chunks of a Chroma collection.
+
+    Backed by an SQLite FTS5 table whose rows map to the same chunk ids as the
+    collection, so lexical and vector hits can be fused. Numbers such as '12.5' are
+    matched as phrases of their digit groups, which the FTS5 tokenizer indexes separately.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (or create) a lexical index.
+
+        Args:
+            path (str): SQLite database file path.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Ids live in a plain table so lookups by id use an index; FTS5 rows share its rowid
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs (rowid INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, source TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(text, tokenize='unicode61 remove_diacritics 2')")
+        self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS chunks_vocab USING fts5vocab(chunks, 'row')")
+        self._conn.commit()
+
+    def _delete(self, ids: Sequence[str]) -> None:
+        """Remove ids from both tables; the caller holds the lock and commits."""
+        for id_ in ids:
+            row = self._conn.execute("SELECT rowid FROM docs WHERE id = ?", (id_,)).fetchone()
+            if row is not None:
+                self._conn.execute("DELETE FROM chunks WHERE rowid = ?", row)
+                self._conn.execute("DELETE FROM docs WHERE rowid = ?", row)
+
+    def add(self, ids: Sequence[str], texts: Sequence[str], sources: Sequence[str]) -> None:
+        """
+        Index chunks, replacing any previous entries with the same ids.
+
+        Args:
+            ids (Sequence[str]): Chunk ids as stored in the collection.
+            texts (Sequence[str]): Chunk texts.
+            sources (Sequence[str]): Source filenames.
+        """
+        with self._lock:
+            self._delete(ids)
+            for id_, text, source in zip(ids, texts, sources):
+                rowid = self._conn.execute("INSERT INTO docs (id, source) VALUES (?, ?)", (id_, source)).lastrowid
+                self._conn.execute("INSERT INTO chunks (rowid, text) VALUES (?, ?)", (rowid, text))
+            self._conn.commit()
+
+    def delete(self, ids: Sequence[str]) -> None:
+        """
+        Remove chunks from the index.
+
+        Args:
+            ids (Sequence[str]): Chunk ids to remove.
+        """
+        with self._lock:
+            self._delete(ids)
+            self._conn.commit()
+
+    def ids(self) -> Set[str]:
+        """
+        Return every indexed chunk id.
+
+        Returns:
+            Set[str]: Indexed ids.
+        """
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT id FROM docs")}
+
+    def count(self) -> int:
+        """
+        Count indexed chunks.
+
+        Returns:
+            int: Number of chunks in the index.
+        """
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def search(self, query: str, n_results: int, sources: Optional[Sequence[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Rank chunks for a query with BM25.
+
+        Any query term may match; chunks matching more and rarer terms rank higher.
+
+        Args:
+            query (str): Free-text query.
+            n_results (int): Maximum number of hits.
+            sources (Optional[Sequence[str]]): Restrict hits to these source filenames.
+
+        Returns:
+            List[Tuple[str, float]]: Chunk ids and BM25 scores, best first (higher is better).
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+        with self._lock:
+            terms = self._selective_terms(terms)
+        # Quote every term so FTS5 operators in user text are taken literally
+        match = " OR ".join('"' + " ".join(TOKEN.findall(term.replace(".", " ").replace(",", " "))) + '"' for term in terms)
+        sql = "SELECT docs.id, bm25(chunks) FROM chunks JOIN docs ON docs.rowid = chunks.rowid WHERE chunks MATCH ?"
+        params: list = [match]
+        if sources:
+            sql += f" AND docs.source IN ({','.join('?' * len(sources))})"
+            params.extend(sources)
+        sql += " ORDER BY bm25(chunks) LIMIT ?"
+        params.append(n_results)
+        with self._lock:
+            try:
+                rows = self._conn.execute(sql, params).fetchall()
+            except sqlite3.OperationalError as e:
+                print(f"Error in lexical search for '{query}': {str(e)}")
+                return []
+        return [(id_, -score) for id_, score in rows]
+
+    def _selective_terms(self, terms: List[str]) -> List[str]:
+        """
+        Drop single-word terms that occur in most chunks; the caller holds the lock.
+
+        Such terms (e.g., the topic name) add almost nothing to BM25 scores but make
+        every chunk a match that must be scored. The rarest term is always kept.
+        """
+        total = self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+        max_ratio = get_setting("retrieval_settings", "lexical_max_df_ratio", 0.5)
+        frequencies = {}
+        for term in terms:
+            if TOKEN.fullmatch(term) and not any(c in term for c in ".,"):
+                row = self._conn.execute("SELECT doc FROM chunks_vocab WHERE term = ?", (term,)).fetchone()
+                frequencies[term] = row[0] if row else 0
+        common = {term for term, df in frequencies.items() if df > max_ratio * total}
+        selective = [term for term in terms if term not in common]
+        if not selective and frequencies:
+            selective = [min(frequencies, key=frequencies.get)]
+        return selective
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+_indexes: Dict[str, LexicalIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_lexical_index(db_path: Optional[str] = None, collection_name: Optional[str] = None) -> Optional[LexicalIndex]:
+    """
+    Return the shared lexical index of a collection.
+
+    Args:
+        db_path (Optional[str]): ChromaDB persistence directory (default: ingestion_settings.db_path).
+        collection_name (Optional[str]): Collection name (default: ingestion_settings.collection_name).
+
+    Returns:
+        Optional[LexicalIndex]: The index, or None when retrieval_settings.lexical_index is disabled.
+    """
+    if not get_setting("retrieval_settings", "lexical_index", True):
+        return None
+    path = lexical_index_path(
+        db_path or get_setting("ingestion_settings", "db_path", "./chroma_db"),
+        collection_name or get_setting("ingestion_settings", "collection_name", "notes")
+    )
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = LexicalIndex(path)
+        return _indexes[path]
+
+def reset_lexical_indexes() -> None:
+    """Close the shared lexical indexes so the next access reopens them."""
+    with _indexes_lock:
+        for index in _indexes.values():
+            index.close()
+        _indexes.clear()
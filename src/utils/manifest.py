@@ -0,0 +1,97 @@
+import os
+import json
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+MANIFEST_FILENAME = "ingest_manifest.json"
+
+# Manifest digests by path, with the modification time they were computed at
+_digests: Dict[str, Tuple[int, str]] = {}
+
+def manifest_path(db_path: str) -> str:
+    """
+    Return the location of the ingestion manifest for a ChromaDB directory.
+
+    Args:
+        db_path (str): ChromaDB persistence directory.
+
+    Returns:
+        str: Path of the manifest JSON file inside db_path.
+    """
+    return os.path.join(db_path, MANIFEST_FILENAME)
+
+def read_manifest(path: str) -> Optional[Dict[str, Any]]:
+    """
+    Read an ingestion manifest without opening the ChromaDB collection.
+
+    Args:
+        path (str): Path to the manifest JSON file.
+
+    Returns:
+        Optional[Dict[str, Any]]: Manifest with 'collection', 'sources' and (when recorded)
+        'embedding' keys, or None if the file is missing or unreadable.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Warning: Could not read manifest '{path}': {str(e)}")
+        return None
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("sources"), dict):
+        print(f"Warning: Manifest '{path}' has an unexpected structure")
+        return None
+    return manifest
+
+def write_manifest(
+    path: str,
+    collection_name: str,
+    sources: Dict[str, List[str]],
+    embedding: Optional[Dict[str, Any]] = None
+) -> None:
+    """
+    Atomically write an ingestion manifest.
+
+    Args:
+        path (str): Path to the manifest JSON file.
+        collection_name (str): Name of the collection the manifest describes.
+        sources (Dict[str, List[str]]): Source filenames mapped to their stored ids.
+        embedding (Optional[Dict[str, Any]]): Embedding 'model' and 'dimension' of the stored vectors.
+    """
+    manifest: Dict[str, Any] = {"collection": collection_name, "sources": sources}
+    if embedding:
+        manifest["embedding"] = embedding
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def manifest_digest(path: str) -> Optional[str]:
+    """
+    Digest the corpus an ingestion manifest describes.
+
+    Chunk ids are derived from content, so the digest changes whenever a chunk is
+    added, edited or removed, or the corpus is embedded with another model. Digests
+    are cached until the file is rewritten.
+
+    Args:
+        path (str): Path to the manifest JSON file.
+
+    Returns:
+        Optional[str]: Hex SHA-256 digest, or None if there is no readable manifest.
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _digests.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    manifest = read_manifest(path)
+    if manifest is None:
+        return None
+    payload = json.dumps({"sources": manifest["sources"], "embedding": manifest.get("embedding")}, sort_keys=True)
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    _digests[path] = (mtime, digest)
+    return digest
@@ -0,0 +1,187 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Optional
+import httpx
+import ollama
+from src.utils.config import get_setting
+
+def client_options() -> dict:
+    """
+    Build the HTTP options shared by Ollama clients from ollama_settings.
+
+    Returns:
+        dict: Keyword arguments for ollama.Client/AsyncClient (host, timeout, pool limits).
+    """
+    max_connections = get_setting("ollama_settings", "max_connections", 16)
+    options = {
+        "timeout": httpx.Timeout(get_setting("ollama_settings", "timeout_seconds", 300), connect=10.0),
+        # Idle connections are kept open, so consecutive requests skip the TCP handshake
+        "limits": httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=get_setting("ollama_settings", "keepalive_seconds", 60)
+        )
+    }
+    host = get_setting("ollama_settings", "host", None)
+    if host:
+        options["host"] = host
+    return options
+
+_client: Optional[Any] = None
+_client_factory: Optional[Any] = None
+_client_lock = threading.Lock()
+
+def get_client() -> "ollama.Client":
+    """
+    Return the pooled synchronous Ollama client shared by all threads.
+
+    Requests are bounded by ollama_settings.timeout_seconds and reuse the client's
+    keep-alive connections. A new client is created if ollama.Client was replaced
+    (e.g., by src.utils.fake_ollama.patched_ollama).
+
+    Returns:
+        ollama.Client: Shared client.
+    """
+    global _client, _client_factory
+    with _client_lock:
+        if _client is None or _client_factory is not ollama.Client:
+            _client = ollama.Client(**client_options())
+            _client_factory = ollama.Client
+        return _client
+
+def reset_client() -> None:
+    """Drop the shared synchronous client, so the next request reads ollama_settings again."""
+    global _client, _client_factory
+    with _client_lock:
+        _client = None
+        _client_factory = None
+
+_async_client: Optional[Any] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_async_client_lock = threading.Lock()
+
+def get_async_client() -> "ollama.AsyncClient":
+    """
+    Return the pooled async Ollama client of the running event loop.
+
+    The client (and its connection pool) is shared by every coroutine on the loop; a
+    new one is created when called from a different loop, since connections cannot
+    be shared across loops.
+
+    Returns:
+        ollama.AsyncClient: Shared client.
+    """
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    with _async_client_lock:
+        if _async_client is None or _async_client_loop is not loop:
+            _async_client = ollama.AsyncClient(**client_options())
+            _async_client_loop = loop
+        return _async_client
+
+def reset_async_client() -> None:
+    """Drop the shared async client, e.g. after ollama.AsyncClient was replaced."""
+    global _async_client, _async_client_loop
+    with _async_client_lock:
+        _async_client = None
+        _async_client_loop = None
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Tell whether a failed Ollama request is worth retrying.
+
+    Args:
+        error (BaseException): Exception raised by the request.
+
+    Returns:
+        bool: True for timeouts, connection errors, overload (429) and server errors.
+    """
+    if isinstance(error, (asyncio.TimeoutError, httpx.TransportError, ConnectionError)):
+        return True
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+def backoff_seconds(attempt: int) -> float:
+    """
+    Return the delay before a retry: exponential backoff with jitter.
+
+    Args:
+        attempt (int): Retry number, starting at 1.
+
+    Returns:
+        float: Seconds to wait.
+    """
+    base = get_setting("ollama_settings", "retry_backoff_seconds", 1.0)
+    return base * 2 ** (attempt - 1) * (0.5 + random.random())
+
+async def achat(**kwargs: Any) -> Any:
+    """
+    Send a chat request through the shared async client.
+
+    Each attempt is bounded by ollama_settings.timeout_seconds; timeouts, connection
+    errors and 429/5xx responses are retried up to ollama_settings.max_retries times.
+
+    Args:
+        **kwargs (Any): Arguments of ollama.AsyncClient.chat (model, messages, format, options).
+
+    Returns:
+        ChatResponse: Ollama response.
+    """
+    timeout = get_setting("ollama_settings", "timeout_seconds", 300)
+    max_retries = get_setting("ollama_settings", "max_retries", 2)
+    attempt = 0
+    while True:
+        try:
+            return await asyncio.wait_for(get_async_client().chat(**kwargs), timeout)
+        except Exception as e:
+            attempt += 1
+            if attempt > max_retries or not is_retryable(e):
+                raise
+            delay = backoff_seconds(attempt)
+            print(f"Warning: Ollama chat failed ({type(e).__name__}: {str(e)}), retry {attempt}/{max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+def _with_retries(kind: str, request: Any, kwargs: dict) -> Any:
+    """Send a synchronous request, retrying like achat."""
+    max_retries = get_setting("ollama_settings", "max_retries", 2)
+    attempt = 0
+    while True:
+        try:
+            return request(**kwargs)
+        except Exception as e:
+            attempt += 1
+            if attempt > max_retries or not is_retryable(e):
+                raise
+            delay = backoff_seconds(attempt)
+            print(f"Warning: Ollama {kind} failed ({type(e).__name__}: {str(e)}), retry {attempt}/{max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+def chat(**kwargs: Any) -> Any:
+    """
+    Send a chat request through the shared synchronous client.
+
+    Requests time out after ollama_settings.timeout_seconds; timeouts, connection
+    errors and 429/5xx responses are retried up to ollama_settings.max_retries times.
+
+    Args:
+        **kwargs (Any): Arguments of ollama.Client.chat (model, messages, format, options).
+
+    Returns:
+        ChatResponse: Ollama response.
+    """
+    return _with_retries("chat", get_client().chat, kwargs)
+
+def embed(**kwargs: Any) -> Any:
+    """
+    Send an embedding request through the shared synchronous client (see chat).
+
+    Args:
+        **kwargs (Any): Arguments of ollama.Client.embed (model, input, options).
+
+    Returns:
+        EmbedResponse: Ollama response.
+    """
+    return _with_retries("embed", get_client().embed, kwargs)
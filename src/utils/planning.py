@@ -0,0 +1,180 @@
+import json
+import hashlib
+from typing import Any, Dict, List, Optional
+from src.utils.config import get_setting
+from src.utils.cache import get_plan_cache, get_llm_cache_mode
+
+PLANNING_MODES = ("template", "refine", "llm")
+
+# config.yaml templates used for each note type
+NOTE_TYPE_TEMPLATES = {
+    "condition": "condition",
+    "complaint": "presenting_complaint",
+    "drug": "drug"
+}
+
+# Words kept in lower case when template names are turned into titles
+_MINOR_WORDS = {"of", "and", "or", "to", "by", "for", "in", "on", "the", "a"}
+
+def planning_mode() -> str:
+    """
+    Return how sections are planned, from planning_settings.mode.
+
+    'template' builds the plan from the note type's config template without an LLM
+    call, 'refine' lets the orchestrator adapt the template to the topic, and 'llm'
+    lets it plan freely.
+
+    Returns:
+        str: The active planning mode ('refine' when the setting is unknown).
+    """
+    mode = get_setting("planning_settings", "mode", "refine")
+    if mode not in PLANNING_MODES:
+        print(f"Warning: Unknown planning mode '{mode}', using 'refine'")
+        return "refine"
+    return mode
+
+def section_title(name: str) -> str:
+    """
+    Turn a template section name into a title.
+
+    Args:
+        name (str): Template name (e.g., 'mechanism_of_action').
+
+    Returns:
+        str: Title (e.g., 'Mechanism of Action').
+    """
+    words = name.replace("_", " ").split()
+    return " ".join(
+        word if i and word in _MINOR_WORDS else word[:1].upper() + word[1:]
+        for i, word in enumerate(words)
+    )
+
+def _template(note_type: str) -> List[Dict[str, Any]]:
+    """Return the config template entries of a note type."""
+    template = (get_setting("templates", NOTE_TYPE_TEMPLATES.get(note_type, note_type), []) or [])
+    return [entry for entry in template if isinstance(entry, dict) and entry.get("name")]
+
+def template_sections(note_type: str) -> List[Dict[str, str]]:
+    """
+    Build a section plan from the note type's config template.
+
+    An entry's 'structure' is used as is; otherwise entries with sub_sections become a
+    nested list by their sub-section titles and the others a simple list, so
+    plan_stages and section_n_results treat them accordingly.
+
+    Args:
+        note_type (str): Type of note ('condition', 'complaint' or 'drug').
+
+    Returns:
+        List[Dict[str, str]]: Sections with 'title' and 'structure', empty if there is no template.
+    """
+    sections = []
+    for entry in _template(note_type):
+        sub_titles = [section_title(sub["name"]) for sub in entry.get("sub_sections") or [] if isinstance(sub, dict) and sub.get("name")]
+        structure = entry.get("structure") or (f"Nested list by {', '.join(sub_titles)}" if sub_titles else "Simple list")
+        sections.append({"title": section_title(entry["name"]), "structure": structure})
+    return sections
+
+def section_descriptions(note_type: str) -> Dict[str, str]:
+    """
+    Map the note type's template section titles to their descriptions.
+
+    Args:
+        note_type (str): Type of note.
+
+    Returns:
+        Dict[str, str]: Section titles and descriptions, in template order.
+    """
+    return {section_title(entry["name"]): entry.get("description", "") for entry in _template(note_type)}
+
+def template_outline(note_type: str) -> str:
+    """
+    Render the note type's template for the orchestrator prompt.
+
+    Args:
+        note_type (str): Type of note.
+
+    Returns:
+        str: One line per section with its structure and description.
+    """
+    descriptions = section_descriptions(note_type)
+    return "\n".join(
+        f"- {section['title']} ({section['structure']}): {descriptions.get(section['title'], '')}".rstrip(": ")
+        for section in template_sections(note_type)
+    )
+
+def template_version(note_type: str) -> str:
+    """
+    Fingerprint the note type's template, so editing it invalidates cached plans.
+
+    Args:
+        note_type (str): Type of note.
+
+    Returns:
+        str: Short hex digest of the template.
+    """
+    payload = json.dumps(_template(note_type), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+def plan_key(topic: str, note_type: str, mode: str, model: str, prompt: str = "", corpus: Optional[str] = None) -> str:
+    """
+    Build the plan cache key of a note.
+
+    Args:
+        topic (str): Medical topic (case and spacing are ignored).
+        note_type (str): Type of note.
+        mode (str): Planning mode that produced the plan.
+        model (str): Orchestrator model.
+        prompt (str): Orchestrator prompt template, so editing it invalidates cached plans.
+        corpus (Optional[str]): Digest of the corpus whose headings inform the plan
+            (see src.utils.manifest.manifest_digest).
+
+    Returns:
+        str: Hex SHA-256 digest of the inputs and the template version.
+    """
+    payload = json.dumps({
+        "topic": " ".join(topic.lower().split()),
+        "note_type": note_type,
+        "template": template_version(note_type),
+        "mode": mode,
+        "model": model,
+        "prompt": hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+        "corpus": corpus
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def load_plan(key: str) -> Optional[List[Dict[str, str]]]:
+    """
+    Look up a cached section plan.
+
+    Args:
+        key (str): Key from plan_key.
+
+    Returns:
+        Optional[List[Dict[str, str]]]: Cached sections, or None on a miss or when the
+        cache is disabled or bypassed/refreshed (cache_settings.llm_cache_mode).
+    """
+    cache = get_plan_cache()
+    if cache is None or get_llm_cache_mode() != "use":
+        return None
+    stored = cache.get(key)
+    if stored is None:
+        return None
+    try:
+        return json.loads(stored.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        print(f"Warning: Ignoring unreadable cached plan: {str(e)}")
+        return None
+
+def save_plan(key: str, sections: List[Dict[str, str]]) -> None:
+    """
+    Store a section plan in the plan cache.
+
+    Args:
+        key (str): Key from plan_key.
+        sections (List[Dict[str, str]]): Sections with 'title' and 'structure'.
+    """
+    cache = get_plan_cache()
+    if cache is None or get_llm_cache_mode() == "bypass":
+        return
+    cache.set(key, json.dumps(sections, ensure_ascii=False).encode("utf-8"))
@@ -0,0 +1,118 @@
+import re
+import chromadb
+from typing import Any, Dict, List, Optional, Sequence
+from src.utils.config import get_setting
+from src.utils.embeddings import embed_texts, collection_db_path
+from src.utils.lexical import get_lexical_index
+from src.utils.instrumentation import span
+
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+# Doses, lab values and quoted phrases are matched reliably by the lexical index alone
+EXACT_TERM = re.compile(r"\d|\"")
+
+def is_exact_term_query(query: str) -> bool:
+    """
+    Check whether a query asks for exact terms, such as a drug dose ('chlorthalidone 12.5 mg').
+
+    Args:
+        query (str): Free-text query.
+
+    Returns:
+        bool: True if the query contains a number or a quoted phrase.
+    """
+    return bool(EXACT_TERM.search(query))
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    """
+    Merge ranked id lists with reciprocal-rank fusion.
+
+    Each id scores the sum of 1 / (k + rank) over the lists it appears in, so ids ranked
+    well by several retrievers rise to the top without comparing their raw scores.
+
+    Args:
+        rankings (Sequence[Sequence[str]]): Ranked id lists, best first.
+        k (int): Damping constant; larger values flatten the rank weights.
+
+    Returns:
+        List[str]: Fused ids, best first.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking, 1):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda id_: -scores[id_])
+
+def hybrid_query(
+    collection: chromadb.Collection,
+    queries: List[str],
+    n_results: int,
+    mode: Optional[str] = None,
+    sources: Optional[Sequence[str]] = None
+) -> Dict[str, List[List[Any]]]:
+    """
+    Retrieve chunks for several queries with vector search, BM25 or both.
+
+    In hybrid mode each retriever returns n_results * candidate_multiplier candidates
+    per query, fused with reciprocal-rank fusion. Vector queries are embedded in one
+    request and searched with a single multi-query Chroma call. Exact-term queries
+    (numbers, quoted phrases) with enough lexical hits skip the embedding entirely.
+
+    Args:
+        collection (chromadb.Collection): Collection to search; its lexical index lives next to it.
+        queries (List[str]): Free-text queries.
+        n_results (int): Chunks returned per query.
+        mode (Optional[str]): 'vector', 'lexical' or 'hybrid' (default: retrieval_settings.mode).
+        sources (Optional[Sequence[str]]): Only search chunks of these sources (e.g., from route_articles).
+
+    Returns:
+        Dict[str, List[List[Any]]]: 'ids', 'documents' and 'metadatas' per query, like collection.query.
+    """
+    mode = mode or get_setting("retrieval_settings", "mode", "hybrid")
+    index = get_lexical_index(collection_db_path(collection), collection.name) if mode != "vector" else None
+    if index is None or index.count() == 0:
+        mode = "vector"
+    candidates = n_results * get_setting("retrieval_settings", "candidate_multiplier", 2) if mode == "hybrid" else n_results
+
+    lexical_ids: List[List[str]] = [[] for _ in queries]
+    if mode != "vector":
+        with span("lexical.search", queries=len(queries)):
+            lexical_ids = [[id_ for id_, _ in index.search(query, candidates, sources)] for query in queries]
+
+    skip_exact = get_setting("retrieval_settings", "lexical_only_exact_terms", True)
+    vector_positions = [
+        i for i, query in enumerate(queries)
+        if mode != "lexical" and not (skip_exact and is_exact_term_query(query) and len(lexical_ids[i]) >= n_results)
+    ]
+    vector_ids: List[List[str]] = [[] for _ in queries]
+    fetched: Dict[str, tuple] = {}
+    if vector_positions:
+        query_embeddings = embed_texts([queries[i] for i in vector_positions])
+        with span("chroma.query", queries=len(vector_positions)):
+            results = collection.query(
+                query_embeddings=query_embeddings,
+                include=["documents", "metadatas"],
+                n_results=candidates,
+                where={"source": {"$in": list(sources)}} if sources else None
+            )
+        for i, ids, docs, metas in zip(vector_positions, results["ids"], results["documents"], results["metadatas"]):
+            vector_ids[i] = ids
+            fetched.update((id_, (doc, meta)) for id_, doc, meta in zip(ids, docs, metas))
+
+    k = get_setting("retrieval_settings", "rrf_k", 60)
+    fused = [reciprocal_rank_fusion([vector_ids[i], lexical_ids[i]], k)[:n_results] for i in range(len(queries))]
+    missing = list({id_ for ids in fused for id_ in ids} - fetched.keys())
+    if missing:
+        with span("chroma.get", ids=len(missing)):
+            stored = collection.get(ids=missing, include=["documents", "metadatas"])
+        fetched.update((id_, (doc, meta)) for id_, doc, meta in zip(stored["ids"], stored["documents"], stored["metadatas"]))
+
+    results = {"ids": [], "documents": [], "metadatas": []}
+    for ids in fused:
+        # Ids missing from the collection are stale lexical entries and are dropped
+        ids = [id_ for id_ in ids if id_ in fetched]
+        results["ids"].append(ids)
+        results["documents"].append([fetched[id_][0] for id_ in ids])
+        results["metadatas"].append([fetched[id_][1] or {} for id_ in ids])
+    if len(vector_positions) < len(queries):
+        print(f"DEBUG: {len(queries) - len(vector_positions)} of {len(queries)} queries answered by the lexical index alone")
+    return results
@@ -0,0 +1,67 @@
+from typing import Any, Dict, List
+from src.utils.ollama_client import chat, embed
+from src.utils.config import get_setting
+
+# Pipeline stages that can be routed to their own model
+LLM_STAGES = ("orchestrator", "high_level", "gap", "detail", "optimizer", "tagging")
+EMBEDDING_STAGE = "embedding"
+
+def stage_route(stage: str) -> Dict[str, Any]:
+    """
+    Resolve the model, options and keep_alive of a pipeline stage.
+
+    models.stages.<stage> may set 'model', 'options' and 'keep_alive'; anything it
+    leaves out falls back to models.llm (models.embedding for the embedding stage),
+    models.options and models.keep_alive. Stage options are merged over the defaults.
+
+    Args:
+        stage (str): Stage name (e.g., 'gap', 'optimizer', 'embedding').
+
+    Returns:
+        Dict[str, Any]: 'model', 'options' and 'keep_alive' for the stage's requests.
+    """
+    route = (get_setting("models", "stages", {}) or {}).get(stage) or {}
+    if stage == EMBEDDING_STAGE:
+        model = route.get("model") or get_setting("models", "embedding", "mxbai-embed-large")
+        options = dict(route.get("options") or {})
+    else:
+        model = route.get("model") or get_setting("models", "llm", "llama3.2")
+        options = {**(get_setting("models", "options", {"temperature": 0.5}) or {}), **(route.get("options") or {})}
+    return {
+        "model": model,
+        "options": options,
+        "keep_alive": route.get("keep_alive", get_setting("models", "keep_alive", None))
+    }
+
+def routed_models() -> Dict[str, List[str]]:
+    """
+    Group the configured stages by model.
+
+    Returns:
+        Dict[str, List[str]]: Model names mapped to the stages routed to them.
+    """
+    models: Dict[str, List[str]] = {}
+    for stage in LLM_STAGES + (EMBEDDING_STAGE,):
+        models.setdefault(stage_route(stage)["model"], []).append(stage)
+    return models
+
+def preload_models() -> None:
+    """
+    Load every routed model into Ollama before a run, so the first requests of each
+    stage do not pay the model load time.
+
+    Sends empty requests with each stage's keep_alive, which load a model without
+    generating anything. Disabled with models.preload; failures are only reported.
+    """
+    if not get_setting("models", "preload", True):
+        return
+    for model, stages in routed_models().items():
+        keep_alive = stage_route(stages[0])["keep_alive"]
+        try:
+            if stages == [EMBEDDING_STAGE]:
+                embed(model=model, input=[], keep_alive=keep_alive)
+            else:
+                chat(model=model, messages=[], keep_alive=keep_alive)
+            print(f"DEBUG: Preloaded model '{model}' for {', '.join(stages)}")
+        except Exception as e:
+            print(f"Warning: Could not preload model '{model}': {str(e)}")
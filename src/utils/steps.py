@@ -0,0 +1,88 @@
+import asyncio
+import functools
+from typing import Any, Callable, Generator, NamedTuple, TypeVar
+
+T = TypeVar("T")
+
+class Call(NamedTuple):
+    """An I/O call yielded by a step generator, in its blocking and awaitable forms."""
+    func: Callable[..., Any]
+    afunc: Callable[..., Any]
+    args: tuple
+
+# A pipeline step written once: it yields the I/O calls it needs and receives their results
+Steps = Generator[Call, Any, T]
+
+def call(func: Callable[..., Any], afunc: Callable[..., Any], *args: Any) -> Call:
+    """
+    Describe an I/O call that has a sync and an async implementation.
+
+    Args:
+        func (Callable[..., Any]): Blocking implementation, used by run_steps.
+        afunc (Callable[..., Any]): Coroutine function, awaited by arun_steps.
+        *args (Any): Arguments passed to either implementation.
+
+    Returns:
+        Call: Call to yield from a step generator.
+    """
+    return Call(func, afunc, args)
+
+def blocking(func: Callable[..., Any], *args: Any) -> Call:
+    """
+    Describe a blocking call (SQLite, Chroma) that async runs move to a worker thread.
+
+    Args:
+        func (Callable[..., Any]): Blocking function.
+        *args (Any): Its arguments.
+
+    Returns:
+        Call: Call run directly by run_steps and through asyncio.to_thread by arun_steps.
+    """
+    return Call(func, functools.partial(asyncio.to_thread, func), args)
+
+def run_steps(steps: Steps[T]) -> T:
+    """
+    Run a step generator, making each yielded call synchronously.
+
+    A call's result is sent back into the generator and its exception is raised
+    there, so the step handles failures where it made the call.
+
+    Args:
+        steps (Steps[T]): Step generator.
+
+    Returns:
+        T: The generator's return value.
+    """
+    try:
+        request = next(steps)
+        while True:
+            try:
+                result = request.func(*request.args)
+            except Exception as e:
+                request = steps.throw(e)
+            else:
+                request = steps.send(result)
+    except StopIteration as done:
+        return done.value
+
+async def arun_steps(steps: Steps[T]) -> T:
+    """
+    Run a step generator, awaiting the async form of each yielded call.
+
+    Args:
+        steps (Steps[T]): Step generator.
+
+    Returns:
+        T: The generator's return value.
+    """
+    try:
+        request = next(steps)
+        while True:
+            try:
+                result = await request.afunc(*request.args)
+            except Exception as e:
+                request = steps.throw(e)
+            else:
+                request = steps.send(result)
+    except StopIteration as done:
+        return done.value
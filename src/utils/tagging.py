@@ -0,0 +1,217 @@
+import re
+import json
+import hashlib
+import contextvars
+import chromadb
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from src.utils.config import get_setting
+from src.utils.embeddings import embed_texts
+from src.utils.planning import NOTE_TYPE_TEMPLATES, section_descriptions
+from src.utils.routing import stage_route
+from src.utils.instrumentation import span
+from src.prompts import CHUNK_TAGGING_PROMPT
+
+TAG_SCHEMA = {"type": "object", "properties": {
+    "tags": {"type": "array", "items": {
+        "type": "object",
+        "properties": {
+            "passage": {"type": "integer"},
+            "sections": {"type": "array", "items": {"type": "string"}}
+        }
+    }}
+}}
+
+# Metadata keys of section tags start with this prefix, e.g. 'section_management'
+TAG_PREFIX = "section_"
+
+def section_tag_key(title: str) -> str:
+    """
+    Return the Chroma metadata key flagging chunks tagged with a section.
+
+    Args:
+        title (str): Section title (e.g., 'Differential Diagnosis').
+
+    Returns:
+        str: Metadata key (e.g., 'section_differential_diagnosis').
+    """
+    return TAG_PREFIX + re.sub(r"[^a-z0-9]+", "_", title.lower()).strip("_")
+
+def tag_labels() -> Dict[str, str]:
+    """
+    Collect the sections chunks are tagged with: every config template's sections.
+
+    Returns:
+        Dict[str, str]: Section titles mapped to their descriptions (first template wins).
+    """
+    labels: Dict[str, str] = {}
+    for note_type in NOTE_TYPE_TEMPLATES:
+        for title, description in section_descriptions(note_type).items():
+            labels.setdefault(title, description)
+    return labels
+
+def tag_version(labels: Dict[str, str]) -> str:
+    """
+    Fingerprint the tag set and tagging model, so changing either retags the corpus.
+
+    Args:
+        labels (Dict[str, str]): Tag titles and descriptions.
+
+    Returns:
+        str: Short hex digest stored in each tagged chunk's 'tag_version' metadata.
+    """
+    route = stage_route("tagging")
+    payload = json.dumps({"labels": labels, "model": route["model"], "options": route["options"]}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+def _tag_prompt(labels: Dict[str, str], texts: Sequence[str]) -> str:
+    """Format the tagging prompt for a batch of chunks."""
+    max_chars = get_setting("tagging_settings", "max_passage_chars", 1500)
+    return CHUNK_TAGGING_PROMPT.format(
+        sections="\n".join(f"- {title}: {description}" if description else f"- {title}" for title, description in labels.items()),
+        passages="\n\n".join(f"[{i}] {text[:max_chars]}" for i, text in enumerate(texts, 1)),
+        schema=json.dumps(TAG_SCHEMA)
+    )
+
+def tag_batch(labels: Dict[str, str], texts: Sequence[str]) -> List[List[str]]:
+    """
+    Classify a batch of chunks against the section tags in one LLM call.
+
+    Args:
+        labels (Dict[str, str]): Tag titles and descriptions.
+        texts (Sequence[str]): Chunk texts.
+
+    Returns:
+        List[List[str]]: Known section titles per chunk; unknown titles are dropped.
+    """
+    from src.nodes import structured_llm  # nodes imports this module for retrieval
+
+    known = {title.lower(): title for title in labels}
+    result = structured_llm(None, TAG_SCHEMA, stage="tagging")(_tag_prompt(labels, texts))
+    tags: List[List[str]] = [[] for _ in texts]
+    for entry in (result or {}).get("tags") or []:
+        if not isinstance(entry, dict) or not isinstance(entry.get("passage"), int):
+            continue
+        index = entry["passage"] - 1
+        if 0 <= index < len(texts):
+            titles = [known[title.strip().lower()] for title in entry.get("sections") or [] if isinstance(title, str) and title.strip().lower() in known]
+            tags[index] = list(dict.fromkeys(tags[index] + titles))
+    return tags
+
+def _tag_metadata(previous: Dict[str, Any], titles: List[str], version: str) -> Dict[str, Any]:
+    """Build the metadata update replacing a chunk's section tags."""
+    update: Dict[str, Any] = {key: None for key in previous if key.startswith(TAG_PREFIX)}
+    update.update({section_tag_key(title): True for title in titles})
+    update["sections"] = ", ".join(titles)
+    update["tag_version"] = version
+    return update
+
+def tag_collection(
+    collection: chromadb.Collection,
+    batch_size: Optional[int] = None,
+    concurrency: Optional[int] = None
+) -> int:
+    """
+    Tag the collection's chunks with the template sections they support.
+
+    Chunks whose 'tag_version' metadata matches the current tag set are skipped, and
+    each batch's tags are written as soon as it is classified, so an interrupted run
+    resumes where it stopped and later ingestions only tag new chunks. Tags are stored
+    as boolean metadata per section (see section_tag_key) plus a readable 'sections'
+    string. Batches go through structured_llm, whose response cache also applies.
+
+    Args:
+        collection (chromadb.Collection): Chunk collection to tag.
+        batch_size (Optional[int]): Chunks per LLM call (default: tagging_settings.batch_size).
+        concurrency (Optional[int]): Calls in flight (default: tagging_settings.concurrency).
+
+    Returns:
+        int: Number of chunks tagged by this run.
+    """
+    labels = tag_labels()
+    if not labels:
+        print("Warning: No template sections to tag chunks with")
+        return 0
+    version = tag_version(labels)
+    batch_size = max(1, batch_size or get_setting("tagging_settings", "batch_size", 8))
+    concurrency = max(1, concurrency or get_setting("tagging_settings", "concurrency", 4))
+    page_size = get_setting("tagging_settings", "page_size", 500)
+    tagged = failed = 0
+    offset = 0
+    with span("ingest.tag", chunks=collection.count()) as attrs, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            pending = [
+                (id_, doc, meta or {})
+                for id_, doc, meta in zip(page["ids"], page["documents"], page["metadatas"])
+                if (meta or {}).get("tag_version") != version
+            ]
+            batches = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+            futures = {
+                executor.submit(contextvars.copy_context().run, tag_batch, labels, [doc for _, doc, _ in batch]): batch
+                for batch in batches
+            }
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    titles = future.result()
+                except Exception as e:
+                    print(f"Error tagging {len(batch)} chunks: {str(e)}")
+                    failed += len(batch)
+                    continue
+                collection.update(
+                    ids=[id_ for id_, _, _ in batch],
+                    metadatas=[_tag_metadata(meta, chunk_titles, version) for (_, _, meta), chunk_titles in zip(batch, titles)]
+                )
+                tagged += len(batch)
+            if pending:
+                print(f"DEBUG: Tagged {tagged} chunks ({offset + len(page['ids'])} scanned)")
+            if len(page["ids"]) < page_size:
+                break
+            offset += len(page["ids"])
+        attrs.update(tagged=tagged, failed=failed)
+    print(f"DEBUG: Section tagging done: {tagged} chunks tagged, {failed} failed")
+    return tagged
+
+def tagged_query(
+    collection: chromadb.Collection,
+    topic: str,
+    sections: Dict[str, int],
+    sources: Optional[Sequence[str]] = None
+) -> Dict[str, Tuple[List[str], List[str], List[Dict[str, Any]]]]:
+    """
+    Retrieve the evidence of tagged sections with metadata-filtered queries.
+
+    Every section is searched with the same (cached) topic embedding, filtered to
+    chunks tagged with the section (and to the routed sources), so no per-section
+    query is embedded. Sections that are not template sections, or with fewer than
+    tagging_settings.min_tagged_chunks tagged hits, are left to the caller.
+
+    Args:
+        collection (chromadb.Collection): Tagged chunk collection.
+        topic (str): Note topic.
+        sections (Dict[str, int]): Section titles mapped to the chunks wanted for each.
+        sources (Optional[Sequence[str]]): Restrict hits to these sources.
+
+    Returns:
+        Dict[str, Tuple[List[str], List[str], List[Dict[str, Any]]]]: Ids, documents
+        and metadatas per answered section.
+    """
+    known = {title.lower() for title in tag_labels()}
+    wanted = {section: n for section, n in sections.items() if section.lower() in known}
+    if not wanted:
+        return {}
+    min_hits = get_setting("tagging_settings", "min_tagged_chunks", 2)
+    embedding = embed_texts([topic])
+    answered = {}
+    with span("chroma.tagged_query", sections=len(wanted)) as attrs:
+        for section, n_results in wanted.items():
+            where: Dict[str, Any] = {section_tag_key(section): True}
+            if sources:
+                where = {"$and": [where, {"source": {"$in": list(sources)}}]}
+            results = collection.query(query_embeddings=embedding, n_results=n_results, where=where, include=["documents", "metadatas"])
+            if len(results["ids"][0]) >= min(min_hits, n_results):
+                answered[section] = (results["ids"][0], results["documents"][0], [meta or {} for meta in results["metadatas"][0]])
+        attrs["answered"] = len(answered)
+    print(f"DEBUG: {len(answered)} of {len(wanted)} template sections answered from section tags")
+    return answered
@@ -0,0 +1,517 @@
+import os
+import sys
+import chromadb
+from typing import Any, Dict, List, Optional, Set
+from langgraph.graph import StateGraph, START, END
+from langgraph.types import Send
+from langchain_core.runnables import RunnableConfig
+from src.models import WorkflowState, NoteSection, SectionTask
+from src.utils.json_loader import iter_json_records
+from src.utils.chunking import iter_chunks
+from src.utils.embeddings import store_chunks
+from src.utils.articles import summarize_articles, store_articles
+from src.utils.dedup import dedup_chunks, duplicate_sources, record_attributions
+from src.utils.tagging import tag_collection
+from src.utils.config import get_setting
+from src.utils.cache import get_llm_cache, get_embedding_cache
+from src.utils.instrumentation import span, get_tracer
+from src.utils.checkpoint import get_checkpointer, async_checkpointer, default_run_id
+from src.utils.steps import Steps, call, blocking, run_steps, arun_steps
+from src.nodes import (
+    orchestrator,
+    aorchestrator,
+    retrieve_docs,
+    aretrieve_docs,
+    worker_node,
+    aworker_node,
+    section_fingerprint,
+    load_section,
+    save_section,
+    generate_output,
+    render_header,
+    render_section
+)
+
+def create_workflow(checkpointer=None, use_async: bool = False):
+    """
+    Create and compile the LangGraph workflow.
+
+    After retrieval, each section is sent to its own process_section branch so the
+    graph runs sections concurrently; collect_sections restores orchestrator order.
+    With a checkpointer, the state is saved after every step and each finished
+    section branch is saved as it completes, so a failed run can be resumed.
+    The async graph has the same shape with coroutine nodes, for ainvoke/astream.
+
+    Args:
+        checkpointer (Optional[BaseCheckpointSaver]): LangGraph checkpointer, or None.
+        use_async (bool): Build the graph from the async nodes.
+
+    Returns:
+        compiled workflow: Configured LangGraph workflow.
+    """
+    workflow = StateGraph(WorkflowState)
+    # Pass collection via config["configurable"]["collection"] to match LangGraph's structure
+    if use_async:
+        # LangGraph only awaits nodes that are coroutine functions, so lambdas cannot be used here
+        async def orchestrator_node(state: WorkflowState, config: RunnableConfig) -> WorkflowState:
+            return await aorchestrator(state, config["configurable"]["collection"])
+
+        async def retrieve_docs_node(state: WorkflowState, config: RunnableConfig) -> WorkflowState:
+            return await aretrieve_docs(state, config["configurable"]["collection"])
+
+        async def process_section_node(task: SectionTask, config: RunnableConfig) -> Dict[str, Dict[str, NoteSection]]:
+            return await aprocess_section(task, config["configurable"]["collection"])
+
+        workflow.add_node("orchestrator", orchestrator_node)
+        workflow.add_node("retrieve_docs", retrieve_docs_node)
+        workflow.add_node("process_section", process_section_node, input_schema=SectionTask)
+    else:
+        workflow.add_node("orchestrator", lambda state, config: orchestrator(state, config["configurable"]["collection"]))
+        workflow.add_node("retrieve_docs", lambda state, config: retrieve_docs(state, config["configurable"]["collection"]))
+        workflow.add_node(
+            "process_section",
+            lambda task, config: process_section(task, config["configurable"]["collection"]),
+            input_schema=SectionTask
+        )
+    workflow.add_node("collect_sections", collect_sections)
+
+    workflow.add_edge(START, "orchestrator")
+    workflow.add_edge("orchestrator", "retrieve_docs")
+    workflow.add_conditional_edges("retrieve_docs", dispatch_sections, ["process_section", "collect_sections"])
+    workflow.add_edge("process_section", "collect_sections")
+    # Rendering happens in main via generate_output; a node returning a string is not a valid state update
+    workflow.add_edge("collect_sections", END)
+
+    return workflow.compile(checkpointer=checkpointer)
+
+def dispatch_sections(state: WorkflowState) -> List[Send] | str:
+    """
+    Fan out one process_section branch per retrieved section.
+
+    Args:
+        state (WorkflowState): Workflow state after document retrieval.
+
+    Returns:
+        List[Send] | str: Sends for each section, or 'collect_sections' if there are none.
+    """
+    print(f"DEBUG: Dispatching {len(state.retrieved_docs)} sections")
+    if not state.retrieved_docs:
+        return "collect_sections"
+    return [Send("process_section", SectionTask(state=state, section=section)) for section in state.retrieved_docs]
+
+def _section_steps(task: SectionTask, collection: chromadb.Collection) -> Steps[Dict[str, Dict[str, NoteSection]]]:
+    """Process one section through the section cache, yielding the worker calls (see process_section)."""
+    print(f"DEBUG: Processing section '{task.section}'")
+    try:
+        with span("node.process_section", section=task.section) as attrs:
+            fingerprint = section_fingerprint(task.state, task.section)
+            section = yield blocking(load_section, fingerprint)
+            attrs["cache_hit"] = section is not None
+            if section is None:
+                section = yield call(worker_node, aworker_node, task.state, task.section, collection)
+                yield blocking(save_section, fingerprint, section)
+            else:
+                print(f"DEBUG: Reusing cached section '{task.section}', its evidence is unchanged")
+            return {"section_results": {task.section: section}}
+    except Exception as e:
+        print(f"Error in process_section for '{task.section}': {str(e)}")
+        raise
+
+def process_section(task: SectionTask, collection: chromadb.Collection) -> Dict[str, Dict[str, NoteSection]]:
+    """
+    Process a single section by invoking worker_node.
+
+    The section is fingerprinted from its retrieved passages and generation settings
+    (see section_fingerprint); a section stored under the same fingerprint by an
+    earlier run is reused without calling the LLM.
+
+    Args:
+        task (SectionTask): Workflow state and the section title to process.
+        collection (chromadb.Collection): ChromaDB collection.
+
+    Returns:
+        Dict[str, Dict[str, NoteSection]]: State update with the processed section.
+    """
+    return run_steps(_section_steps(task, collection))
+
+async def aprocess_section(task: SectionTask, collection: chromadb.Collection) -> Dict[str, Dict[str, NoteSection]]:
+    """
+    Async variant of process_section.
+
+    Args:
+        task (SectionTask): Workflow state and the section title to process.
+        collection (chromadb.Collection): ChromaDB collection.
+
+    Returns:
+        Dict[str, Dict[str, NoteSection]]: State update with the processed section.
+    """
+    return await arun_steps(_section_steps(task, collection))
+
+def collect_sections(state: WorkflowState) -> Dict[str, List[NoteSection]]:
+    """
+    Gather processed sections in the order chosen by the orchestrator.
+
+    Args:
+        state (WorkflowState): Workflow state with per-section results.
+
+    Returns:
+        Dict[str, List[NoteSection]]: State update with ordered sections.
+    """
+    sections = [state.section_results[section] for section in state.retrieved_docs if section in state.section_results]
+    print(f"DEBUG: Collected {len(sections)} processed sections")
+    return {"sections": sections}
+
+def output_path(topic: str, output_format: str, output_dir: str = ".") -> str:
+    """
+    Build the output file path for a topic's notes.
+
+    Args:
+        topic (str): Medical topic (e.g., 'Hypertension').
+        output_format (str): Output format ('markdown' or 'org').
+        output_dir (str): Directory for the output file.
+
+    Returns:
+        str: Path of the form '<output_dir>/<Topic>_notes.<md|org>'.
+    """
+    file_ext = "org" if output_format == "org" else "md"
+    return os.path.join(output_dir, f"{topic.replace(' ', '_')}_notes.{file_ext}")
+
+def write_output(path: str, output: str) -> None:
+    """
+    Write output atomically, so an existing output file is always complete.
+
+    Args:
+        path (str): Destination file path.
+        output (str): Text to write.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(output)
+    os.replace(tmp_path, path)
+
+def print_cache_stats() -> None:
+    """Print hit/miss counters of the shared LLM and embedding caches."""
+    llm_cache = get_llm_cache()
+    if llm_cache:
+        stats = llm_cache.stats()
+        print(f"DEBUG: LLM cache {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries ({stats['bytes']} bytes)")
+    embedding_cache = get_embedding_cache()
+    if embedding_cache:
+        stats = embedding_cache.stats()
+        print(f"DEBUG: Embedding cache {stats['memory_hits']} memory hits, {stats['hits']} disk hits, {stats['misses']} misses")
+
+def print_run_summary() -> None:
+    """Print cache statistics and the per-span timing summary of this run."""
+    print_cache_stats()
+    get_tracer().print_summary()
+
+def prepare_collection(json_path: str, db_path: str | None = None, prune: bool = False) -> chromadb.Collection | None:
+    """
+    Load, chunk and embed the corpus into the ChromaDB collection.
+
+    Args:
+        json_path (str): Path to JSON file or directory.
+        db_path (str | None): ChromaDB persistence directory (default: ingestion_settings.db_path).
+        prune (bool): Delete stored sources that json_path no longer holds (default: False).
+            Sources whose file failed to load are kept.
+
+    Returns:
+        chromadb.Collection | None: Populated collection or None if nothing could be loaded.
+    """
+    # Normalize path for Windows
+    json_path = os.path.normpath(json_path)
+    print(f"DEBUG: Using json_path: {json_path}")
+
+    # Verify json_path exists
+    if not os.path.exists(json_path):
+        print(f"Error: Path '{json_path}' does not exist")
+        return None
+
+    counts = {"documents": 0, "chunks": 0, "unique_chunks": 0}
+    articles: Dict[str, Dict[str, Any]] = {}
+    attributions: Dict[str, List[str]] = {}
+    unloaded: Set[str] = set()
+
+    def counted(items, key):
+        for item in items:
+            counts[key] += 1
+            yield item
+
+    # Records flow from the loader through chunking and deduplication into embedding without being collected
+    with span("ingest", json_path=json_path) as attrs:
+        records = counted(summarize_articles(iter_json_records(json_path, unloaded=unloaded), articles), "documents")
+        chunks = counted(dedup_chunks(counted(iter_chunks(records), "chunks"), attributions), "unique_chunks")
+        collection = store_chunks(chunks, db_path=db_path, prune=prune, unloaded=unloaded)
+        attrs.update(counts)
+        # Article summaries and duplicate attributions are complete once the stream is consumed
+        if counts["documents"]:
+            record_attributions(collection, attributions)
+            for source, kept in duplicate_sources(attributions).items():
+                if source in articles:
+                    articles[source]["see_also"] = kept
+        store_articles(articles, db_path=db_path, collection_name=collection.name, prune=prune, unloaded=unloaded)
+        if get_setting("tagging_settings", "enabled", False):
+            tag_collection(collection)
+    if not counts["documents"]:
+        print("Error: No valid JSON data loaded. Exiting.")
+        return None
+    print(f"DEBUG: Loaded {counts['documents']} texts, chunked into {counts['chunks']} chunks ({counts['unique_chunks']} after deduplication)")
+    print(f"DEBUG: Collection initialized with {collection.count()} documents")
+    if collection.count() == 0:
+        print("Error: No documents in collection. Exiting.")
+        return None
+    return collection
+
+class StreamingNoteWriter:
+    """
+    Writes a note section by section while the workflow runs.
+
+    The header and each finished section are appended to '<output>.partial' (and
+    optionally echoed to stdout) in completion order, so a crash keeps the work done
+    so far. finalize() writes the complete note in orchestrator order atomically and
+    removes the partial file.
+    """
+
+    def __init__(self, path: str, topic: str, output_format: str, echo: bool = False, sections: Optional[Dict[str, NoteSection]] = None):
+        """
+        Start the partial output file with the note header and any finished sections.
+
+        Args:
+            path (str): Final output file path.
+            topic (str): Medical topic.
+            output_format (str): Output format ('markdown' or 'org').
+            echo (bool): Also print the header and sections to stdout.
+            sections (Optional[Dict[str, NoteSection]]): Sections already finished, keyed
+                like section_results, e.g. those of a resumed run's checkpoint, which the
+                interrupted run may not have written.
+        """
+        self.path = path
+        self.partial_path = f"{path}.partial"
+        self.output_format = output_format
+        self.echo = echo
+        self._written = set()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.partial_path, "w", encoding="utf-8")
+        self._emit(render_header(topic, output_format))
+        for key, section in (sections or {}).items():
+            self.write_section(section, key)
+
+    def _emit(self, text: str) -> None:
+        """Append text to the partial file and flush it to disk."""
+        self._file.write(text)
+        self._file.flush()
+        if self.echo:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+    def write_section(self, section: NoteSection, key: Optional[str] = None) -> None:
+        """
+        Append a finished section.
+
+        Args:
+            section (NoteSection): Processed section.
+            key (Optional[str]): Its section_results key; a key already written is skipped,
+                since a resumed run replays the updates of sections its checkpoint holds.
+        """
+        if key is not None:
+            if key in self._written:
+                return
+            self._written.add(key)
+        self._emit(render_section(section, self.output_format))
+
+    def finalize(self, output: str) -> None:
+        """
+        Atomically write the complete note and remove the partial file.
+
+        Args:
+            output (str): Complete rendered note.
+        """
+        self._file.close()
+        write_output(self.path, output)
+        os.remove(self.partial_path)
+
+    def close(self) -> None:
+        """Close the partial file, keeping it on disk (e.g., after a failure)."""
+        if not self._file.closed:
+            self._file.close()
+
+def _initial_state(topic: str, note_type: str, output_format: str) -> WorkflowState:
+    """Build the workflow input for a topic."""
+    return WorkflowState(
+        topic=topic,
+        note_type=note_type,
+        output_format=output_format,
+        retrieved_docs={},
+        sections=[],
+        section_structures={}
+    )
+
+def _run_config(collection: chromadb.Collection) -> Dict[str, Any]:
+    """Build the LangGraph config of a run."""
+    # Pass collection in config["configurable"] to match LangGraph's structure; it is
+    # never part of the state, so checkpoints only hold serializable workflow data
+    # max_concurrency bounds how many section branches run at once
+    return {
+        "configurable": {"collection": collection},
+        "max_concurrency": get_setting("workflow_settings", "max_concurrent_sections", 4)
+    }
+
+def _should_resume(snapshot: Any, run_id: str, resume: bool) -> bool:
+    """Tell whether a checkpointed run is unfinished and should be resumed."""
+    if resume and snapshot.next:
+        done = len(snapshot.values.get("section_results", {}))
+        print(f"DEBUG: Resuming run '{run_id}' at {list(snapshot.next)} ({done} sections already done)")
+        return True
+    return False
+
+def _checkpointed_sections(snapshot: Any) -> Dict[str, NoteSection]:
+    """Return the sections a checkpointed run had already finished, by section_results key."""
+    return {key: NoteSection.model_validate(section) for key, section in snapshot.values.get("section_results", {}).items()}
+
+def _streamed_sections(chunk: Dict[str, Any]) -> Dict[str, NoteSection]:
+    """Return the sections finished in an 'updates' stream chunk, by section_results key."""
+    return (chunk.get("process_section") or {}).get("section_results", {})
+
+def _stream_graph(app: Any, graph_input: Any, config: Dict[str, Any], writer: StreamingNoteWriter) -> Any:
+    """Stream a run, writing each finished section, and return the final state values."""
+    result = None
+    for mode, chunk in app.stream(graph_input, config=config, stream_mode=["updates", "values"]):
+        if mode == "values":
+            result = chunk
+            continue
+        for key, section in _streamed_sections(chunk).items():
+            writer.write_section(section, key)
+    return result
+
+async def _astream_graph(app: Any, graph_input: Any, config: Dict[str, Any], writer: StreamingNoteWriter) -> Any:
+    """Async variant of _stream_graph."""
+    result = None
+    async for mode, chunk in app.astream(graph_input, config=config, stream_mode=["updates", "values"]):
+        if mode == "values":
+            result = chunk
+            continue
+        for key, section in _streamed_sections(chunk).items():
+            writer.write_section(section, key)
+    return result
+
+def _note_steps(
+    app: Any,
+    checkpointer: Any,
+    topic: str,
+    note_type: str,
+    collection: chromadb.Collection,
+    output_format: str,
+    output_dir: str,
+    echo: bool,
+    run_id: str | None,
+    resume: bool
+) -> Steps[str]:
+    """Run the workflow for one topic and write its note, yielding the graph and checkpoint calls (see generate_note)."""
+    state = _initial_state(topic, note_type, output_format)
+    config = _run_config(collection)
+    resuming = False
+    finished: Dict[str, NoteSection] = {}
+    if checkpointer is not None:
+        run_id = run_id or default_run_id(topic, note_type, output_format)
+        config["configurable"]["thread_id"] = run_id
+        snapshot = yield call(app.get_state, app.aget_state, config)
+        resuming = _should_resume(snapshot, run_id, resume)
+        if resuming:
+            finished = _checkpointed_sections(snapshot)
+        elif snapshot.created_at is not None:
+            yield call(checkpointer.delete_thread, checkpointer.adelete_thread, run_id)
+    output_file = output_path(topic, output_format, output_dir)
+    writer = StreamingNoteWriter(output_file, topic, output_format, echo=echo, sections=finished)
+    try:
+        with span("generate_note", topic=topic, note_type=note_type, resumed=resuming):
+            print(f"DEBUG: Streaming workflow with config: {config}")
+            # A None input continues the checkpointed run instead of starting a new one
+            result = yield call(_stream_graph, _astream_graph, app, None if resuming else state, config, writer)
+            output = generate_output(WorkflowState.model_validate(result))
+            writer.finalize(output)
+            if checkpointer is not None:
+                yield call(checkpointer.delete_thread, checkpointer.adelete_thread, run_id)
+            print(f"Output written to {output_file}")
+            return output
+    except Exception as e:
+        print(f"Error in workflow execution: {str(e)}")
+        raise
+    finally:
+        writer.close()
+
+def generate_note(
+    topic: str,
+    note_type: str,
+    collection: chromadb.Collection,
+    output_format: str = "markdown",
+    output_dir: str = ".",
+    echo: bool = False,
+    run_id: str | None = None,
+    resume: bool = True
+) -> str:
+    """
+    Run the workflow for one topic against an indexed collection and write the note.
+
+    The graph is streamed: each section is written to a partial output file as soon
+    as its process_section branch finishes (see StreamingNoteWriter). When
+    checkpoint_settings.enabled is set, an unfinished run with the same run id is
+    resumed from its last checkpoint: only the sections that had not completed are
+    processed again, and the partial file is rewritten with the checkpointed ones.
+    The checkpoints of a run are deleted once its note is written.
+
+    Args:
+        topic (str): Medical topic (e.g., 'Hypertension').
+        note_type (str): Type of note ('condition', 'complaint' or 'drug').
+        collection (chromadb.Collection): Populated ChromaDB collection.
+        output_format (str): Output format ('markdown' or 'org').
+        output_dir (str): Directory for the output file.
+        echo (bool): Also print sections to stdout as they complete.
+        run_id (str | None): Checkpoint thread id (default: derived from topic, note type and format).
+        resume (bool): Resume an unfinished run with the same run id instead of restarting it.
+
+    Returns:
+        str: Generated output.
+    """
+    checkpointer = get_checkpointer()
+    app = create_workflow(checkpointer)
+    return run_steps(_note_steps(app, checkpointer, topic, note_type, collection, output_format, output_dir, echo, run_id, resume))
+
+async def agenerate_note(
+    topic: str,
+    note_type: str,
+    collection: chromadb.Collection,
+    output_format: str = "markdown",
+    output_dir: str = ".",
+    echo: bool = False,
+    run_id: str | None = None,
+    resume: bool = True
+) -> str:
+    """
+    Async variant of generate_note, driving the async graph with astream.
+
+    LLM calls share one pooled AsyncClient, so many topics can run concurrently on
+    one event loop (see run_batch with use_async). Checkpoints use AsyncSqliteSaver.
+
+    Args:
+        topic (str): Medical topic (e.g., 'Hypertension').
+        note_type (str): Type of note ('condition', 'complaint' or 'drug').
+        collection (chromadb.Collection): Populated ChromaDB collection.
+        output_format (str): Output format ('markdown' or 'org').
+        output_dir (str): Directory for the output file.
+        echo (bool): Also print sections to stdout as they complete.
+        run_id (str | None): Checkpoint thread id (default: derived from topic, note type and format).
+        resume (bool): Resume an unfinished run with the same run id instead of restarting it.
+
+    Returns:
+        str: Generated output.
+    """
+    async with async_checkpointer() as checkpointer:
+        app = create_workflow(checkpointer, use_async=True)
+        return await arun_steps(
+            _note_steps(app, checkpointer, topic, note_type, collection, output_format, output_dir, echo, run_id, resume)
+        )
@@ -0,0 +1,49 @@
+import itertools
+import pytest
+from src.utils import cache as cache_module
+from src.utils.cache import SqliteCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Each write or read gets a later access time, so LRU order is deterministic
+    ticks = itertools.count(1)
+    monkeypatch.setattr(cache_module.time, "time", lambda: float(next(ticks)))
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path, clock):
+    cache = SqliteCache(str(tmp_path / "cache.sqlite"), max_bytes=100)
+    cache.set("a", b"x" * 40)
+    cache.set("b", b"x" * 40)
+    cache.set("c", b"x" * 40)
+    # Over the limit: 'a' is evicted until the cache is under 90% of it
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 80
+
+    assert cache.get("b") is not None
+    cache.set("d", b"x" * 40)
+    # 'b' was read after 'c' was written, so 'c' is now the least recently used
+    assert cache.get("c") is None
+    assert cache.get("b") == b"x" * 40
+    assert cache.get("d") == b"x" * 40
+    cache.close()
+
+def test_replacing_a_value_counts_its_size_once(tmp_path, clock):
+    cache = SqliteCache(str(tmp_path / "cache.sqlite"), max_bytes=100)
+    cache.set("a", b"x" * 60)
+    cache.set("a", b"x" * 60)
+    assert cache.get("a") is not None
+    assert cache.stats()["bytes"] == 60
+    cache.close()
+
+def test_stored_size_survives_reopening(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite")
+    cache = SqliteCache(path, max_bytes=100)
+    cache.set_many([("a", b"x" * 30), ("b", b"x" * 30)])
+    cache.close()
+    reopened = SqliteCache(path, max_bytes=100)
+    assert reopened.stats()["bytes"] == 60
+    reopened.set("c", b"x" * 50)
+    # Eviction stops once the cache is back under 90 bytes
+    assert reopened.stats()["bytes"] == 80
+    assert reopened.stats()["entries"] == 2
+    assert reopened.get("c") is not None
+    reopened.close()
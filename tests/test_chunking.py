@@ -0,0 +1,51 @@
+from src.utils.chunking import chunk_markdown
+
+SENTENCE = "Thiazide diuretics lower blood pressure in most adults with hypertension. "
+
+ARTICLE = (
+    "INTRODUCTION — \n\n"
+    + SENTENCE * 3 + "\n\n"
+    "TREATMENT — \n\n"
+    "Drug selection — " + SENTENCE + "\n\n"
+    + "\n\n".join([SENTENCE.strip()] * 10)
+)
+
+def test_chunks_stay_within_size_and_point_into_the_article():
+    chunks = chunk_markdown(ARTICLE, chunk_size=300, chunk_overlap=60)
+    assert chunks
+    for index, chunk in enumerate(chunks):
+        assert len(chunk["text"]) <= 300
+        assert ARTICLE[chunk["start"]:chunk["end"]] == chunk["text"]
+        assert chunk["chunk_index"] == index
+
+def test_chunks_carry_their_heading_path_and_never_span_sections():
+    chunks = chunk_markdown(ARTICLE, chunk_size=300, chunk_overlap=60)
+    paths = [chunk["heading_path"] for chunk in chunks]
+    assert paths[0] == "INTRODUCTION"
+    assert set(paths[1:]) == {"TREATMENT > Drug selection"}
+    # The introduction would fit in the first treatment chunk, but sections start a new chunk
+    assert chunks[1]["text"].startswith("Drug selection")
+
+def test_consecutive_chunks_of_a_section_overlap():
+    chunks = chunk_markdown(ARTICLE, chunk_size=300, chunk_overlap=60)
+    pairs = [
+        (before, after) for before, after in zip(chunks, chunks[1:])
+        if before["heading_path"] == after["heading_path"]
+    ]
+    assert pairs
+    for before, after in pairs:
+        assert after["start"] < before["end"]
+        assert before["end"] - after["start"] <= 60
+        shared = ARTICLE[after["start"]:before["end"]]
+        assert before["text"].endswith(shared) and after["text"].startswith(shared)
+
+def test_chunks_of_different_sections_do_not_overlap():
+    chunks = chunk_markdown(ARTICLE, chunk_size=300, chunk_overlap=60)
+    for before, after in zip(chunks, chunks[1:]):
+        if before["heading_path"] != after["heading_path"]:
+            assert after["start"] >= before["end"]
+
+def test_zero_overlap_chunks_are_disjoint():
+    chunks = chunk_markdown(ARTICLE, chunk_size=300, chunk_overlap=0)
+    for before, after in zip(chunks, chunks[1:]):
+        assert after["start"] >= before["end"]
@@ -0,0 +1,50 @@
+from src.utils.context import estimate_tokens, pack_context
+
+SHARED = "Thiazide diuretics remain a preferred first-line option for most adults."
+FIRST = "Initial therapy depends on blood pressure and comorbidities. " + SHARED
+SECOND = SHARED + " Chlorthalidone is favoured over hydrochlorothiazide by some experts."
+
+def passage(text, source="a.json", heading_path=""):
+    return {"text": text, "source": source, "heading_path": heading_path}
+
+def test_packed_context_fits_the_budget():
+    passages = [passage(f"Passage {i}: " + "blood pressure " * 20, f"{i}.json") for i in range(20)]
+    packed = pack_context(passages, 400)
+    # Each block also costs one token for the blank line that joins it
+    blocks = packed.split("\n\n")
+    assert sum(estimate_tokens(block) + 1 for block in blocks) <= 400
+    assert 1 < len(blocks) < 20
+
+def test_passages_are_labeled_in_rank_order():
+    packed = pack_context([passage("First passage text.", "a.json", "Treatment"), passage("Second passage text.", "b.json")], 1000)
+    assert packed == "[1] a.json | Treatment\nFirst passage text.\n\n[2] b.json\nSecond passage text."
+
+def test_overlap_with_a_packed_passage_is_trimmed():
+    packed = pack_context([passage(FIRST), passage(SECOND, "b.json")], 1000)
+    assert packed.count(SHARED) == 1
+    assert packed.endswith("[2] b.json\nChlorthalidone is favoured over hydrochlorothiazide by some experts.")
+
+def test_overlap_with_the_start_of_a_packed_passage_is_trimmed():
+    packed = pack_context([passage(SECOND), passage(FIRST, "b.json")], 1000)
+    assert packed.count(SHARED) == 1
+    assert packed.endswith("[2] b.json\nInitial therapy depends on blood pressure and comorbidities.")
+
+def test_duplicate_and_contained_passages_are_dropped():
+    packed = pack_context([passage(FIRST), passage(FIRST.upper(), "b.json"), passage(SHARED, "c.json")], 1000)
+    assert packed == f"[1] a.json\n{FIRST}"
+
+def test_oversized_top_passage_is_truncated_rather_than_dropped():
+    long_text = "Blood pressure targets vary. " * 100
+    packed = pack_context([passage(long_text), passage("Short note.", "b.json")], 200)
+    assert packed.startswith("[1] a.json\nBlood pressure targets vary.")
+    assert estimate_tokens(packed) <= 200
+    assert "b.json" not in packed
+
+def test_passage_that_does_not_fit_is_skipped_for_a_shorter_one():
+    packed = pack_context([
+        passage("Top passage. " * 20),
+        passage("Too long to fit after the top passage. " * 30, "b.json"),
+        passage("Short passage that fits. " * 4, "c.json")
+    ], 200)
+    assert "b.json" not in packed
+    assert "[2] c.json" in packed
@@ -0,0 +1,42 @@
+import numpy as np
+from src.utils.dedup import MinHashLSH, dedup_chunks, duplicate_sources, shingles
+from src.utils.embeddings import chunk_id
+
+PASSAGE = (
+    "Thiazide diuretics, calcium channel blockers and ACE inhibitors are the usual first-line agents "
+    "for adults with primary hypertension, chosen by comorbidities, cost and expected adverse effects."
+)
+UNRELATED = "Orthostatic hypotension is a fall in blood pressure on standing that may cause dizziness or falls."
+
+def test_shingles_ignore_case_and_punctuation():
+    assert np.array_equal(shingles("Blood pressure, LOWERED today.", 3), shingles("blood pressure lowered today", 3))
+    assert shingles("", 3).size == 0
+    # Texts shorter than a shingle form a single shingle
+    assert shingles("two words", 5).size == 1
+
+def test_signatures_estimate_jaccard_similarity():
+    index = MinHashLSH(num_perm=128, bands=16, threshold=0.8)
+    same = index.signature(shingles(PASSAGE, 5))
+    assert np.array_equal(same, index.signature(shingles(PASSAGE.upper(), 5)))
+    other = index.signature(shingles(UNRELATED, 5))
+    assert np.mean(same == other) < 0.2
+
+def test_near_duplicates_are_found_and_unrelated_text_is_not():
+    index = MinHashLSH(num_perm=64, bands=8, threshold=0.8)
+    index.add("kept", index.signature(shingles(PASSAGE, 5)))
+    near_copy = PASSAGE.replace("expected adverse effects", "expected adverse effects.")
+    assert index.query(index.signature(shingles(near_copy, 5))) == "kept"
+    assert index.query(index.signature(shingles(UNRELATED, 5))) is None
+
+def test_dedup_chunks_keeps_the_first_copy_and_records_its_sources():
+    chunks = [
+        (PASSAGE, "a.json", {}),
+        (UNRELATED, "a.json", {}),
+        (PASSAGE + " ", "copies/a.json", {}),
+        (PASSAGE, "b.json", {})
+    ]
+    attributions = {}
+    kept = list(dedup_chunks(chunks, attributions))
+    assert [(text, source) for text, source, _ in kept] == [(PASSAGE, "a.json"), (UNRELATED, "a.json")]
+    assert attributions == {chunk_id("a.json", PASSAGE): ["a.json", "copies/a.json", "b.json"]}
+    assert duplicate_sources(attributions) == {"copies/a.json": ["a.json"], "b.json": ["a.json"]}
@@ -0,0 +1,58 @@
+import hashlib
+import pytest
+from src.utils import embeddings, retrieval
+from src.utils.embeddings import store_embeddings
+from src.utils.lexical import reset_lexical_indexes
+from src.utils.retrieval import hybrid_query, is_exact_term_query, reciprocal_rank_fusion
+
+DOCUMENTS = {
+    "chlorthalidone.json": "Chlorthalidone 12.5 mg once daily is a usual starting dose.",
+    "amlodipine.json": "Amlodipine 5 mg once daily lowers blood pressure.",
+    "lifestyle.json": "Weight loss and salt restriction lower blood pressure.",
+    "thiazides.json": "Thiazide diuretics are first-line agents for hypertension."
+}
+
+def fake_vector(text):
+    return [byte / 255.0 for byte in hashlib.sha256(text.encode("utf-8")).digest()[:8]]
+
+@pytest.fixture
+def collection(tmp_path, monkeypatch):
+    embedded = []
+
+    def fake_embed_texts(texts, model=None):
+        embedded.append(list(texts))
+        return [fake_vector(text) for text in texts]
+
+    monkeypatch.setattr(embeddings, "embed_texts", fake_embed_texts)
+    monkeypatch.setattr(retrieval, "embed_texts", fake_embed_texts)
+    collection = store_embeddings(list(DOCUMENTS.values()), list(DOCUMENTS), db_path=str(tmp_path), collection_name="chunks")
+    embedded.clear()
+    yield collection, embedded
+    reset_lexical_indexes()
+
+def test_rank_fusion_favours_ids_ranked_by_both_retrievers():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=60)
+    assert fused == ["a", "c", "b"]
+
+def test_rank_fusion_keeps_ids_found_by_one_retriever():
+    assert reciprocal_rank_fusion([["a"], []]) == ["a"]
+    assert reciprocal_rank_fusion([[], ["b", "a"]]) == ["b", "a"]
+
+def test_exact_term_queries_are_numbers_and_quoted_phrases():
+    assert is_exact_term_query("chlorthalidone 12.5 mg")
+    assert is_exact_term_query('"first-line"')
+    assert not is_exact_term_query("thiazide diuretics")
+
+def test_exact_term_query_with_enough_lexical_hits_skips_the_embedding(collection):
+    collection, embedded = collection
+    results = hybrid_query(collection, ["chlorthalidone 12.5 mg"], 1, mode="hybrid")
+    assert embedded == []
+    assert results["metadatas"][0][0]["source"] == "chlorthalidone.json"
+
+def test_free_text_query_is_embedded_and_fused(collection):
+    collection, embedded = collection
+    results = hybrid_query(collection, ["thiazide diuretics"], 2, mode="hybrid")
+    assert embedded == [["thiazide diuretics"]]
+    assert len(results["ids"][0]) == 2
+    # The only BM25 match also gets a vector rank, so fusion puts it first
+    assert results["metadatas"][0][0]["source"] == "thiazides.json"